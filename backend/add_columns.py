@@ -43,7 +43,8 @@ required_columns = {
     'dairy_free': 'BOOLEAN DEFAULT 0',
     'nut_free': 'BOOLEAN DEFAULT 0',
     'spicy_level': 'INTEGER DEFAULT 0',
-    'image_url': 'TEXT'
+    'image_url': 'TEXT',
+    'preference_signature': 'VARCHAR'
 }
 
 # Add any missing columns
@@ -53,6 +54,38 @@ for column, type_def in required_columns.items():
         if not add_column(cursor, 'recipes', column, type_def):
             success = False
 
+# Shared AI recipes are looked up by preference signature
+cursor.execute('CREATE INDEX IF NOT EXISTS ix_recipes_preference_signature ON recipes (preference_signature)')
+
+# Columns added to user_preferences after the initial schema
+cursor.execute('PRAGMA table_info(user_preferences);')
+existing_preference_columns = [col[1] for col in cursor.fetchall()]
+
+required_preference_columns = {
+    'profile_version': 'INTEGER NOT NULL DEFAULT 1',
+    'feed_generation': 'INTEGER NOT NULL DEFAULT 0'
+}
+
+for column, type_def in required_preference_columns.items():
+    if column not in existing_preference_columns:
+        if not add_column(cursor, 'user_preferences', column, type_def):
+            success = False
+
+# Columns added to user_recipe_assignments after the initial schema
+cursor.execute('PRAGMA table_info(user_recipe_assignments);')
+existing_assignment_columns = [col[1] for col in cursor.fetchall()]
+
+required_assignment_columns = {
+    'generation': 'INTEGER NOT NULL DEFAULT 0'
+}
+
+# The table itself is created by create_tables.py
+if existing_assignment_columns:
+    for column, type_def in required_assignment_columns.items():
+        if column not in existing_assignment_columns:
+            if not add_column(cursor, 'user_recipe_assignments', column, type_def):
+                success = False
+
 # Commit changes and close
 if success:
     conn.commit()
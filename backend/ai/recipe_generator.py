@@ -6,12 +6,14 @@ import httpx
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
 from backend.schemas.recipe import RecipeBrief, RecipeInDB, RecipeGenerationRequest
+from utils.circuit_breaker import retry_if_budget_allows
+from utils.deadline import retry_if_deadline_allows
+from utils.llm_client import chat_completion, completion_text
 
 logger = logging.getLogger(__name__)
 
 # OpenAI API credentials
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
 
 class RecipeGenerator:
     def __init__(self, api_key: Optional[str] = None):
@@ -19,8 +21,11 @@ class RecipeGenerator:
         if not self.api_key:
             logger.warning("No OpenAI API key provided, recipe generation will fail")
     
+    # Retries also draw on the shared LLM retry budget, so they stop once the
+    # provider is struggling instead of multiplying its load, and they stop once
+    # the request's deadline leaves no time for another attempt
     @retry(
-        retry=retry_if_exception_type((httpx.HTTPError, json.JSONDecodeError)),
+        retry=retry_if_exception_type((httpx.HTTPError, json.JSONDecodeError)) & retry_if_deadline_allows() & retry_if_budget_allows(),
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=2, max=10)
     )
@@ -34,29 +39,21 @@ class RecipeGenerator:
             # Construct the prompt for recipe generation
             prompt = self._build_recipe_prompt(request)
             
-            # Make API call to OpenAI
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}"
-            }
-            
-            payload = {
-                "model": "gpt-4-turbo", # Can be configured based on needs
-                "messages": [
+            # Make API call to OpenAI through the shared connection pool
+            response_data = await chat_completion(
+                model="gpt-4-turbo", # Can be configured based on needs
+                messages=[
                     {"role": "system", "content": "You are a professional chef and culinary expert who creates delicious recipes."},
                     {"role": "user", "content": prompt}
                 ],
-                "temperature": 0.7,
-                "max_tokens": 1500
-            }
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.post(OPENAI_API_URL, json=payload, headers=headers, timeout=60.0)
-                response.raise_for_status()
-                response_data = response.json()
+                max_tokens=1500,
+                temperature=0.7,
+                timeout=60.0,
+                api_key=self.api_key
+            )
             
             # Extract and process the recipe from the response
-            recipe_text = response_data['choices'][0]['message']['content']
+            recipe_text = completion_text(response_data)
             parsed_recipe = self._parse_recipe(recipe_text, request)
             
             if not parsed_recipe:
@@ -1,6 +1,7 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import sys
+import asyncio
 import os
 
 # Add the project root to the Python path
@@ -9,10 +10,34 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # Import routes
 from routes import auth, users, preferences, recommendations
 
+from utils.explore_cache import explore_cache
+from utils.http_client import start_http_client, close_http_client
+from utils.llm_cache import llm_cache
+from utils.metrics import collect_stats
+from utils.recipe_inventory import recipe_inventory
+from utils.job_queue import JobWorker
+from utils.generation_progress import generation_progress
+from utils.deadline import DeadlineMiddleware
+from utils.auth import require_metrics_access
+
 # Import models to ensure they are registered with SQLAlchemy
 from models.user import User
 from models.recipe import Recipe
 from models.preference import UserPreference
+from models.inventory import InventoryRecipe
+from models.assignment import UserRecipeAssignment
+from models.generation_job import GenerationJob
+from models.generation_status import GenerationStatus
+
+# Run queued recipe generation jobs in the API process. Set to false when
+# standalone workers (python -m worker) run them, so the API only enqueues.
+# The process that runs the jobs also owns the recipe inventory refills:
+# onboarding demand is only seen where jobs take from the inventory.
+GENERATION_WORKER_IN_PROCESS = os.getenv("GENERATION_WORKER_IN_PROCESS", "true").lower() == "true"
+GENERATION_WORKER_CONCURRENCY = int(os.getenv("GENERATION_WORKER_CONCURRENCY", "4"))
+# Seconds running jobs get to finish on shutdown before they are left to be retried
+GENERATION_WORKER_DRAIN_SECONDS = float(os.getenv("GENERATION_WORKER_DRAIN_SECONDS", "20"))
+generation_worker = JobWorker(preferences.run_generation_job, concurrency=GENERATION_WORKER_CONCURRENCY)
 
 app = FastAPI(title="CulinaryAI API", description="API for culinary recommendations")
 
@@ -25,6 +50,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Give every request a deadline (X-Request-Deadline or the default) that LLM
+# calls, retries and database statements size their timeouts from
+app.add_middleware(DeadlineMiddleware)
+
+@app.on_event("startup")
+async def startup():
+    # One pooled HTTP client shared by every outbound LLM call
+    await start_http_client()
+    # Restore the semantic explore cache from the previous run
+    explore_cache.load()
+    # Drop LLM responses that expired while the app was down
+    await asyncio.to_thread(llm_cache.purge_expired)
+    # Run queued recipe generation jobs, including ones left over from before a restart,
+    # and keep the warm recipe inventory they take from topped up
+    if GENERATION_WORKER_IN_PROCESS:
+        recipe_inventory.start()
+        generation_worker.start()
+    # Push progress of generations running in standalone workers to this process's clients
+    generation_progress.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await generation_worker.stop(drain_timeout=GENERATION_WORKER_DRAIN_SECONDS)
+    await generation_progress.stop()
+    await recipe_inventory.stop()
+    await explore_cache.close()
+    llm_cache.close()
+    await close_http_client()
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(users.router)
@@ -37,6 +91,11 @@ async def get_recipes_root(*args, **kwargs):
     """Proxy for /recommendations/recipes"""
     return await recommendations.get_recipes(*args, **kwargs)
 
+@app.get("/metrics", dependencies=[Depends(require_metrics_access)])
+async def get_metrics():
+    """Runtime statistics for caches and background machinery"""
+    return collect_stats()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to CulinaryAI API"} 
\ No newline at end of file
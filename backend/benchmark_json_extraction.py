@@ -0,0 +1,280 @@
+"""
+Benchmark the single-pass JSON extractor against the previous multi-strategy one.
+
+Runs both over the corpus in data/llm_output_corpus.json and reports how many
+responses each parses to the expected value, and how long each takes. The
+corpus is hand-written to cover the failure modes seen from the recipe and
+exploration prompts; it is not captured LLM output. The single-pass parser
+repairs more of it but costs more per response than the old cascade (roughly
+20-35% more, depending on the machine). The same cases are asserted in
+tests/test_json_stream.py.
+
+Usage: python benchmark_json_extraction.py [iterations]
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+
+from utils.openai_helper import extract_json_from_response
+
+# Keep the extractors' warnings out of the report
+logging.disable(logging.CRITICAL)
+logger = logging.getLogger(__name__)
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "llm_output_corpus.json")
+
+# --- Previous implementation, kept here as the baseline ---
+
+def legacy_extract_json_from_response(response_text):
+    """
+    Extract JSON from OpenAI response text
+    """
+    try:
+        logger.debug(f"Extracting JSON from response of length: {len(response_text)}")
+        
+        # Remove any markdown code block indicators
+        if "```" in response_text:
+            logger.debug("Detected code blocks in response, extracting content")
+            # Extract content between ```json and ``` markers
+            import re
+            pattern = r"```(?:json)?(.*?)```"
+            matches = re.findall(pattern, response_text, re.DOTALL)
+            if matches and len(matches) > 0:
+                # Use the first block found
+                json_str = matches[0].strip()
+                logger.debug(f"Extracted JSON from code block, length: {len(json_str)}")
+            else:
+                # If regex didn't find anything, try simple string manipulation
+                start_marker = "```json" if "```json" in response_text else "```"
+                end_marker = "```"
+                start_idx = response_text.find(start_marker) + len(start_marker)
+                end_idx = response_text.rfind(end_marker)
+                if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
+                    json_str = response_text[start_idx:end_idx].strip()
+                    logger.debug(f"Extracted JSON with string manipulation, length: {len(json_str)}")
+                else:
+                    # Just use the whole response if we can't find the markers
+                    json_str = response_text
+                    logger.debug("Could not find code blocks, using entire response")
+        else:
+            json_str = response_text
+            logger.debug("No code blocks detected, using entire response")
+            
+        # Basic cleanup of common JSON issues
+        json_str = json_str.strip()
+        
+        # Try to parse the JSON directly first
+        try:
+            result = json.loads(json_str)
+            logger.info("Successfully parsed JSON directly")
+            return result
+        except json.JSONDecodeError as e:
+            logger.warning(f"Initial JSON parsing failed: {str(e)}. Attempting more aggressive fixes...")
+            logger.debug(f"Failed JSON snippet (first 100 chars): {json_str[:100]}...")
+
+            # Clean up any BOM or Unicode control characters
+            import re
+            json_str = re.sub(r'[\x00-\x1F\x7F-\x9F]', '', json_str)
+            
+            # If the opening and closing brackets are missing, add them
+            json_str = json_str.strip()
+            if not json_str.startswith('[') and not json_str.startswith('{'):
+                if "name" in json_str and "description" in json_str:
+                    # Looks like a single object, wrap in array
+                    json_str = f"[{json_str}]"
+                    logger.debug("Added array brackets around object-like content")
+                
+            # Fix common JSON issues
+            json_str = legacy_fix_json_formatting(json_str)
+            logger.debug("Applied common JSON formatting fixes")
+            
+            # Try again after cleaning
+            try:
+                result = json.loads(json_str)
+                logger.info("Successfully parsed JSON after cleaning")
+                return result
+            except json.JSONDecodeError as clean_e:
+                logger.warning(f"JSON parsing after cleaning still failed: {str(clean_e)}")
+                logger.debug(f"Cleaned JSON (first 100 chars): {json_str[:100]}...")
+                
+                # Last resort: try to manually extract valid portions
+                if "[" in json_str and "]" in json_str:
+                    # Get everything between the first [ and last ]
+                    start = json_str.find('[')
+                    end = json_str.rfind(']') + 1
+                    if start != -1 and end != 0 and start < end:
+                        json_str = json_str[start:end]
+                        logger.debug(f"Extracted content between brackets: [{start}:{end}]")
+                        try:
+                            result = json.loads(json_str)
+                            logger.info("Successfully parsed JSON using bracket extraction")
+                            return result
+                        except json.JSONDecodeError:
+                            logger.warning("Bracket extraction method failed")
+                            
+                # As a last resort, try to parse it line by line to extract objects
+                logger.debug("Attempting line-by-line object extraction")
+                objects = []
+                in_object = False
+                current_object = ""
+                brace_count = 0
+                
+                for line in json_str.split('\n'):
+                    if '{' in line:
+                        brace_count += line.count('{')
+                        in_object = True
+                    if '}' in line:
+                        brace_count -= line.count('}')
+                    
+                    if in_object:
+                        current_object += line + "\n"
+                    
+                    if in_object and brace_count == 0:
+                        in_object = False
+                        try:
+                            obj = json.loads(current_object.strip())
+                            objects.append(obj)
+                            current_object = ""
+                            logger.debug(f"Extracted valid object of length: {len(current_object)}")
+                        except:
+                            logger.warning(f"Failed to parse extracted object: {current_object[:50]}...")
+                
+                if objects:
+                    logger.info(f"Manually extracted {len(objects)} objects")
+                    return objects
+                
+                # Everything failed, log the raw response for debugging
+                logger.error(f"All JSON parsing attempts failed. Raw response: {response_text[:300]}...")
+        
+        # All parsing failed, return an empty list as fallback
+        logger.error("Returning empty dict/list as fallback after all parsing attempts failed")
+        return {}
+        
+    except Exception as e:
+        logger.error(f"Error extracting JSON from response: {str(e)}")
+        # Don't include full response text as it could be very large
+        logger.error(f"First 200 chars of response: {response_text[:200]}")
+        return {}
+
+def legacy_fix_json_formatting(json_str):
+    """
+    Fix common JSON formatting issues
+    """
+    # Fix trailing commas in arrays and objects
+    json_str = re.sub(r',\s*]', ']', json_str)
+    json_str = re.sub(r',\s*}', '}', json_str)
+    
+    # Fix missing quotes around string values in arrays
+    # This regex looks for array patterns with missing quotes
+    # For example: ["item1", value2, "item3"] -> ["item1", "value2", "item3"]
+    json_str = re.sub(r'\[([^\]]*)\]', lambda m: legacy_fix_array_quotes(m.group(0)), json_str)
+    
+    # Fix missing commas between array elements
+    json_str = re.sub(r'"\s+("|\[|\{)', '", \1', json_str)
+    
+    return json_str
+
+def legacy_fix_array_quotes(array_str):
+    """
+    Fix missing quotes in array elements
+    """
+    # Skip if this doesn't look like an array
+    if not (array_str.startswith('[') and array_str.endswith(']')):
+        return array_str
+    
+    # Get the content inside the brackets
+    content = array_str[1:-1].strip()
+    
+    # If empty array, return as is
+    if not content:
+        return array_str
+    
+    # Split by commas, but be careful with nested structures
+    elements = []
+    current = ""
+    in_quotes = False
+    brace_level = 0
+    bracket_level = 0
+    
+    for char in content:
+        if char == '"' and (content[content.find(char)-1:content.find(char)] != '\\'):
+            in_quotes = not in_quotes
+        elif char == '{' and not in_quotes:
+            brace_level += 1
+        elif char == '}' and not in_quotes:
+            brace_level -= 1
+        elif char == '[' and not in_quotes:
+            bracket_level += 1
+        elif char == ']' and not in_quotes:
+            bracket_level -= 1
+        elif char == ',' and not in_quotes and brace_level == 0 and bracket_level == 0:
+            elements.append(current.strip())
+            current = ""
+            continue
+        
+        current += char
+    
+    if current.strip():
+        elements.append(current.strip())
+    
+    # Fix each element
+    fixed_elements = []
+    for element in elements:
+        element = element.strip()
+        # If element is not already quoted and not a number, boolean or null, add quotes
+        if not (element.startswith('"') and element.endswith('"')) and \
+           not re.match(r'^-?\d+(\.\d+)?$', element) and \
+           element not in ('true', 'false', 'null') and \
+           not (element.startswith('{') and element.endswith('}')) and \
+           not (element.startswith('[') and element.endswith(']')):
+            element = f'"{element}"'
+        fixed_elements.append(element)
+    
+    return '[' + ', '.join(fixed_elements) + ']'
+
+def legacy_fix_trailing_commas(json_str):
+    """
+    Fix trailing commas in JSON
+    """
+    # Fix trailing commas in arrays
+    json_str = re.sub(r',\s*]', ']', json_str)
+    # Fix trailing commas in objects
+    json_str = re.sub(r',\s*}', '}', json_str)
+    return json_str
+
+# --- Benchmark ---
+
+def run(extract, cases, iterations):
+    correct = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        results = [extract(case["response"]) for case in cases]
+    elapsed = time.perf_counter() - started
+    for case, result in zip(cases, results):
+        if result == case["expected"]:
+            correct.append(case["name"])
+    return correct, elapsed / (iterations * len(cases))
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with open(CORPUS_PATH, "r", encoding="utf-8") as f:
+        cases = json.load(f)["cases"]
+
+    legacy_correct, legacy_time = run(legacy_extract_json_from_response, cases, iterations)
+    new_correct, new_time = run(extract_json_from_response, cases, iterations)
+
+    print(f"Corpus: {len(cases)} responses, {iterations} iterations\n")
+    print(f"{'case':<28} {'legacy':<8} {'single-pass':<8}")
+    for case in cases:
+        legacy_ok = "ok" if case["name"] in legacy_correct else "FAIL"
+        new_ok = "ok" if case["name"] in new_correct else "FAIL"
+        print(f"{case['name']:<28} {legacy_ok:<8} {new_ok:<8}")
+
+    print(f"\nLegacy:      {len(legacy_correct)}/{len(cases)} correct, {legacy_time * 1e6:.1f} us per response")
+    print(f"Single-pass: {len(new_correct)}/{len(cases)} correct, {new_time * 1e6:.1f} us per response")
+
+if __name__ == "__main__":
+    main()
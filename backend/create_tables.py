@@ -7,6 +7,10 @@ from database.database import Base, engine
 from models.user import User  
 from models.recipe import Recipe
 from models.preference import UserPreference
+from models.inventory import InventoryRecipe
+from models.assignment import UserRecipeAssignment
+from models.generation_job import GenerationJob
+from models.generation_status import GenerationStatus
 
 def create_tables():
     # Create tables
@@ -4,6 +4,8 @@ from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
 
+from utils.deadline import install_statement_deadlines
+
 # Load environment variables
 load_dotenv()
 
@@ -17,6 +19,9 @@ if DATABASE_URL.startswith("sqlite"):
 else:
     engine = create_engine(DATABASE_URL)
 
+# Statements run for a request time out with the request's deadline
+install_statement_deadlines(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -0,0 +1,319 @@
+"""
+OpenAI-compatible mock of the chat completions API for local load testing.
+
+Serves recipe, recipe batch and cuisine exploration JSON built by the local
+fallback generators, so the app can be exercised end to end without spending
+money or hitting rate limits. Latency, errors, 429 throttling, truncated and
+malformed output are all configurable, from the command line, from MOCK_LLM_*
+environment variables, or at runtime through PUT /mock/config.
+
+Latency specs:
+    fixed:0.5               always 0.5 s
+    uniform:0.2,1.5         uniform between 0.2 and 1.5 s
+    normal:1.0,0.3          normal with mean 1.0 and std 0.3 (clamped at 0)
+    lognormal:0.0,0.5       exp(normal(mu, sigma)), a long right tail
+    exponential:0.8         exponential with mean 0.8
+
+Usage:
+    python mock_llm_server.py --port 8100 --latency lognormal:0.0,0.5 --error-rate 0.05
+    OPENAI_API_BASE=http://localhost:8100/v1 uvicorn app.main:app
+
+Both utils/openai_helper.py and ai/recipe_generator.py send their requests to
+OPENAI_API_BASE through utils/llm_client.py, so that one setting points all
+generation at the mock.
+"""
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from typing import Any, Callable, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from utils.openai_helper import generate_fallback_recipe, generate_fallback_recommendations
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rough characters per token for usage figures and max_tokens truncation
+CHARS_PER_TOKEN = 4
+# Characters per streamed chunk
+STREAM_CHUNK_CHARS = 4
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Build a sampler from a latency spec such as "lognormal:0.0,0.5"
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v.strip()]
+    kind = kind.strip().lower()
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(random.gauss(values[0], values[1]), 0.0)
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(values[0], values[1])
+    if kind == "exponential":
+        return lambda: random.expovariate(1.0 / values[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+class MockConfig:
+    """
+    Behaviour of the mock; every field can be changed while it runs
+    """
+    FIELDS = {
+        "latency": str,
+        "token_latency": str,
+        "error_rate": float,
+        "throttle_rate": float,
+        "rpm": int,
+        "truncate_rate": float,
+        "malformed_rate": float
+    }
+
+    def __init__(self):
+        # Time to the full response (or to the first streamed chunk)
+        self.latency = os.getenv("MOCK_LLM_LATENCY", "lognormal:0.0,0.5")
+        # Delay between streamed chunks
+        self.token_latency = os.getenv("MOCK_LLM_TOKEN_LATENCY", "fixed:0.01")
+        # Share of requests answered with a 5xx error
+        self.error_rate = float(os.getenv("MOCK_LLM_ERROR_RATE", "0"))
+        # Share of requests answered with 429, on top of the rpm limit
+        self.throttle_rate = float(os.getenv("MOCK_LLM_THROTTLE_RATE", "0"))
+        # Requests per minute before 429s; 0 disables the limit
+        self.rpm = int(os.getenv("MOCK_LLM_RPM", "0"))
+        # Share of responses cut short with finish_reason "length"
+        self.truncate_rate = float(os.getenv("MOCK_LLM_TRUNCATE_RATE", "0"))
+        # Share of responses with broken JSON (trailing commas, prose, fences, ...)
+        self.malformed_rate = float(os.getenv("MOCK_LLM_MALFORMED_RATE", "0"))
+        self._compile()
+
+    def _compile(self):
+        self.sample_latency = parse_latency(self.latency)
+        self.sample_token_latency = parse_latency(self.token_latency)
+
+    def update(self, values: Dict[str, Any]):
+        for name, value in values.items():
+            if name in self.FIELDS:
+                setattr(self, name, self.FIELDS[name](value))
+        self._compile()
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+config = MockConfig()
+stats: Dict[str, int] = {
+    "requests": 0,
+    "streamed": 0,
+    "errors": 0,
+    "throttled": 0,
+    "truncated": 0,
+    "malformed": 0
+}
+_window_start = time.monotonic()
+_window_count = 0
+
+app = FastAPI(title="Mock LLM")
+
+# --- Content ---
+
+def _match(pattern: str, text: str, default: Optional[str] = None) -> Optional[str]:
+    match = re.search(pattern, text, re.IGNORECASE)
+    return match.group(1).strip() if match else default
+
+def build_content(messages: List[Dict[str, str]]) -> str:
+    """
+    Answer a prompt from the app with JSON from the local fallback generators
+    """
+    system = " ".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+    prompt = " ".join(m.get("content") or "" for m in messages if m.get("role") == "user")
+
+    # Cuisine exploration
+    if "cuisine recommendations" in system.lower() or "cuisine recommendations" in prompt.lower():
+        query = _match(r'similar to "(.*?)"', prompt, "food")
+        limit = int(_match(r"exactly (\d+)", prompt, "5"))
+        return json.dumps(generate_fallback_recommendations(query, limit), indent=2)
+
+    # Batched recipes, one per slot
+    slots = re.findall(r"Slot (\d+): cuisine (.+?), meal type (\w+)", prompt)
+    if slots:
+        recipes = []
+        for index, cuisine, meal_type in slots:
+            recipe = generate_fallback_recipe([] if cuisine == "any" else [cuisine], meal_type)
+            recipes.append({"slot": int(index), **recipe})
+        return json.dumps(recipes, indent=2)
+
+    # Single recipe (openai_helper and RecipeGenerator prompts)
+    cuisines = _match(r"CUISINE PREFERENCES \(VERY IMPORTANT\): (.+)", prompt) or _match(r"cuisine type: ([^;.]+)", prompt)
+    meal_type = _match(r"meal type: (\w+)", prompt, "dinner")
+    recipe = generate_fallback_recipe([c.strip() for c in cuisines.split(",")] if cuisines else [], meal_type)
+    return json.dumps(recipe, indent=2)
+
+def malform(content: str) -> str:
+    """
+    Break the JSON the way LLMs tend to
+    """
+    mutation = random.choice(["trailing_commas", "unquoted_items", "prose", "fence", "single_quotes"])
+    if mutation == "trailing_commas":
+        return re.sub(r'"\n(\s*)([\]}])', r'",\n\1\2', content)
+    if mutation == "unquoted_items":
+        return re.sub(r'(\[\s*)"([^"\n]+)"', r"\1\2", content)
+    if mutation == "prose":
+        return f"Sure! Here is what you asked for:\n\n{content}\n\nLet me know if you want any changes."
+    if mutation == "fence":
+        return f"```json\n{content}\n```"
+    return content.replace('"', "'")
+
+def truncate(content: str) -> str:
+    return content[:int(len(content) * random.uniform(0.3, 0.9))]
+
+# --- Failure injection ---
+
+def _error_response(status_code: int, message: str, error_type: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"message": message, "type": error_type, "code": None}},
+        headers=headers
+    )
+
+def injected_failure() -> Optional[JSONResponse]:
+    global _window_start, _window_count
+    now = time.monotonic()
+    if now - _window_start >= 60:
+        _window_start, _window_count = now, 0
+    _window_count += 1
+
+    if (config.rpm and _window_count > config.rpm) or random.random() < config.throttle_rate:
+        stats["throttled"] += 1
+        retry_after = max(int(60 - (now - _window_start)), 1) if config.rpm else 1
+        return _error_response(429, "Rate limit reached for requests", "requests", {"Retry-After": str(retry_after)})
+    if random.random() < config.error_rate:
+        stats["errors"] += 1
+        status_code = random.choice([500, 502, 503])
+        return _error_response(status_code, "The server had an error while processing your request", "server_error")
+    return None
+
+# --- API ---
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    messages = body.get("messages", [])
+    model = body.get("model", "mock")
+    max_tokens = int(body.get("max_tokens") or 1500)
+
+    failure = injected_failure()
+    await asyncio.sleep(config.sample_latency())
+    if failure is not None:
+        return failure
+
+    content = build_content(messages)
+    finish_reason = "stop"
+    if random.random() < config.malformed_rate:
+        stats["malformed"] += 1
+        content = malform(content)
+    if random.random() < config.truncate_rate:
+        content = truncate(content)
+        finish_reason = "length"
+    if len(content) > max_tokens * CHARS_PER_TOKEN:
+        content = content[:max_tokens * CHARS_PER_TOKEN]
+        finish_reason = "length"
+    if finish_reason == "length":
+        stats["truncated"] += 1
+
+    completion_id = f"chatcmpl-mock-{stats['requests']}"
+    created = int(time.time())
+
+    if body.get("stream"):
+        stats["streamed"] += 1
+
+        async def events():
+            for i in range(0, len(content), STREAM_CHUNK_CHARS):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": content[i:i + STREAM_CHUNK_CHARS]}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(config.sample_token_latency())
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    prompt_tokens = sum(len(m.get("content") or "") for m in messages) // CHARS_PER_TOKEN
+    completion_tokens = len(content) // CHARS_PER_TOKEN
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+@app.get("/mock/config")
+async def get_config():
+    return config.as_dict()
+
+@app.put("/mock/config")
+async def update_config(request: Request):
+    try:
+        config.update(await request.json())
+    except (ValueError, IndexError) as e:
+        return _error_response(400, str(e), "invalid_request_error")
+    logger.info(f"Mock LLM config updated: {config.as_dict()}")
+    return config.as_dict()
+
+@app.get("/mock/stats")
+async def get_stats():
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server")
+    parser.add_argument("--host", default=os.getenv("MOCK_LLM_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MOCK_LLM_PORT", "8100")))
+    parser.add_argument("--latency", help="latency distribution of a response, e.g. lognormal:0.0,0.5")
+    parser.add_argument("--token-latency", help="delay between streamed chunks, e.g. fixed:0.01")
+    parser.add_argument("--error-rate", type=float, help="share of requests failing with 5xx")
+    parser.add_argument("--throttle-rate", type=float, help="share of requests failing with 429")
+    parser.add_argument("--rpm", type=int, help="requests per minute before 429s (0 = unlimited)")
+    parser.add_argument("--truncate-rate", type=float, help="share of responses cut short")
+    parser.add_argument("--malformed-rate", type=float, help="share of responses with broken JSON")
+    parser.add_argument("--seed", type=int, default=os.getenv("MOCK_LLM_SEED"), help="random seed for repeatable runs")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(int(args.seed))
+    config.update({
+        name: getattr(args, name)
+        for name in MockConfig.FIELDS
+        if getattr(args, name) is not None
+    })
+    logger.info(f"Starting mock LLM on {args.host}:{args.port} with {config.as_dict()}")
+    uvicorn.run(app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -5,4 +5,8 @@ Models for the CulinaryAI application
 # Import all models here to ensure they are registered with SQLAlchemy
 from .user import User
 from .preference import UserPreference
-from .recipe import Recipe 
\ No newline at end of file
+from .recipe import Recipe 
+from .inventory import InventoryRecipe
+from .assignment import UserRecipeAssignment
+from .generation_job import GenerationJob
+from .generation_status import GenerationStatus
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, Boolean, DateTime, ForeignKey, UniqueConstraint, func
+
+from database.database import Base
+
+class UserRecipeAssignment(Base):
+    """
+    A shared AI recipe placed in a user's feed
+    """
+    __tablename__ = "user_recipe_assignments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    recipe_id = Column(Integer, ForeignKey("recipes.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    # Feed generation the assignment belongs to; the feed shows the generation
+    # user_preferences.feed_generation points at
+    generation = Column(Integer, default=0, nullable=False)
+
+    # Inactive assignments are from superseded generations; they are kept so the
+    # same shared recipe is not handed to the user again
+    active = Column(Boolean, default=True, nullable=False)
+    assigned_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "recipe_id", name="uq_user_recipe_assignment"),
+    )
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, text
+
+from database.database import Base
+import json
+
+class GenerationJob(Base):
+    """
+    A durable request to (re)generate a user's AI recipe feed
+    """
+    __tablename__ = "generation_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    preferences_id = Column(Integer, nullable=False)
+    count = Column(Integer, nullable=False, default=6)
+    previous_preferences = Column(Text, nullable=True)  # JSON snapshot; null for a full regeneration
+
+    # pending -> running -> succeeded / failed; failed attempts go back to pending until max_attempts
+    state = Column(String, nullable=False, default="pending", index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text, nullable=True)
+
+    # Lease held by the worker running the job, extended by its heartbeats
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # At most one pending job per user; new requests are merged into it
+        Index(
+            "uq_generation_jobs_pending_user", "user_id", unique=True,
+            postgresql_where=text("state = 'pending'"),
+            sqlite_where=text("state = 'pending'")
+        ),
+        Index("ix_generation_jobs_claim", "state", "run_after"),
+    )
+
+    @property
+    def previous_preferences_data(self):
+        try:
+            return json.loads(self.previous_preferences) if self.previous_preferences else None
+        except json.JSONDecodeError:
+            return None
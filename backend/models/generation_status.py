@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+
+from database.database import Base
+
+class GenerationStatus(Base):
+    """
+    Progress of a user's latest recipe feed generation, one row per user
+    """
+    __tablename__ = "generation_status"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+
+    # idle, queued, running, complete or failed
+    state = Column(String, nullable=False, default="idle")
+    # Recipes the latest run set out to add, how many it added and how many it could not
+    target = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    # Recipes in the visible feed, kept current so status reads need no COUNT(*)
+    recipes_count = Column(Integer, nullable=False, default=0)
+
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
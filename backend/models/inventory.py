@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index
+
+from database.database import Base
+import json
+
+class InventoryRecipe(Base):
+    """
+    A ready-made recipe waiting in the warm inventory for a user of its bucket
+    """
+    __tablename__ = "recipe_inventory"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Preference bucket the recipe was generated for
+    cuisine = Column(String, nullable=False, default="")  # "" when any cuisine fits
+    meal_type = Column(String, nullable=False)
+    dietary_signature = Column(String, nullable=False, default="|")  # Canonical restrictions|allergies
+    skill_level = Column(String, nullable=False)
+
+    title = Column(String, nullable=False)
+    total_time = Column(Integer, default=0)  # Total time in minutes, for the user's time limit
+    recipe = Column(Text, nullable=False)  # JSON string of the generated recipe
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        Index("ix_recipe_inventory_bucket", "cuisine", "meal_type", "dietary_signature", "skill_level"),
+    )
+
+    @property
+    def recipe_data(self):
+        try:
+            return json.loads(self.recipe) if self.recipe else {}
+        except json.JSONDecodeError:
+            return {}
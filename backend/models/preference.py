@@ -45,12 +45,21 @@ class UserPreference(Base):
     cooking_time_max = Column(Integer, default=60)  # Max cooking time in minutes
     additional_notes = Column(Text, nullable=True)
     
+    # Incremented on every preference write; caches derived from the
+    # preferences are keyed on it so no worker serves a stale profile
+    profile_version = Column(Integer, default=1, nullable=False)
+    
+    # Generation of AI recipe assignments the user's feed shows; a new batch
+    # becomes visible by moving this pointer
+    feed_generation = Column(Integer, default=0, nullable=False)
+    
     # Relationship with User model
     user = relationship("User", back_populates="preferences")
     
     def __init__(self, user_id, dietary_restrictions=None, favorite_cuisines=None, 
                 cooking_skill_level="beginner", health_goals=None, allergies=None):
         self.user_id = user_id
+        self.profile_version = 1
         
         if isinstance(dietary_restrictions, list):
             self.dietary_restrictions = ",".join(dietary_restrictions or [])
@@ -74,6 +83,13 @@ class UserPreference(Base):
         else:
             self.allergies = allergies or ""
         
+    def bump_profile_version(self):
+        """
+        Mark the preferences as changed for any cache derived from them.
+        The increment is done in SQL so concurrent writers never reuse a version.
+        """
+        self.profile_version = func.coalesce(UserPreference.profile_version, 0) + 1
+        
     # Property methods to convert between string and list
     @property
     def dietary_restrictions_list(self):
@@ -29,6 +29,8 @@ class Recipe(Base):
     # AI generation info
     is_ai_generated = Column(Boolean, default=False)
     generated_for_user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    # Set on shared AI recipes, which reach users through user_recipe_assignments
+    preference_signature = Column(String, index=True, nullable=True)
     
     # Relationship with User model
     user = relationship("User", back_populates="generated_recipes")
@@ -1,22 +1,33 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from pydantic import BaseModel
 import logging
 import asyncio
 import json
 import os
-from sqlalchemy import text
+from sqlalchemy import func, text
 
 from database.database import get_db, engine
 from models.user import User
 from models.preference import UserPreference
 from models.recipe import Recipe
+from models.generation_job import GenerationJob
 from schemas.preference import PreferenceCreate, PreferenceResponse
 from schemas.recipe import RecipeGenerationRequest
 from utils.auth import get_current_active_user
-from utils.openai_helper import generate_recipe
-from utils.state_manager import active_generation_tasks
+from utils.openai_helper import generate_recipe, generate_recipes_batch
+from utils.llm_scheduler import PRIORITY_ONBOARDING, llm_request_context
+from utils.job_queue import enqueue_generation, has_pending_job
+from utils.generation_progress import generation_progress
+from utils.generation_status import STATUS_RUNNING, record_recipe, set_status
+from utils.feed_reconciliation import preference_snapshot, reconcile_feed
+from utils.recipe_inventory import bucket_for, recipe_inventory
+from utils.recipe_pool import cooking_time_band, preference_signature, recipe_pool
+from utils.recipe_rows import build_recipe_row
+from utils.recommendation import invalidate_user_profile
+from utils.state_manager import active_generation_tasks, global_generation_semaphore
 
 logger = logging.getLogger(__name__)
 
@@ -25,21 +36,134 @@ router = APIRouter(prefix="/preferences", tags=["Preferences"])
 # Number of initial recipes to generate for a new user
 INITIAL_RECIPES_COUNT = 6
 
-async def generate_recipes_for_user(user_id: int, preferences_id: int, count: int = INITIAL_RECIPES_COUNT):
+# Concurrent LLM calls allowed for a single user's batch
+GENERATION_CONCURRENCY_PER_USER = int(os.getenv("GENERATION_CONCURRENCY_PER_USER", "6"))
+
+# Ask for the whole batch in one streamed LLM call before falling back to per-recipe calls
+RECIPE_BATCH_MODE = os.getenv("RECIPE_BATCH_MODE", "true").lower() == "true"
+
+# Recipes of a new feed generation that must be ready before it replaces the old feed
+FEED_SWAP_MIN_RECIPES = int(os.getenv("FEED_SWAP_MIN_RECIPES", "3"))
+
+# How many times a slot is re-asked when it comes back as a duplicate
+MAX_DUPLICATE_RETRIES = 1
+
+# Share of title words two recipes must have in common to count as near-duplicates
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+# Idle seconds before a generation progress stream sends a keepalive
+GENERATION_EVENTS_KEEPALIVE_SECONDS = float(os.getenv("GENERATION_EVENTS_KEEPALIVE_SECONDS", "15"))
+
+def _title_tokens(title: str) -> set:
+    """
+    Words of a recipe title, ignoring the variety prefixes/suffixes added after " - "
+    """
+    parts = [part for part in title.lower().split(" - ") if part.strip()]
+    # Keep the longest part, which is the dish itself
+    core = max(parts, key=len) if parts else ""
+    return {word.strip(".,!?'\"()") for word in core.split() if len(word) > 2}
+
+def is_near_duplicate_title(title: str, existing_titles) -> bool:
+    """
+    Check whether a title names essentially the same dish as one already generated
+    """
+    tokens = _title_tokens(title)
+    if not tokens:
+        return False
+    for existing in existing_titles:
+        existing_tokens = _title_tokens(existing)
+        if not existing_tokens:
+            continue
+        overlap = len(tokens & existing_tokens) / len(tokens | existing_tokens)
+        if overlap >= NEAR_DUPLICATE_THRESHOLD:
+            return True
+    return False
+
+def plan_feed_slots(preferences: Dict[str, Any], count: int) -> List[Tuple[Optional[str], str, int]]:
+    """
+    Plan one (cuisine, meal type, variation) slot per feed recipe. Repeated slots get
+    an increasing variation number so concurrent calls ask for different dishes.
+    """
+    cuisines = preferences["cuisines"]
+    meal_types = preferences["meal_types"]
+    slots = []
+    slot_counts = {}
+    for i in range(count):
+        cuisine = cuisines[i % len(cuisines)] if cuisines else None
+        meal_type = meal_types[i % len(meal_types)] if meal_types else "dinner"
+        variation = slot_counts.get((cuisine, meal_type), 0)
+        slot_counts[(cuisine, meal_type)] = variation + 1
+        slots.append((cuisine, meal_type, variation))
+    return slots
+
+def feed_slot_signature(preferences: Dict[str, Any], cuisine: Optional[str], meal_type: str) -> str:
+    """
+    Preference signature of the shared recipes that can fill a feed slot
+    """
+    return preference_signature(
+        cuisine, meal_type, preferences["dietary_restrictions"], preferences["allergies"],
+        preferences["skill_level"], cooking_time_band(preferences["max_cooking_time"])
+    )
+
+def store_feed_recipe(db: Session, user_id: int, recipe_data: Dict[str, Any], signature: str, generation: int) -> Recipe:
+    """
+    Store a generated recipe in the shared pool and assign it to a feed generation
+    of the user; the caller commits
+    """
+    # Shared rows belong to no user; the assignment puts them in this feed
+    db_recipe = build_recipe_row(recipe_data, None)
+    db_recipe.preference_signature = signature
+    db.add(db_recipe)
+    db.flush()
+    recipe_pool.assign(db, user_id, db_recipe, generation, created=True)
+    return db_recipe
+
+async def generate_recipes_for_user(
+    user_id: int,
+    preferences_id: int,
+    count: int = INITIAL_RECIPES_COUNT,
+    previous_preferences: Optional[Dict[str, Any]] = None
+):
     """
     Generate a specified number of recipes based on user preferences and store them in the database.
-    First deletes any existing AI-generated recipes for this user.
+    The new batch replaces the user's previous feed once enough of it is ready. When the
+    preferences before the change are given, the existing feed is reconciled instead and
+    only the recipes that no longer fit are replaced.
     Uses a dedicated database session for the background task.
+    LLM calls are scheduled as onboarding traffic, behind interactive requests.
+    """
+    with llm_request_context(priority=PRIORITY_ONBOARDING, user_id=user_id):
+        return await _generate_recipes_for_user(user_id, preferences_id, count, previous_preferences)
+
+async def run_generation_job(job: GenerationJob):
     """
+    Job queue handler for a queued feed generation
+    """
+    await generate_recipes_for_user(
+        job.user_id,
+        job.preferences_id,
+        job.count,
+        previous_preferences=job.previous_preferences_data
+    )
+
+async def _generate_recipes_for_user(
+    user_id: int,
+    preferences_id: int,
+    count: int,
+    previous_preferences: Optional[Dict[str, Any]]
+):
     logger.info(f"Starting background generation for user {user_id}, preferences {preferences_id}, count {count}")
     
-    # Check if there's already an active generation for this user
+    # An attempt whose lease expired can still be running in this process. Fail
+    # this one rather than report success for a batch that was never generated:
+    # the job queue retries it with a backoff, by when the old attempt is done.
     if user_id in active_generation_tasks:
-        logger.info(f"Generation already in progress for user {user_id}, skipping")
-        return
+        logger.info(f"Generation already in progress for user {user_id}, retrying later")
+        raise RuntimeError(f"Generation already in progress for user {user_id}")
     
     # Mark this user as having an active generation
     active_generation_tasks[user_id] = True
+    generated_recipes = []
     
     try:
         # Create a new database session specifically for this background task
@@ -62,45 +186,15 @@ async def generate_recipes_for_user(user_id: int, preferences_id: int, count: in
             
             logger.info(f"Generating {count} recipes for user {user_id}")
             
-            # First, delete all previous AI-generated recipes for this user
-            try:
-                # Use a direct SQL query for better performance
-                deletion_query = text(
-                    "DELETE FROM recipes WHERE generated_for_user_id = :user_id AND is_ai_generated = TRUE"
-                )
-                db.execute(deletion_query, {"user_id": user_id})
-                db.commit()
-                logger.info(f"Successfully deleted previous recipes for user {user_id}")
-            except Exception as e:
-                logger.error(f"Error deleting previous recipes: {str(e)}")
-                db.rollback()
-            
             # Extract user preferences
-            cuisines = user_preferences.favorite_cuisines_list
-            
-            # --- Corrected Dietary Restrictions Logic --- 
-            # Get restrictions directly from the stored list property
-            dietary_restrictions = user_preferences.dietary_restrictions_list
-            logger.debug(f"Extracted dietary restrictions from DB list: {dietary_restrictions}")
-            
-            # Add boolean flags as well, ensuring no duplicates 
-            # (though ideally, the list property should be the source of truth)
-            flags_to_add = set() 
-            if user_preferences.vegetarian: flags_to_add.add("vegetarian")
-            if user_preferences.vegan: flags_to_add.add("vegan")
-            if user_preferences.gluten_free: flags_to_add.add("gluten-free")
-            if user_preferences.dairy_free: flags_to_add.add("dairy-free")
-            if user_preferences.nut_free: flags_to_add.add("nut-free")
-            
-            # Combine the list from DB string and boolean flags
-            current_restrictions_set = set(dietary_restrictions)
-            combined_restrictions = list(current_restrictions_set.union(flags_to_add))
+            current_preferences = preference_snapshot(user_preferences)
+            # Restrictions from the stored list plus the boolean flags
+            combined_restrictions = current_preferences["dietary_restrictions"]
             logger.debug(f"Combined dietary restrictions (from list + flags): {combined_restrictions}")
-            # --- End Correction --- 
                 
             # Extract allergies and health goals separately
-            allergies = user_preferences.allergies_list
-            health_goals = user_preferences.health_goals_list
+            allergies = current_preferences["allergies"]
+            health_goals = current_preferences["health_goals"]
             
             # Create flavor preferences dictionary
             flavor_preferences = {
@@ -111,41 +205,85 @@ async def generate_recipes_for_user(user_id: int, preferences_id: int, count: in
                 "sour": user_preferences.sour_level
             }
             
-            # Determine meal types to focus on
-            meal_types = []
-            if user_preferences.breakfast:
-                meal_types.append("breakfast")
-            if user_preferences.lunch:
-                meal_types.append("lunch")
-            if user_preferences.dinner:
-                meal_types.append("dinner")
-            if user_preferences.snacks:
-                meal_types.append("snack")
-            if user_preferences.desserts:
-                meal_types.append("dessert")
-                
             # Set cooking skill level
-            skill_level = user_preferences.cooking_skill_level or "medium"
+            skill_level = current_preferences["skill_level"]
+            
+            # Set max cooking time, rounded down to its band so the recipes can be
+            # shared with every user in the band
+            max_cooking_time = cooking_time_band(current_preferences["max_cooking_time"])
             
-            # Set max cooking time
-            max_cooking_time = user_preferences.cooking_time_max or 60
+            def slot_signature(cuisine, meal_type):
+                return feed_slot_signature(current_preferences, cuisine, meal_type)
             
-            # Generate recipes one by one
-            generated_recipes = []
+            # One (cuisine, meal type, variation) slot per recipe
+            slots = plan_feed_slots(current_preferences, count)
             
             # Keep track of generated titles to avoid duplicates
-            generated_titles = set()
+            generated_titles = []
             
-            for i in range(count):
-                try:
-                    # Select a random cuisine and meal type if available
-                    cuisine = cuisines[i % len(cuisines)] if cuisines else None
-                    meal_type = meal_types[i % len(meal_types)] if meal_types else "dinner"
-                    
-                    logger.info(f"Generating recipe {i+1}/{count} - cuisine: {cuisine}, meal type: {meal_type}")
-                    
-                    # Generate recipe via OpenAI
-                    recipe_data = await generate_recipe(
+            # After a preference change, keep the feed recipes that still fit and
+            # only top up the slots left open
+            reconciled = None
+            if previous_preferences is not None:
+                reconciled = reconcile_feed(db, user_id, previous_preferences, current_preferences, slots)
+            
+            if reconciled is not None:
+                kept, slots = reconciled
+                generated_titles.extend(recipe.title for recipe in kept)
+                previous_feed_count = len(kept)
+                # Top-ups go straight into the visible feed
+                generation = user_preferences.feed_generation or 0
+                cutoff_recipe_id = 0
+                swap_at = 0
+                swapped = True
+            else:
+                # The new recipes are written under a pending feed generation; the
+                # previous feed stays visible until enough of them are ready
+                generation = recipe_pool.next_generation(db, user_id)
+                # Private AI recipes up to here belong to the feed being replaced
+                cutoff_recipe_id = db.query(func.max(Recipe.id)).scalar() or 0
+                previous_feed_count = len(recipe_pool.feed_recipes(db, user_id))
+                swap_at = min(FEED_SWAP_MIN_RECIPES, count)
+                swapped = False
+                logger.info(f"Writing feed generation {generation} for user {user_id}")
+            
+            def swap():
+                nonlocal swapped
+                # The new feed size is committed together with the pointer flip
+                set_status(db, user_id, recipes_count=len(generated_recipes))
+                recipe_pool.activate_generation(db, user_id, generation, cutoff_recipe_id)
+                swapped = True
+            
+            def maybe_swap():
+                if not swapped and len(generated_recipes) >= swap_at:
+                    swap()
+            
+            def feed_count(uncommitted: int = 0) -> int:
+                # Top-ups add to the kept recipes; a new generation replaces the old feed once swapped in
+                added = len(generated_recipes) + uncommitted
+                if reconciled is not None:
+                    return previous_feed_count + added
+                return added if swapped else previous_feed_count
+            
+            def recipe_added(recipe: Recipe):
+                maybe_swap()
+                generation_progress.recipe_ready(user_id, len(generated_recipes), feed_count(), recipe.id, recipe.title)
+            
+            run_target = len(slots)
+            set_status(
+                db, user_id, state=STATUS_RUNNING, target=run_target, completed=0, failed=0,
+                recipes_count=feed_count()
+            )
+            db.commit()
+            generation_progress.started(user_id, run_target, feed_count())
+            
+            # Limits this user's batch; the global semaphore caps all users together
+            user_semaphore = asyncio.Semaphore(GENERATION_CONCURRENCY_PER_USER)
+            
+            async def generate_slot(cuisine, meal_type, variation):
+                async with user_semaphore, global_generation_semaphore:
+                    logger.info(f"Generating recipe for user {user_id} - cuisine: {cuisine}, meal type: {meal_type}, variation: {variation}")
+                    return await generate_recipe(
                         cuisine_preferences=[cuisine] if cuisine else [],
                         dietary_restrictions=combined_restrictions,
                         flavor_preferences=flavor_preferences,
@@ -153,97 +291,154 @@ async def generate_recipes_for_user(user_id: int, preferences_id: int, count: in
                         skill_level=skill_level,
                         max_cooking_time=max_cooking_time,
                         allergies=allergies,
-                        health_goals=health_goals
+                        health_goals=health_goals,
+                        variation=variation
                     )
-                    
-                    # Check for duplicate titles
-                    title = recipe_data.get("title", "")
-                    if title in generated_titles:
-                        logger.warning(f"Skipping duplicate recipe: {title}")
+            
+            def store_recipe(recipe_data: Dict[str, Any], signature: str) -> bool:
+                """
+                Store a generated recipe in the shared pool and assign it to the user,
+                unless it duplicates one already stored
+                """
+                # Titles are checked one recipe at a time, so the checks see every
+                # recipe stored before this one
+                title = recipe_data.get("title", "")
+                if title in generated_titles or is_near_duplicate_title(title, generated_titles):
+                    logger.warning(f"Skipping duplicate recipe: {title}")
+                    return False
+                
+                generated_titles.append(title)
+                
+                db_recipe = store_feed_recipe(db, user_id, recipe_data, signature, generation)
+                record_recipe(db, user_id, feed_count(uncommitted=1))
+                
+                # Commit each recipe immediately to avoid large transactions
+                db.commit()
+                generated_recipes.append(db_recipe)
+                logger.info(f"Successfully generated recipe: {db_recipe.title}")
+                recipe_added(db_recipe)
+                return True
+
+            # Slots with a shared recipe this user has not had yet are assigned straight away
+            unfilled = []
+            for slot in slots:
+                cuisine, meal_type, _ = slot
+                try:
+                    shared = recipe_pool.claim(db, user_id, slot_signature(cuisine, meal_type), generated_titles)
+                    if shared is not None and not is_near_duplicate_title(shared.title, generated_titles):
+                        recipe_pool.assign(db, user_id, shared, generation)
+                        record_recipe(db, user_id, feed_count(uncommitted=1))
+                        db.commit()
+                        generated_titles.append(shared.title)
+                        generated_recipes.append(shared)
+                        recipe_added(shared)
                         continue
-                        
-                    generated_titles.add(title)
-                    
-                    # Process recipe data to ensure correct types
-                    processed_cuisine = recipe_data.get("cuisine", "")
-                    if isinstance(processed_cuisine, list):
-                        processed_cuisine = ", ".join(processed_cuisine)
-                        
-                    # Get ingredients either as a list or from JSON string
-                    ingredients = recipe_data.get("ingredients", "[]")
-                    if isinstance(ingredients, str):
-                        try:
-                            # Try to parse as JSON
-                            ingredients_list = json.loads(ingredients)
-                        except:
-                            # If not valid JSON, split by newlines/commas
-                            ingredients_list = [item.strip() for item in ingredients.replace('\n', ',').split(',') if item.strip()]
-                    else:
-                        ingredients_list = ingredients
-                        
-                    # Make sure ingredients is stored as a JSON string
-                    ingredients_json = json.dumps(ingredients_list)
-                    
-                    # Get instructions either as a list or from newline-separated string
-                    instructions = recipe_data.get("instructions", "")
-                    if isinstance(instructions, str):
-                        # Split by newlines
-                        instructions_list = [step.strip() for step in instructions.split('\n') if step.strip()]
-                    else:
-                        instructions_list = instructions
-                        
-                    # Store instructions as JSON string
-                    instructions_json = json.dumps(instructions_list)
-                    
-                    # Get dietary restrictions
-                    recipe_dietary_restrictions = recipe_data.get("dietary_restrictions", "[]")
-                    if isinstance(recipe_dietary_restrictions, str):
-                        try:
-                            dietary_restrictions_list = json.loads(recipe_dietary_restrictions)
-                        except:
-                            dietary_restrictions_list = [item.strip() for item in recipe_dietary_restrictions.replace('\n', ',').split(',') if item.strip()]
-                    else:
-                        dietary_restrictions_list = recipe_dietary_restrictions if recipe_dietary_restrictions else []
-                        
-                    # Store dietary restrictions as JSON string
-                    dietary_restrictions_json = json.dumps(dietary_restrictions_list)
-                    
-                    # Get prep time and cook time
-                    prep_time = recipe_data.get("prep_time", 0)
-                    cook_time = recipe_data.get("cook_time", 0)
-                    
-                    # Create a new recipe in the database
-                    db_recipe = Recipe(
-                        title=recipe_data.get("title", ""),
-                        description=recipe_data.get("description", ""),
-                        ingredients=ingredients_json,
-                        instructions=instructions_json,
-                        cuisine=processed_cuisine,
-                        cooking_time=cook_time,  # Use cook_time directly
-                        prep_time=prep_time,     # Add prep_time field
-                        total_time=prep_time + cook_time,  # Add total time
-                        difficulty=recipe_data.get("difficulty", "medium"),
-                        dietary_restrictions=dietary_restrictions_json,
-                        is_ai_generated=True,
-                        generated_for_user_id=user_id
-                    )
-                    
-                    db.add(db_recipe)
-                    generated_recipes.append(db_recipe)
-                    logger.info(f"Successfully generated recipe: {db_recipe.title}")
-                    
-                    # Commit each recipe immediately to avoid large transactions
-                    db.commit()
-                    
                 except Exception as e:
-                    logger.error(f"Error generating recipe {i+1}: {str(e)}")
-                    continue
+                    logger.error(f"Error assigning shared recipe: {str(e)}")
+                    db.rollback()
+                unfilled.append(slot)
+            if len(unfilled) < len(slots):
+                logger.info(f"Shared pool filled {len(slots) - len(unfilled)}/{len(slots)} slots for user {user_id}")
+            slots = unfilled
+            
+            # Slots the warm inventory can fill are stored at once, without waiting on the LLM
+            pooled = recipe_inventory.take(
+                db,
+                [
+                    (i, bucket_for(cuisine, meal_type, combined_restrictions, allergies, skill_level))
+                    for i, (cuisine, meal_type, _) in enumerate(slots)
+                ],
+                max_cooking_time=max_cooking_time
+            )
+            from_inventory = set()
+            for index, recipe_data in sorted(pooled.items()):
+                try:
+                    cuisine, meal_type, _ = slots[index]
+                    if store_recipe(recipe_data, slot_signature(cuisine, meal_type)):
+                        from_inventory.add(index)
+                except Exception as e:
+                    logger.error(f"Error storing inventory recipe: {str(e)}")
+                    db.rollback()
+            if from_inventory:
+                logger.info(f"Inventory filled {len(from_inventory)}/{len(slots)} slots for user {user_id}")
+            slots = [slot for i, slot in enumerate(slots) if i not in from_inventory]
+
+            # Batch mode: one streamed call for every slot, storing each recipe as
+            # soon as its JSON object is complete
+            remaining_slots = list(slots)
+            if RECIPE_BATCH_MODE and len(slots) > 1:
+                filled = set()
+                try:
+                    async with global_generation_semaphore:
+                        logger.info(f"Generating batch of {len(slots)} recipes for user {user_id}")
+                        async for index, recipe_data in generate_recipes_batch(
+                            slots=[(cuisine, meal_type) for cuisine, meal_type, _ in slots],
+                            dietary_restrictions=combined_restrictions,
+                            skill_level=skill_level,
+                            max_cooking_time=max_cooking_time,
+                            allergies=allergies,
+                            health_goals=health_goals
+                        ):
+                            try:
+                                cuisine, meal_type, _ = slots[index]
+                                if store_recipe(recipe_data, slot_signature(cuisine, meal_type)):
+                                    filled.add(index)
+                            except Exception as e:
+                                logger.error(f"Error storing batch recipe: {str(e)}")
+                                db.rollback()
+                except Exception as e:
+                    logger.error(f"Batch generation failed for user {user_id}: {str(e)}")
+                
+                # Whatever the batch missed or duplicated is topped up individually
+                remaining_slots = [slot for i, slot in enumerate(slots) if i not in filled]
+                if remaining_slots:
+                    logger.info(f"Batch filled {len(filled)}/{len(slots)} slots for user {user_id}, generating the rest individually")
+            
+            # Issue the remaining slots concurrently and store recipes as they complete
+            pending = {}
+            for slot in remaining_slots:
+                pending[asyncio.create_task(generate_slot(*slot))] = (slot, 0)
+            
+            try:
+                while pending:
+                    done, _ = await asyncio.wait(pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        (cuisine, meal_type, variation), retries = pending.pop(task)
+                        try:
+                            if not store_recipe(task.result(), slot_signature(cuisine, meal_type)) and retries < MAX_DUPLICATE_RETRIES:
+                                # Ask again for the same slot with a fresh variation
+                                retry_slot = (cuisine, meal_type, variation + count)
+                                pending[asyncio.create_task(generate_slot(*retry_slot))] = (retry_slot, retries + 1)
+                            
+                        except Exception as e:
+                            logger.error(f"Error generating recipe for {cuisine}/{meal_type}: {str(e)}")
+                            db.rollback()
+                            continue
+            finally:
+                # Do not leave orphaned calls running if the batch is abandoned
+                for task in pending:
+                    task.cancel()
             
             logger.info(f"Generated {len(generated_recipes)} recipes for user {user_id}")
+            
+            # A short batch still replaces the old feed; an empty one leaves it in place
+            if generated_recipes and not swapped:
+                swap()
+            
+            # The job queue sets the final state when it records the job's outcome
+            unfilled_count = max(run_target - len(generated_recipes), 0)
+            set_status(db, user_id, failed=unfilled_count, recipes_count=feed_count())
+            db.commit()
+            generation_progress.finished(
+                user_id, feed_count(), unfilled_count, more_queued=has_pending_job(db, user_id)
+            )
         
         except Exception as e:
             logger.error(f"Error in background task: {str(e)}")
             db.rollback()
+            generation_progress.failed(user_id, str(e))
+            # Let the job queue record the failure and retry
+            raise
         finally:
             # Always close the session
             db.close()
@@ -285,9 +480,11 @@ async def create_preference(
     db.add(db_preference)
     db.commit()
     db.refresh(db_preference)
+    invalidate_user_profile(current_user.id)
     
     # Generate initial recipes for the user in the background
-    asyncio.create_task(generate_recipes_for_user(current_user.id, db_preference.id))
+    enqueue_generation(db, current_user.id, db_preference.id, INITIAL_RECIPES_COUNT)
+    generation_progress.queued(current_user.id, INITIAL_RECIPES_COUNT)
     
     # Convert the DB model to a dictionary and explicitly use the list properties
     response_data = {
@@ -342,18 +539,24 @@ async def update_preference(
         # Create if not exists
         return await create_preference(preference, current_user, db)
     
+    # Remember what the feed was generated for, to reconcile it afterwards
+    previous_preferences = preference_snapshot(db_preference)
+    
     # Update preference
     db_preference.dietary_restrictions = ",".join(preference.dietary_restrictions)
     db_preference.favorite_cuisines = ",".join(preference.favorite_cuisines)
     db_preference.cooking_skill_level = preference.cooking_skill_level
     db_preference.health_goals = ",".join(preference.health_goals)
     db_preference.allergies = ",".join(preference.allergies)
+    db_preference.bump_profile_version()
     
     db.commit()
     db.refresh(db_preference)
+    invalidate_user_profile(current_user.id)
     
-    # Generate additional recipes based on updated preferences
-    asyncio.create_task(generate_recipes_for_user(current_user.id, db_preference.id))
+    # Replace the recipes that no longer fit the updated preferences
+    enqueue_generation(db, current_user.id, db_preference.id, INITIAL_RECIPES_COUNT, previous_preferences)
+    generation_progress.queued(current_user.id, INITIAL_RECIPES_COUNT)
     
     # Convert the DB model to a dictionary and explicitly use the list properties
     response_data = {
@@ -391,14 +594,17 @@ async def submit_questionnaire(
     db_preference = db.query(UserPreference).filter(UserPreference.user_id == current_user.id).first()
     
     is_new_preference = False
+    previous_preferences = None
     if db_preference:
         # Update existing preference
         logger.info("Updating existing preferences")
+        previous_preferences = preference_snapshot(db_preference)
         db_preference.dietary_restrictions = ",".join(questionnaire_data.dietary_restrictions)
         db_preference.favorite_cuisines = ",".join(questionnaire_data.favorite_cuisines)
         db_preference.cooking_skill_level = questionnaire_data.cooking_skill_level
         db_preference.health_goals = ",".join(questionnaire_data.health_goals)
         db_preference.allergies = ",".join(questionnaire_data.allergies)
+        db_preference.bump_profile_version()
     else:
         # Create new preference
         logger.info("Creating new preferences")
@@ -415,12 +621,14 @@ async def submit_questionnaire(
     
     db.commit()
     db.refresh(db_preference)
+    invalidate_user_profile(current_user.id)
     logger.info(f"Preferences saved: {db_preference}")
     
     # Generate recipes based on questionnaire preferences
     # For new users, generate more initial recipes (8), for updates generate fewer (6)
     recipe_count =  6
-    asyncio.create_task(generate_recipes_for_user(current_user.id, db_preference.id, count=recipe_count))
+    enqueue_generation(db, current_user.id, db_preference.id, recipe_count, previous_preferences)
+    generation_progress.queued(current_user.id, recipe_count)
     
     # Convert the DB model to a dictionary and explicitly use the list properties
     response_data = {
@@ -440,42 +648,68 @@ async def get_recipe_generation_status(
     db: Session = Depends(get_db)
 ):
     """
-    Get the status of recipe generation for the current user
+    Get the status of recipe generation for the current user.
+    Kept for polling clients; served from the in-memory progress state.
     """
     try:
-        # Check if user has preferences
-        user_preferences = db.query(UserPreference).filter(UserPreference.user_id == current_user.id).first()
-        has_preferences = user_preferences is not None
-        
-        # Check if we have any recipes generated for this user
-        from sqlalchemy.sql import text
-        
-        try:
-            query = text("""
-                SELECT COUNT(*) FROM recipes 
-                WHERE generated_for_user_id = :user_id AND is_ai_generated = 1
-            """)
-            result = db.execute(query, {"user_id": current_user.id}).scalar()
-            recipes_count = result or 0
-        except Exception as e:
-            logger.error(f"Error counting recipes: {str(e)}")
-            recipes_count = 0
-            
-        # Check if a generation task is currently active
-        is_generating = current_user.id in active_generation_tasks
-        
-        # Determine if generation is complete (either not generating or we have enough recipes)
-        generation_complete = not is_generating and (recipes_count >= INITIAL_RECIPES_COUNT or not has_preferences)
-        
-        return {
-            "is_generating": is_generating,
-            "recipes_count": recipes_count,
-            "has_preferences": has_preferences,
-            "generation_complete": generation_complete
-        }
+        return generation_progress.status(db, current_user.id)
     except Exception as e:
         logger.error(f"Error getting recipe generation status: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to get recipe generation status: {str(e)}"
-        ) 
\ No newline at end of file
+        )
+
+def _sse_event(event: str, data: Any) -> str:
+    """
+    Format one Server-Sent Event
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.get("/recipe-generation-events")
+async def stream_recipe_generation_events(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Stream recipe generation progress as Server-Sent Events.
+    
+    Starts with a "status" event carrying the current status, followed by
+    "queued", "started", a "recipe" event per recipe added to the feed,
+    "progress" for generations running in another process, and "error" when an
+    attempt fails. Every event carries the full status; the stream ends once
+    nothing is left to generate, straight away if nothing is being generated.
+    """
+    user_id = current_user.id
+    # Subscribe before reading the status so no event falls in between
+    queue = generation_progress.subscribe(user_id)
+    try:
+        initial = generation_progress.status(db, user_id)
+    except Exception:
+        generation_progress.unsubscribe(user_id, queue)
+        raise
+    
+    async def event_stream():
+        try:
+            yield _sse_event("status", initial)
+            if not initial["is_generating"]:
+                return
+            while True:
+                try:
+                    event, payload = await asyncio.wait_for(queue.get(), GENERATION_EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line: keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse_event(event, payload)
+                # Ends on completion, or on a failure that will not be retried
+                if not payload["is_generating"]:
+                    return
+        finally:
+            generation_progress.unsubscribe(user_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,16 +1,38 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Body, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 import logging
+import asyncio
 import json
+import os
+import time
 from json import JSONDecodeError
+from sqlalchemy import or_
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.sql import text
 
-from database.database import get_db
+from database.database import SessionLocal, get_db
 from models import User, Recipe, UserPreference
 from schemas.recipe import RecipeGenerationRequest, RecipeSimilarityRequest, RecipeInDB, RecipeBrief, RecipeResponse
-from utils.openai_helper import generate_recipe, get_cuisine_recommendations
-from utils.recommendation import RecipeRecommender
+from routes.preferences import feed_slot_signature, is_near_duplicate_title, plan_feed_slots, store_feed_recipe
+from utils.openai_helper import (
+    generate_fallback_recommendations, generate_recipe, generate_recipe_stream, generate_recipes_batch,
+    get_cuisine_recommendations
+)
+from utils.explore_cache import normalize_query
+from utils.llm_scheduler import PRIORITY_INTERACTIVE, llm_priority, llm_request_context, llm_user
+from utils.recipe_pool import USER_FEED_CONDITION, USER_FEED_ORDER, cooking_time_band, recipe_pool
+from utils.recipe_rows import build_recipe_row
+from utils.state_manager import active_generation_tasks
+from utils.job_queue import has_active_job
+from utils.generation_progress import generation_progress
+from utils.generation_status import adjust_recipes_count
+from utils.feed_prefetch import FeedPrefetcher
+from utils.deadline import deadline_scope, has_time_for_attempt, remaining
+from utils.feed_reconciliation import preference_snapshot
+from utils.metrics import register_stats_provider
+from utils.recommendation import RecipeRecommender, preference_profile, recipe_document
 from utils.auth import get_current_user
 
 router = APIRouter(
@@ -24,6 +46,155 @@ logger = logging.getLogger(__name__)
 
 # Initialize recommendation engine
 recipe_recommender = None
+# How often the recommender is refitted to pick up new catalog recipes
+CATALOG_RECOMMENDER_REFRESH_SECONDS = float(os.getenv("CATALOG_RECOMMENDER_REFRESH_SECONDS", "300"))
+_recipe_recommender_fitted_at = 0.0
+_recipe_recommender_lock = asyncio.Lock()
+
+# How long /explore waits for LLM suggestions before answering from local data alone
+EXPLORE_LLM_WAIT_SECONDS = float(os.getenv("EXPLORE_LLM_WAIT_SECONDS", "1.5"))
+# Share of the /explore results reserved for matching recipes from the catalog
+EXPLORE_CATALOG_SHARE = float(os.getenv("EXPLORE_CATALOG_SHARE", "0.5"))
+
+def _generation_params(request: RecipeGenerationRequest) -> Dict[str, Any]:
+    """
+    Map a generation request to the keyword arguments expected by generate_recipe
+    """
+    # Map request to parameters expected by generate_recipe function
+    cuisine_preferences = request.cuisine_preferences if hasattr(request, "cuisine_preferences") else ([request.cuisine] if request.cuisine else [])
+    
+    # Handle different field names between frontend and backend
+    meal_type = request.meal_type if hasattr(request, "meal_type") else request.dish_type or "dinner"
+    skill_level = request.skill_level if hasattr(request, "skill_level") else request.difficulty or "medium"
+    max_cooking_time = request.max_cooking_time if hasattr(request, "max_cooking_time") else request.cooking_time or 60
+    
+    # Extract flavor preferences or use default
+    flavor_preferences = request.flavor_preferences if hasattr(request, "flavor_preferences") else {"medium": 3}
+    
+    # Extract ingredients to include
+    ingredients_to_include = request.ingredients_to_include if hasattr(request, "ingredients_to_include") else request.ingredients
+    
+    # Extract allergies and health goals (new)
+    allergies = request.allergies or []
+    health_goals = request.health_goals or []
+    
+    return {
+        "cuisine_preferences": cuisine_preferences,
+        "dietary_restrictions": request.dietary_restrictions or [],
+        "flavor_preferences": flavor_preferences,
+        "meal_type": meal_type,
+        "skill_level": skill_level,
+        "max_cooking_time": max_cooking_time,
+        "ingredients_to_include": ingredients_to_include,
+        "allergies": allergies, # Pass allergies
+        "health_goals": health_goals # Pass health goals
+    }
+
+def _save_generated_recipe(recipe_data: Dict[str, Any], user_id: int, db: Session) -> Dict[str, Any]:
+    """
+    Store a generated recipe for a user and return it in API response form
+    """
+    db_recipe = build_recipe_row(recipe_data, user_id)
+    db.add(db_recipe)
+    db.flush()
+    # The user's feed grows by this recipe, at its end
+    recipe_pool.append_private(db, user_id, db_recipe)
+    adjust_recipes_count(db, user_id, 1)
+    db.commit()
+    db.refresh(db_recipe)
+    generation_progress.invalidate(user_id)
+    
+    # Convert strings back to lists for API response
+    recipe_dict = {
+        "id": db_recipe.id,
+        "title": db_recipe.title,
+        "description": db_recipe.description,
+        "ingredients": db_recipe.ingredients_list,
+        "instructions": db_recipe.instructions_list,
+        "prep_time": db_recipe.prep_time,
+        "cooking_time": db_recipe.cooking_time,
+        "total_time": db_recipe.total_time,
+        "difficulty": db_recipe.difficulty,
+        "cuisine": db_recipe.cuisine,
+        "dietary_restrictions": db_recipe.dietary_restrictions_list,
+        "tags": db_recipe.tags_list,
+        "is_ai_generated": db_recipe.is_ai_generated,
+        "generated_for_user_id": db_recipe.generated_for_user_id,
+        "vegetarian": db_recipe.vegetarian if hasattr(db_recipe, "vegetarian") else False,
+        "vegan": db_recipe.vegan if hasattr(db_recipe, "vegan") else False,
+        "gluten_free": db_recipe.gluten_free if hasattr(db_recipe, "gluten_free") else False,
+        "dairy_free": db_recipe.dairy_free if hasattr(db_recipe, "dairy_free") else False,
+        "nut_free": db_recipe.nut_free if hasattr(db_recipe, "nut_free") else False,
+        "spicy_level": db_recipe.spicy_level if hasattr(db_recipe, "spicy_level") else 0,
+        "image_url": db_recipe.image_url if hasattr(db_recipe, "image_url") else None,
+    }
+    
+    return recipe_dict
+
+def _sse_event(event: str, data: Any) -> str:
+    """
+    Format one Server-Sent Event
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _prefetch_feed_recipes(user_id: int, count: int) -> int:
+    """
+    Add up to count recipes to the user's feed for the prefetcher, the same way
+    onboarding fills its slots: shared recipes first, then one batched call.
+    Returns how many were added.
+    """
+    db = SessionLocal()
+    try:
+        user_preferences = db.query(UserPreference).filter(UserPreference.user_id == user_id).first()
+        if not user_preferences:
+            return 0
+        preferences = preference_snapshot(user_preferences)
+        generation = user_preferences.feed_generation or 0
+        titles = [recipe.title for recipe in recipe_pool.feed_recipes(db, user_id)]
+        added = 0
+        
+        # Slots with a shared recipe this user has not had yet need no LLM call
+        unfilled = []
+        for cuisine, meal_type, _ in plan_feed_slots(preferences, count):
+            signature = feed_slot_signature(preferences, cuisine, meal_type)
+            shared = recipe_pool.claim(db, user_id, signature, titles)
+            if shared is None or is_near_duplicate_title(shared.title, titles):
+                unfilled.append((cuisine, meal_type, signature))
+                continue
+            recipe_pool.assign(db, user_id, shared, generation)
+            adjust_recipes_count(db, user_id, 1)
+            db.commit()
+            titles.append(shared.title)
+            added += 1
+        
+        # One streamed call for the rest; errors, preemption included, propagate
+        if unfilled:
+            async for index, recipe_data in generate_recipes_batch(
+                slots=[(cuisine, meal_type) for cuisine, meal_type, _ in unfilled],
+                dietary_restrictions=preferences["dietary_restrictions"],
+                skill_level=preferences["skill_level"],
+                max_cooking_time=cooking_time_band(preferences["max_cooking_time"]),
+                allergies=preferences["allergies"],
+                health_goals=preferences["health_goals"]
+            ):
+                title = recipe_data.get("title", "")
+                if not title or title in titles or is_near_duplicate_title(title, titles):
+                    logger.warning(f"Skipping duplicate prefetched recipe: {title}")
+                    continue
+                store_feed_recipe(db, user_id, recipe_data, unfilled[index][2], generation)
+                adjust_recipes_count(db, user_id, 1)
+                db.commit()
+                titles.append(title)
+                added += 1
+        if added:
+            generation_progress.invalidate(user_id)
+        return added
+    finally:
+        db.close()
+
+# Prepares the next page of /user in the background after each page is served
+feed_prefetcher = FeedPrefetcher(_prefetch_feed_recipes)
+register_stats_provider("feed_prefetch", feed_prefetcher.stats)
 
 @router.post("/generate", response_model=RecipeInDB)
 async def generate_recipe_endpoint(
@@ -35,150 +206,11 @@ async def generate_recipe_endpoint(
     Generate a personalized recipe using OpenAI based on user preferences
     """
     try:
-        # Map request to parameters expected by generate_recipe function
-        cuisine_preferences = request.cuisine_preferences if hasattr(request, "cuisine_preferences") else ([request.cuisine] if request.cuisine else [])
-        
-        # Handle different field names between frontend and backend
-        meal_type = request.meal_type if hasattr(request, "meal_type") else request.dish_type or "dinner"
-        skill_level = request.skill_level if hasattr(request, "skill_level") else request.difficulty or "medium"
-        max_cooking_time = request.max_cooking_time if hasattr(request, "max_cooking_time") else request.cooking_time or 60
-        
-        # Extract flavor preferences or use default
-        flavor_preferences = request.flavor_preferences if hasattr(request, "flavor_preferences") else {"medium": 3}
-        
-        # Extract ingredients to include
-        ingredients_to_include = request.ingredients_to_include if hasattr(request, "ingredients_to_include") else request.ingredients
-        
-        # Extract allergies and health goals (new)
-        allergies = request.allergies or []
-        health_goals = request.health_goals or []
-        
         # Generate recipe via OpenAI
-        recipe_data = await generate_recipe(
-            cuisine_preferences=cuisine_preferences,
-            dietary_restrictions=request.dietary_restrictions or [],
-            flavor_preferences=flavor_preferences,
-            meal_type=meal_type,
-            skill_level=skill_level,
-            max_cooking_time=max_cooking_time,
-            ingredients_to_include=ingredients_to_include,
-            allergies=allergies, # Pass allergies
-            health_goals=health_goals # Pass health goals
-        )
-        
-        # Process recipe data to ensure correct types
-        cuisine = recipe_data.get("cuisine", "")
-        if isinstance(cuisine, list):
-            cuisine = ", ".join(cuisine)
-            
-        # Get ingredients either as a list or from JSON string
-        ingredients = recipe_data.get("ingredients", "[]")
-        if isinstance(ingredients, str):
-            try:
-                # Try to parse as JSON
-                ingredients_list = json.loads(ingredients)
-            except json.JSONDecodeError:
-                # If not valid JSON, split by newlines/commas
-                ingredients_list = [item.strip() for item in ingredients.replace('\n', ',').split(',') if item.strip()]
-        else:
-            ingredients_list = ingredients
-            
-        # Make sure ingredients is stored as a JSON string
-        ingredients_json = json.dumps(ingredients_list)
-        
-        # Get instructions either as a list or from newline-separated string
-        instructions = recipe_data.get("instructions", "")
-        if isinstance(instructions, str):
-            # Split by newlines
-            instructions_list = [step.strip() for step in instructions.split('\n') if step.strip()]
-        else:
-            instructions_list = instructions
-            
-        # Store instructions as JSON string
-        instructions_json = json.dumps(instructions_list)
+        with llm_request_context(priority=PRIORITY_INTERACTIVE, user_id=current_user.id):
+            recipe_data = await generate_recipe(**_generation_params(request))
         
-        # Get dietary restrictions
-        dietary_restrictions = recipe_data.get("dietary_restrictions", "[]")
-        if isinstance(dietary_restrictions, str):
-            try:
-                dietary_restrictions_list = json.loads(dietary_restrictions)
-            except json.JSONDecodeError:
-                dietary_restrictions_list = [item.strip() for item in dietary_restrictions.replace('\n', ',').split(',') if item.strip()]
-        else:
-            dietary_restrictions_list = dietary_restrictions if dietary_restrictions else []
-            
-        # Store dietary restrictions as JSON string
-        dietary_restrictions_json = json.dumps(dietary_restrictions_list)
-        
-        # Get tags
-        tags = recipe_data.get("tags", [])
-        if isinstance(tags, str):
-            try:
-                tags_list = json.loads(tags)
-            except json.JSONDecodeError:
-                tags_list = [item.strip() for item in tags.replace('\n', ',').split(',') if item.strip()]
-        else:
-            tags_list = tags if tags else []
-            
-        # Store tags as JSON string
-        tags_json = json.dumps(tags_list)
-        
-        # Get time values with proper defaults
-        prep_time = recipe_data.get("prep_time", 0)
-        cook_time = recipe_data.get("cook_time", 0)
-        total_time = recipe_data.get("total_time", 0)
-        
-        # If total time is not provided, calculate it
-        if total_time == 0:
-            total_time = prep_time + cook_time
-        
-        # Create a new recipe in the database
-        db_recipe = Recipe(
-            title=recipe_data.get("title", ""),
-            description=recipe_data.get("description", ""),
-            ingredients=ingredients_json,
-            instructions=instructions_json,
-            cuisine=cuisine,
-            prep_time=prep_time,
-            cooking_time=cook_time,
-            total_time=total_time,
-            difficulty=recipe_data.get("difficulty", "medium"),
-            dietary_restrictions=dietary_restrictions_json,
-            tags=tags_json,
-            is_ai_generated=True,
-            generated_for_user_id=current_user.id
-        )
-        
-        db.add(db_recipe)
-        db.commit()
-        db.refresh(db_recipe)
-        
-        # Convert strings back to lists for API response
-        recipe_dict = {
-            "id": db_recipe.id,
-            "title": db_recipe.title,
-            "description": db_recipe.description,
-            "ingredients": db_recipe.ingredients_list,
-            "instructions": db_recipe.instructions_list,
-            "prep_time": db_recipe.prep_time,
-            "cooking_time": db_recipe.cooking_time,
-            "total_time": db_recipe.total_time,
-            "difficulty": db_recipe.difficulty,
-            "cuisine": db_recipe.cuisine,
-            "dietary_restrictions": db_recipe.dietary_restrictions_list,
-            "tags": db_recipe.tags_list,
-            "is_ai_generated": db_recipe.is_ai_generated,
-            "generated_for_user_id": db_recipe.generated_for_user_id,
-            "vegetarian": db_recipe.vegetarian if hasattr(db_recipe, "vegetarian") else False,
-            "vegan": db_recipe.vegan if hasattr(db_recipe, "vegan") else False,
-            "gluten_free": db_recipe.gluten_free if hasattr(db_recipe, "gluten_free") else False,
-            "dairy_free": db_recipe.dairy_free if hasattr(db_recipe, "dairy_free") else False,
-            "nut_free": db_recipe.nut_free if hasattr(db_recipe, "nut_free") else False,
-            "spicy_level": db_recipe.spicy_level if hasattr(db_recipe, "spicy_level") else 0,
-            "image_url": db_recipe.image_url if hasattr(db_recipe, "image_url") else None,
-        }
-        
-        return recipe_dict
+        return _save_generated_recipe(recipe_data, current_user.id, db)
     
     except Exception as e:
         logger.error(f"Error generating recipe: {str(e)}")
@@ -187,6 +219,119 @@ async def generate_recipe_endpoint(
             detail=f"Failed to generate recipe: {str(e)}"
         )
 
+@router.post("/generate/stream")
+async def generate_recipe_stream_endpoint(
+    request: RecipeGenerationRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Generate a personalized recipe and stream it as Server-Sent Events.
+    
+    Emits a "field" event for each completed scalar field (title, description, ...),
+    an "item" event for each ingredient and instruction step as soon as it is
+    complete, and a final "recipe" event with the stored recipe. Failures are
+    reported as an "error" event.
+    """
+    params = _generation_params(request)
+    user_id = current_user.id
+    
+    async def event_stream():
+        counts: Dict[str, int] = {}
+        # The generator runs in the response task, so the context is set here
+        llm_priority.set(PRIORITY_INTERACTIVE)
+        llm_user.set(user_id)
+        try:
+            async for kind, key, value in generate_recipe_stream(**params):
+                if kind == "item":
+                    index = counts.get(key, 0)
+                    counts[key] = index + 1
+                    yield _sse_event("item", {"name": key, "index": index, "value": value})
+                elif kind == "field":
+                    # Array members were already sent item by item
+                    if not isinstance(value, list):
+                        yield _sse_event("field", {"name": key, "value": value})
+                elif kind == "recipe":
+                    # Persist once, after the full recipe has arrived
+                    recipe_dict = _save_generated_recipe(value, user_id, db)
+                    yield _sse_event("recipe", recipe_dict)
+        except Exception as e:
+            logger.error(f"Error streaming recipe: {str(e)}")
+            db.rollback()
+            yield _sse_event("error", {"detail": f"Failed to generate recipe: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _fit_catalog_recommender() -> Optional[RecipeRecommender]:
+    """
+    Load the recipe catalog (recipes not generated by AI) and fit a recommender on it.
+    Blocking: runs in a worker thread with its own session.
+    """
+    db = SessionLocal()
+    try:
+        documents = [recipe_document(recipe) for recipe in db.query(Recipe).filter(Recipe.is_ai_generated.isnot(True))]
+    finally:
+        db.close()
+    if not documents:
+        return None
+    return RecipeRecommender().fit(documents)
+
+async def _get_recipe_recommender() -> Optional[RecipeRecommender]:
+    """
+    The recommender fitted on the recipe catalog, refitted every CATALOG_RECOMMENDER_REFRESH_SECONDS
+    """
+    global recipe_recommender, _recipe_recommender_fitted_at
+    async with _recipe_recommender_lock:
+        if recipe_recommender is not None and time.monotonic() - _recipe_recommender_fitted_at < CATALOG_RECOMMENDER_REFRESH_SECONDS:
+            return recipe_recommender
+        # An empty or failing catalog is not retried on every request either
+        _recipe_recommender_fitted_at = time.monotonic()
+        try:
+            # Loading and fitting both block; keep them off the event loop
+            recipe_recommender = await asyncio.to_thread(_fit_catalog_recommender)
+        except (ValueError, SQLAlchemyError) as e:
+            logger.error(f"Error fitting recommender on the catalog: {str(e)}")
+            recipe_recommender = None
+        return recipe_recommender
+
+async def _catalog_feed_recipes(db: Session, user_preferences: UserPreference, count: int) -> List[Dict[str, Any]]:
+    """
+    Catalog recipes ranked for the user's cached preference profile, to fill a short feed page
+    """
+    if count <= 0:
+        return []
+    recommender = await _get_recipe_recommender()
+    if recommender is None:
+        return []
+    ranked = recommender.get_user_recommendations(
+        preference_profile(user_preferences),
+        top_n=count,
+        user_id=user_preferences.user_id,
+        profile_version=user_preferences.profile_version
+    )
+    ids = [recipe["id"] for recipe in ranked]
+    rows = {recipe.id: recipe for recipe in db.query(Recipe).filter(Recipe.id.in_(ids)).all()}
+    return [{
+        "id": recipe.id,
+        "title": recipe.title,
+        "description": recipe.description or "",
+        "ingredients": recipe.ingredients_list,
+        "instructions": recipe.instructions_list,
+        "prep_time": recipe.prep_time or 0,
+        "cooking_time": recipe.cooking_time or 0,
+        "total_time": recipe.total_time or recipe.cooking_time or 0,
+        "difficulty": recipe.difficulty or "medium",
+        "cuisine": recipe.cuisine or "",
+        "dietary_restrictions": recipe.dietary_restrictions_list,
+        "is_ai_generated": recipe.is_ai_generated,
+        "generated_for_user_id": recipe.generated_for_user_id,
+        "tags": recipe.tags_list
+    } for recipe in (rows.get(recipe_id) for recipe_id in ids) if recipe is not None]
+
 @router.get("/user", response_model=List[RecipeBrief])
 async def get_user_recommendations(
     limit: int = Query(5, ge=1, le=20),
@@ -213,7 +358,7 @@ async def get_user_recommendations(
                        cooking_time, difficulty, cuisine, dietary_restrictions,
                        is_ai_generated, generated_for_user_id
                 FROM recipes
-                ORDER BY id DESC
+                ORDER BY id
                 LIMIT :limit OFFSET :offset
             """)
             
@@ -291,14 +436,20 @@ async def get_user_recommendations(
         # Otherwise, use preferences to generate personalized recommendations
         logger.info(f"Generating personalized recommendations for user {current_user.id} with preferences id={user_preferences.id}")
         
-        # First, check if we have enough existing AI-generated recipes for this user
-        query = text("""
+        # A prefetch of this page may still be adding recipes to the feed. It is
+        # only waited on briefly; if it is still running, the page is served from
+        # what exists and the prefetch finishes in the background
+        prefetch_running = await feed_prefetcher.wait(current_user.id)
+        
+        # First, check if we have enough existing AI-generated recipes for this user,
+        # private ones and shared ones assigned to them
+        query = text(f"""
             SELECT id, title, description, ingredients, instructions, 
                    cooking_time, difficulty, cuisine, dietary_restrictions,
                    is_ai_generated, generated_for_user_id
             FROM recipes
-            WHERE generated_for_user_id = :user_id AND is_ai_generated = 1
-            ORDER BY id DESC
+            WHERE {USER_FEED_CONDITION}
+            ORDER BY {USER_FEED_ORDER}
             LIMIT :limit OFFSET :offset
         """)
         
@@ -330,8 +481,14 @@ async def get_user_recommendations(
         
         all_recipes = []
         
-        # If we have enough recipes, use those
-        if len(existing_recipes) >= limit:
+        # If we have enough recipes, use those. While a background feed generation
+        # or a prefetch is running it will fill the feed, so do not generate on top of it
+        if (
+            len(existing_recipes) >= limit
+            or prefetch_running
+            or current_user.id in active_generation_tasks
+            or has_active_job(db, current_user.id)
+        ):
             logger.info(f"Using {len(existing_recipes)} existing recipes (limit={limit})")
             
             # Format them properly
@@ -372,7 +529,14 @@ async def get_user_recommendations(
                     "tags": []
                 })
                 
+            # While the feed is still being generated, fill the first page with the
+            # catalog recipes that best match the user's preferences. Later pages
+            # would only repeat them.
+            if offset == 0 and len(all_recipes) < limit:
+                all_recipes.extend(await _catalog_feed_recipes(db, user_preferences, limit - len(all_recipes)))
+            
             logger.info("Returning existing recipes")
+            feed_prefetcher.page_served(db, current_user.id, offset, limit)
             return all_recipes[:limit]
         
         # If we need more recipes, generate them
@@ -452,8 +616,9 @@ async def get_user_recommendations(
         
         for i in range(needed_recipes):
             try:
-                # If we've had too many failures, use fallback recipes directly
-                if failure_count >= max_failures:
+                # If we've had too many failures, or the request is out of time for
+                # another LLM call, use fallback recipes directly
+                if failure_count >= max_failures or not has_time_for_attempt():
                     # Select a cuisine and meal type
                     cuisine = cuisines[i % len(cuisines)] if cuisines else None
                     meal_type = meal_types[i % len(meal_types)] if meal_types else "dinner"
@@ -501,8 +666,12 @@ async def get_user_recommendations(
                     )
                     
                     db.add(db_recipe)
+                    db.flush()
+                    recipe_pool.append_private(db, current_user.id, db_recipe)
+                    adjust_recipes_count(db, current_user.id, 1)
                     db.commit()
                     db.refresh(db_recipe)
+                    generation_progress.invalidate(current_user.id)
                     
                     # Create response format
                     recipe_response = {
@@ -577,6 +746,7 @@ async def get_user_recommendations(
             logger.info(f"Returning {len(new_recipes)} newly generated recipes (limit was {limit})")
             # Note: We return all generated recipes, even if fewer than the limit, as requested.
             # If you strictly wanted only 'limit' number even if more were generated, use new_recipes[:limit]
+            feed_prefetcher.page_served(db, current_user.id, offset, limit)
             return new_recipes 
         else: 
             # Only executes if needed_recipes was 0 or generation failed completely for all needed recipes
@@ -622,6 +792,10 @@ async def get_user_recommendations(
             
             # Combine new recipes first (will be empty), then the formatted existing ones
             all_recipes_combined = new_recipes + formatted_existing_recipes
+            if offset == 0 and len(all_recipes_combined) < limit:
+                all_recipes_combined.extend(
+                    await _catalog_feed_recipes(db, user_preferences, limit - len(all_recipes_combined))
+                )
             
             logger.info(f"No new recipes were generated or all generations failed. Returning {len(formatted_existing_recipes)} existing recipes (limit was {limit})")
              
@@ -761,7 +935,7 @@ async def get_featured_recipes(
                    is_ai_generated, generated_for_user_id
             FROM recipes
             WHERE is_ai_generated = 0
-            ORDER BY id DESC
+            ORDER BY id
             LIMIT :limit OFFSET 0
         """)
         
@@ -837,21 +1011,111 @@ async def get_featured_recipes(
             detail=f"Failed to get featured recipes: {str(e)}"
         )
 
+def _catalog_recommendations(db: Session, query: str, user_id: int, limit: int) -> List[Dict[str, Any]]:
+    """
+    Recipes from the local catalog matching an exploration query, in the exploration response format
+    """
+    food_item = normalize_query(query)
+    terms = [term for term in food_item.split() if len(term) >= 3]
+    if not terms:
+        return []
+    recipes = db.query(Recipe).filter(
+        or_(*[Recipe.title.ilike(f"%{term}%") | Recipe.cuisine.ilike(f"%{term}%") for term in terms]),
+        # Feeds generated for other users are theirs alone
+        Recipe.generated_for_user_id.is_(None) | (Recipe.generated_for_user_id == user_id)
+    ).order_by(Recipe.id.desc()).limit(limit).all()
+    
+    return [{
+        "name": recipe.title,
+        "description": recipe.description or f"A recipe from our collection that matches {food_item}.",
+        "key_ingredients": recipe.ingredients_list[:6] or ["Various ingredients"],
+        "flavor_profile": ", ".join(recipe.tags_list[:3]) or "Rich and flavorful",
+        "similarity_reason": f"A {recipe.cuisine or 'home-style'} recipe from our collection that matches {food_item}.",
+        "recipe_id": recipe.id
+    } for recipe in recipes]
+
+def _merge_recommendations(limit: int, *sources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Concatenate recommendation lists in order of preference, dropping repeated names
+    """
+    merged = []
+    seen = set()
+    for source in sources:
+        for item in source:
+            name = str(item.get("name", "")).strip().lower()
+            if name in seen:
+                continue
+            seen.add(name)
+            merged.append(item)
+    return merged[:limit]
+
+# LLM explorations still running after their request was answered
+_explore_llm_tasks: Set[asyncio.Task] = set()
+
+def _forget_explore_llm_task(task: asyncio.Task):
+    _explore_llm_tasks.discard(task)
+    # Mark the outcome as retrieved even if no request waited for it
+    if not task.cancelled():
+        task.exception()
+
+def _start_explore_llm(query: str, limit: int) -> asyncio.Task:
+    """
+    Ask the LLM for recommendations in the background. A result that arrives after
+    the request was answered still lands in the explore cache for the next identical query.
+    """
+    async def explore():
+        # Not bound by the deadline of the request that started it
+        with deadline_scope(None):
+            return await get_cuisine_recommendations(query, limit)
+    
+    task = asyncio.create_task(explore())
+    _explore_llm_tasks.add(task)
+    task.add_done_callback(_forget_explore_llm_task)
+    return task
+
+def _explore_wait(seconds: Optional[float]) -> Optional[float]:
+    # Waiting for the LLM never runs past the request's deadline
+    left = remaining()
+    if left is None:
+        return seconds
+    return max(left, 0) if seconds is None else max(min(seconds, left), 0)
+
+# Metrics
+explore_stats = {
+    "requests": 0,
+    "streamed": 0,
+    "catalog_matches": 0,
+    "llm_in_time": 0,
+    "llm_late": 0
+}
+register_stats_provider("explore", lambda: {**explore_stats, "llm_running": len(_explore_llm_tasks)})
+
 @router.post("/explore")
 async def explore_cuisines(
     request: Request,
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """
-    Explore cuisines and dishes based on a natural language query using OpenAI.
+    Explore cuisines and dishes based on a natural language query.
     
     Example: "I want to eat biryani" will return similar dishes with their details.
+    
+    Results come from local data first: matching recipes from the catalog (with
+    their recipe_id) and dishes from the local cuisine knowledge. OpenAI
+    suggestions are merged in if they arrive within EXPLORE_LLM_WAIT_SECONDS;
+    later ones are cached for the next identical query.
+    
+    With "stream": true in the body, or an Accept header of application/x-ndjson,
+    the response is NDJSON: one line with the local results right away, and a
+    final line ("final": true) once the OpenAI suggestions are in or have failed.
     """
     try:
         # Parse the request body
         body = await request.json()
         query = body.get("query", "")
         limit = body.get("limit", 5)
+        stream = bool(body.get("stream")) or "application/x-ndjson" in request.headers.get("accept", "")
         
         # Validate input
         if not query:
@@ -867,12 +1131,57 @@ async def explore_cuisines(
             limit = 10
             
         logger.info(f"Exploring cuisines with query: '{query}', limit: {limit}")
+        explore_stats["requests"] += 1
+        
+        # Start OpenAI first, so a cached answer is ready by the time local results are
+        with llm_request_context(priority=PRIORITY_INTERACTIVE, user_id=current_user.id):
+            llm_task = _start_explore_llm(query, limit)
+        
+        catalog = _catalog_recommendations(db, query, current_user.id, limit)
+        dishes = generate_fallback_recommendations(query, limit)
+        if catalog:
+            explore_stats["catalog_matches"] += 1
+        # Catalog recipes lead, up to their share, so OpenAI suggestions still make the cut
+        catalog_slots = max(1, round(limit * EXPLORE_CATALOG_SHARE))
         
-        # Call OpenAI to get cuisine recommendations
-        recommendations = await get_cuisine_recommendations(query, limit)
+        def merged(suggestions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+            return _merge_recommendations(limit, catalog[:catalog_slots], suggestions, catalog, dishes)
+        
+        def llm_suggestions() -> List[Dict[str, Any]]:
+            if llm_task.cancelled() or llm_task.exception() is not None:
+                return []
+            explore_stats["llm_in_time"] += 1
+            return llm_task.result()
+        
+        if stream:
+            explore_stats["streamed"] += 1
+            
+            async def result_lines():
+                yield json.dumps({"recommendations": merged([]), "final": False}) + "\n"
+                await asyncio.wait({llm_task}, timeout=_explore_wait(None))
+                if llm_task.done():
+                    suggestions = llm_suggestions()
+                else:
+                    explore_stats["llm_late"] += 1
+                    suggestions = []
+                yield json.dumps({"recommendations": merged(suggestions), "final": True}) + "\n"
+            
+            return StreamingResponse(
+                result_lines(),
+                media_type="application/x-ndjson",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+        
+        await asyncio.wait({llm_task}, timeout=_explore_wait(EXPLORE_LLM_WAIT_SECONDS))
+        if llm_task.done():
+            recommendations = merged(llm_suggestions())
+        else:
+            explore_stats["llm_late"] += 1
+            logger.info(f"OpenAI suggestions for '{query}' not ready, answering from local data")
+            recommendations = merged([])
         
         # Log the results
-        logger.info(f"Found {len(recommendations)} cuisine recommendations")
+        logger.info(f"Found {len(recommendations)} cuisine recommendations ({len(catalog)} from the catalog)")
         
         # Return empty list if no recommendations
         if not recommendations:
@@ -891,4 +1200,4 @@ async def explore_cuisines(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to explore cuisines: {str(e)}"
-        ) 
\ No newline at end of file
+        )
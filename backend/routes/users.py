@@ -8,6 +8,7 @@ from models.preference import UserPreference
 from schemas.user import UserResponse
 from schemas.preference import PreferenceCreate, PreferenceResponse
 from utils.auth import get_current_user, get_current_active_user
+from utils.recommendation import invalidate_user_profile
 
 router = APIRouter(tags=["Users"])
 
@@ -97,6 +98,7 @@ async def update_user_preferences(
         db_preferences.cooking_skill_level = preferences.cooking_skill_level
         db_preferences.health_goals = ",".join(preferences.health_goals)
         db_preferences.allergies = ",".join(preferences.allergies)
+        db_preferences.bump_profile_version()
     else:
         # Create new preferences
         db_preferences = UserPreference(
@@ -111,6 +113,7 @@ async def update_user_preferences(
     
     db.commit()
     db.refresh(db_preferences)
+    invalidate_user_profile(user_id)
     
     # Convert the DB model to a dictionary and explicitly use the list properties
     response_data = {
@@ -0,0 +1,15 @@
+"""
+Shared test setup: make the backend packages importable and keep tests off
+the developer's database and caches.
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Set before any backend module reads its configuration
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("EXPLORE_CACHE_PATH", "")
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
@@ -0,0 +1,141 @@
+"""
+Tests for the LLM circuit breaker: opening, half-open probing, closing, and
+what the guard holds against the provider.
+"""
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import utils.circuit_breaker as circuit_breaker
+from utils.circuit_breaker import (
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+
+@pytest.fixture(autouse=True)
+def breaker_config(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "LLM_BREAKER_ENABLED", True)
+    monkeypatch.setattr(circuit_breaker, "LLM_BREAKER_MIN_CALLS", 4)
+    monkeypatch.setattr(circuit_breaker, "LLM_BREAKER_ERROR_RATE", 0.5)
+    monkeypatch.setattr(circuit_breaker, "LLM_BREAKER_SLOW_CALL_SECONDS", 1.0)
+    monkeypatch.setattr(circuit_breaker, "LLM_BREAKER_SLOW_CALL_RATE", 0.8)
+    monkeypatch.setattr(circuit_breaker, "LLM_BREAKER_OPEN_SECONDS", 30.0)
+    monkeypatch.setattr(circuit_breaker, "LLM_BREAKER_HALF_OPEN_PROBES", 2)
+
+def _status_error(status_code):
+    request = httpx.Request("POST", "https://example.invalid")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status_code, request=request))
+
+def _open_breaker():
+    breaker = CircuitBreaker("test")
+    for _ in range(4):
+        breaker.record(0.1, failed=True)
+    assert breaker.state == STATE_OPEN
+    return breaker
+
+def _cool_down(breaker):
+    breaker.opened_at -= circuit_breaker.LLM_BREAKER_OPEN_SECONDS
+
+def test_stays_closed_below_minimum_calls():
+    breaker = CircuitBreaker("test")
+    for _ in range(3):
+        breaker.record(0.1, failed=True)
+    assert breaker.state == STATE_CLOSED
+
+def test_opens_on_error_rate_and_rejects_calls():
+    breaker = _open_breaker()
+    assert breaker.opened == 1
+    with pytest.raises(CircuitOpenError):
+        with breaker.guard():
+            pass
+    assert breaker.rejected == 1
+
+def test_opens_on_slow_call_rate():
+    breaker = CircuitBreaker("test")
+    for _ in range(4):
+        breaker.record(2.0, failed=False)
+    assert breaker.state == STATE_OPEN
+
+def test_half_opens_after_cool_down_and_limits_probes():
+    breaker = _open_breaker()
+    _cool_down(breaker)
+    assert breaker.allow()
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow()
+    # Both probes are in flight
+    assert not breaker.allow()
+
+def test_successful_probes_close_the_breaker():
+    breaker = _open_breaker()
+    _cool_down(breaker)
+    for _ in range(2):
+        with breaker.guard():
+            pass
+    assert breaker.state == STATE_CLOSED
+    assert breaker.stats()["window_calls"] == 0
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = _open_breaker()
+    _cool_down(breaker)
+    with pytest.raises(RuntimeError):
+        with breaker.guard():
+            raise RuntimeError("still down")
+    assert breaker.state == STATE_OPEN
+    assert breaker.opened == 2
+
+def test_client_errors_and_ignored_errors_are_not_failures():
+    breaker = CircuitBreaker("test")
+    for _ in range(4):
+        with pytest.raises(httpx.HTTPStatusError):
+            with breaker.guard():
+                raise _status_error(400)
+        with pytest.raises(KeyError):
+            with breaker.guard(ignore=(KeyError,)):
+                raise KeyError("mine")
+    assert breaker.state == STATE_CLOSED
+    assert breaker.failures == 0
+
+def test_server_errors_and_rate_limits_are_failures():
+    breaker = CircuitBreaker("test")
+    for status_code in (500, 429, 503, 502):
+        with pytest.raises(httpx.HTTPStatusError):
+            with breaker.guard():
+                raise _status_error(status_code)
+    assert breaker.state == STATE_OPEN
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+def test_stream_is_timed_to_its_first_chunk(clock):
+    breaker = CircuitBreaker("test")
+    for _ in range(4):
+        with breaker.guard() as call:
+            clock[0] += 0.1
+            call.stop()
+            # The rest of a long answer, read slowly
+            clock[0] += 5
+    assert breaker.slow_calls == 0
+    assert breaker.state == STATE_CLOSED
+
+def test_call_without_a_stopped_clock_is_timed_to_the_end(clock):
+    breaker = CircuitBreaker("test")
+    with breaker.guard():
+        clock[0] += 5
+    assert breaker.slow_calls == 1
+
+def test_stream_closed_early_is_not_recorded():
+    breaker = _open_breaker()
+    _cool_down(breaker)
+    with pytest.raises(GeneratorExit):
+        with breaker.guard():
+            raise GeneratorExit()
+    # The probe slot is handed back
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow() and breaker.allow()
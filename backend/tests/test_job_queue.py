@@ -0,0 +1,150 @@
+"""
+Tests for the generation job queue: claiming, leases, retries and expiry.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models  # noqa: F401 - registers every table on Base
+from database.database import Base
+from models.generation_job import GenerationJob
+from models.generation_status import GenerationStatus
+from utils.generation_status import STATUS_COMPLETE, STATUS_FAILED, STATUS_QUEUED
+from utils.job_queue import (
+    STATE_FAILED,
+    STATE_PENDING,
+    STATE_RUNNING,
+    STATE_SUCCEEDED,
+    claim_job,
+    enqueue_generation,
+    finish_job,
+    heartbeat,
+    requeue_expired,
+)
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+def _status(db, user_id):
+    return db.query(GenerationStatus).filter(GenerationStatus.user_id == user_id).one().state
+
+def _expire_lease(db, job_id):
+    job = db.get(GenerationJob, job_id)
+    job.lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+
+def test_enqueue_merges_into_the_pending_job(db):
+    first = enqueue_generation(db, 1, preferences_id=10, count=6)
+    second = enqueue_generation(db, 1, preferences_id=11, count=12)
+    assert first.id == second.id
+    assert second.preferences_id == 11
+    assert second.count == 12
+    assert db.query(GenerationJob).count() == 1
+    assert _status(db, 1) == STATUS_QUEUED
+
+def test_claim_leases_the_job_once(db):
+    job = enqueue_generation(db, 1, preferences_id=10, count=6)
+    claimed = claim_job(db, "worker-a")
+    assert claimed.id == job.id
+    assert claimed.state == STATE_RUNNING
+    assert claimed.lease_owner.startswith("worker-a:")
+    assert claimed.lease_expires_at > datetime.utcnow()
+    assert claim_job(db, "worker-b") is None
+
+def test_claim_skips_users_with_a_running_job(db):
+    enqueue_generation(db, 1, preferences_id=10, count=6)
+    claim_job(db, "worker-a")
+    # A newer request for the same user waits for the running one
+    enqueue_generation(db, 1, preferences_id=11, count=6)
+    assert claim_job(db, "worker-a") is None
+    enqueue_generation(db, 2, preferences_id=20, count=6)
+    assert claim_job(db, "worker-a").user_id == 2
+
+def test_finish_records_success(db):
+    enqueue_generation(db, 1, preferences_id=10, count=6)
+    job = claim_job(db, "worker-a")
+    assert finish_job(db, job.id, job.lease_owner) == STATE_SUCCEEDED
+    assert _status(db, 1) == STATUS_COMPLETE
+
+def test_failed_attempt_is_retried_with_backoff_until_max_attempts(db):
+    enqueue_generation(db, 1, preferences_id=10, count=6)
+    job = claim_job(db, "worker-a")
+    assert finish_job(db, job.id, job.lease_owner, error="boom") == STATE_PENDING
+    retried = db.get(GenerationJob, job.id)
+    assert retried.run_after > datetime.utcnow()
+    assert _status(db, 1) == STATUS_QUEUED
+    # Not runnable until the backoff has passed
+    assert claim_job(db, "worker-a") is None
+
+    retried.attempts = retried.max_attempts - 1
+    retried.run_after = datetime.utcnow()
+    db.commit()
+    job = claim_job(db, "worker-a")
+    assert finish_job(db, job.id, job.lease_owner, error="boom") == STATE_FAILED
+    assert _status(db, 1) == STATUS_FAILED
+
+def test_heartbeat_extends_only_the_owners_lease(db):
+    enqueue_generation(db, 1, preferences_id=10, count=6)
+    job = claim_job(db, "worker-a")
+    assert heartbeat(db, job.id, job.lease_owner)
+    assert not heartbeat(db, job.id, "worker-b:00000000")
+
+def test_expired_lease_is_requeued_and_claimable(db):
+    enqueue_generation(db, 1, preferences_id=10, count=6)
+    job = claim_job(db, "worker-a")
+    _expire_lease(db, job.id)
+
+    assert requeue_expired(db) == 1
+    requeued = db.get(GenerationJob, job.id)
+    assert requeued.state == STATE_PENDING
+    assert requeued.attempts == 1
+    assert requeued.last_error == "Lease expired"
+
+    reclaimed = claim_job(db, "worker-b")
+    assert reclaimed.id == job.id
+    # The old worker has lost its lease and can no longer record an outcome
+    assert not heartbeat(db, job.id, job.lease_owner)
+    assert finish_job(db, job.id, job.lease_owner) is None
+    assert finish_job(db, job.id, reclaimed.lease_owner) == STATE_SUCCEEDED
+
+def test_live_lease_is_not_requeued(db):
+    enqueue_generation(db, 1, preferences_id=10, count=6)
+    claim_job(db, "worker-a")
+    assert requeue_expired(db) == 0
+
+def test_expired_job_superseded_by_a_pending_one_is_failed(db):
+    enqueue_generation(db, 1, preferences_id=10, count=6)
+    job = claim_job(db, "worker-a")
+    newer = enqueue_generation(db, 1, preferences_id=11, count=6)
+    _expire_lease(db, job.id)
+
+    assert requeue_expired(db) == 0
+    assert db.get(GenerationJob, job.id).state == STATE_FAILED
+    assert db.get(GenerationJob, newer.id).state == STATE_PENDING
+    assert _status(db, 1) == STATUS_QUEUED
+
+def test_generation_still_running_locally_fails_the_attempt():
+    from routes.preferences import _generate_recipes_for_user
+    from utils.state_manager import active_generation_tasks
+
+    active_generation_tasks[1] = True
+    try:
+        # Raising lets the queue retry the job instead of marking it succeeded
+        with pytest.raises(RuntimeError):
+            asyncio.run(_generate_recipes_for_user(1, 10, 6, None))
+        # The running attempt keeps its marker
+        assert active_generation_tasks.get(1) is True
+    finally:
+        active_generation_tasks.pop(1, None)
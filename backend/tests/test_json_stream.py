@@ -0,0 +1,59 @@
+"""
+Tests for the tolerant JSON parser and the streaming helpers built on it.
+"""
+import json
+import os
+
+import pytest
+
+from utils.json_stream import JSONObjectStream, TolerantJSONParser, parse_json_values
+from utils.openai_helper import extract_json_from_response
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "llm_output_corpus.json")
+
+with open(CORPUS_PATH, "r", encoding="utf-8") as f:
+    CORPUS = json.load(f)["cases"]
+
+@pytest.mark.parametrize("case", CORPUS, ids=[case["name"] for case in CORPUS])
+def test_corpus_response_parses_to_expected_value(case):
+    assert extract_json_from_response(case["response"]) == case["expected"]
+
+def _parse_in_chunks(text, size):
+    parser = TolerantJSONParser()
+    values = []
+    for i in range(0, len(text), size):
+        values.extend(parser.feed(text[i:i + size]))
+    values.extend(parser.close())
+    return values
+
+@pytest.mark.parametrize("case", CORPUS, ids=[case["name"] for case in CORPUS])
+def test_corpus_parses_the_same_in_small_chunks(case):
+    assert _parse_in_chunks(case["response"], 7) == _parse_in_chunks(case["response"], len(case["response"]))
+
+def test_missing_comma_after_number_starts_next_member():
+    assert parse_json_values('{"slot": 1 "title": "Soup"}') == [{"slot": 1, "title": "Soup"}]
+
+def test_unparseable_text_gives_empty_dict():
+    assert extract_json_from_response("Sorry, I can't help with that.") == {}
+
+def test_object_stream_emits_each_array_element_as_it_closes():
+    stream = JSONObjectStream()
+    assert stream.feed('```json\n[{"slot": 0, "title": "A"}, {"slot"') == [{"slot": 0, "title": "A"}]
+    assert stream.feed(': 1, "title": "B"}') == [{"slot": 1, "title": "B"}]
+    assert stream.feed("]\n```") == []
+
+def test_object_stream_repairs_malformed_objects():
+    stream = JSONObjectStream()
+    objects = stream.feed("[{'title': 'A', 'ingredients': [1 cup rice, salt,],}, {\"slot\": 1 \"title\": \"B\"}]")
+    assert objects == [
+        {"title": "A", "ingredients": ["1 cup rice", "salt"]},
+        {"slot": 1, "title": "B"}
+    ]
+
+def test_object_stream_keeps_nested_objects_inside_their_parent():
+    stream = JSONObjectStream()
+    assert stream.feed('{"recipes": [{"a": 1}]} {"b": 2}') == [{"recipes": [{"a": 1}]}, {"b": 2}]
+
+def test_object_stream_never_emits_an_unfinished_object():
+    stream = JSONObjectStream()
+    assert stream.feed('[{"title": "A"}, {"title": "trunc') == [{"title": "A"}]
@@ -0,0 +1,51 @@
+"""
+Tests for the catalog recommender's compiled preference profiles.
+"""
+from utils.recommendation import RecipeRecommender, profile_cache
+
+def _recipe(recipe_id, title, vegetarian, cook_time=20):
+    return {
+        "id": recipe_id,
+        "title": title,
+        "description": "",
+        "cuisine_type": "italian",
+        "ingredients": ["tomato", "basil"],
+        "instructions": "Cook it",
+        "prep_time": 5,
+        "cook_time": cook_time,
+        "difficulty": "easy",
+        "vegetarian": vegetarian,
+        "vegan": False,
+        "gluten_free": False,
+        "dairy_free": False,
+        "nut_free": False
+    }
+
+VEGETARIAN_USER = {"favorite_cuisines": ["italian"], "dietary_restrictions": ["vegetarian"]}
+
+def _recommend(recipes):
+    return RecipeRecommender().fit(recipes).get_user_recommendations(
+        VEGETARIAN_USER, top_n=5, user_id=1, profile_version=1
+    )
+
+def test_filter_field_edit_invalidates_the_compiled_profile():
+    profile_cache.clear()
+    before = [_recipe(1, "Tomato Pasta", True), _recipe(2, "Meat Sauce", False)]
+    assert [recipe["id"] for recipe in _recommend(before)] == [1]
+
+    # Only a dietary flag changes; the indexed text is identical
+    after = [_recipe(1, "Tomato Pasta", True), _recipe(2, "Meat Sauce", True)]
+    assert sorted(recipe["id"] for recipe in _recommend(after)) == [1, 2]
+
+def test_cooking_time_edit_changes_the_fingerprint():
+    first = RecipeRecommender().fit([_recipe(1, "Tomato Pasta", True, cook_time=20)])
+    second = RecipeRecommender().fit([_recipe(1, "Tomato Pasta", True, cook_time=90)])
+    assert first.corpus_fingerprint != second.corpus_fingerprint
+
+def test_unchanged_catalog_reuses_the_compiled_profile():
+    profile_cache.clear()
+    recipes = [_recipe(1, "Tomato Pasta", True), _recipe(2, "Meat Sauce", False)]
+    _recommend(recipes)
+    hits = profile_cache.hits
+    _recommend(recipes)
+    assert profile_cache.hits == hits + 1
@@ -0,0 +1,225 @@
+"""
+Tests for single-flight coalescing: sharing, cancellation, errors and the
+isolation of the shared call from the caller that started it.
+"""
+import asyncio
+
+import pytest
+
+from utils.deadline import DEADLINE_RESERVE_SECONDS, DeadlineExceeded, deadline_scope, request_deadline
+from utils.llm_scheduler import PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, llm_priority, llm_request_context, llm_user
+from utils.single_flight import SingleFlight
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight("test")
+        runs = 0
+
+        async def call():
+            nonlocal runs
+            runs += 1
+            await asyncio.sleep(0.01)
+            return {"value": 1}
+
+        results = await asyncio.gather(*(flight.do("k", call) for _ in range(5)))
+        return flight, runs, results
+
+    flight, runs, results = asyncio.run(scenario())
+    assert runs == 1
+    assert results == [{"value": 1}] * 5
+    assert flight.executions == 1
+    assert flight.coalesced == 4
+    assert flight.stats()["in_flight"] == 0
+
+def test_exception_reaches_every_waiter_and_clears_the_flight():
+    async def scenario():
+        flight = SingleFlight("test")
+
+        async def call():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        results = await asyncio.gather(*(flight.do("k", call) for _ in range(3)), return_exceptions=True)
+        return flight, results
+
+    flight, results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.executions == 1
+    assert flight.stats()["in_flight"] == 0
+
+def test_cancelled_waiter_leaves_the_call_running_for_others():
+    async def scenario():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def call():
+            await release.wait()
+            return "done"
+
+        first = asyncio.ensure_future(flight.do("k", call))
+        second = asyncio.ensure_future(flight.do("k", call))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return flight, first, await second
+
+    flight, first, result = asyncio.run(scenario())
+    assert first.cancelled()
+    assert result == "done"
+    assert flight.abandoned == 0
+
+def test_call_is_cancelled_once_every_waiter_is_gone():
+    async def scenario():
+        flight = SingleFlight("test")
+        cancelled = asyncio.Event()
+
+        async def call():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.ensure_future(flight.do("k", call)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        await asyncio.sleep(0)
+        return flight
+
+    flight = asyncio.run(scenario())
+    assert flight.abandoned == 1
+    assert flight.stats()["in_flight"] == 0
+
+def test_shared_call_does_not_inherit_the_starters_deadline_or_user():
+    async def scenario():
+        flight = SingleFlight("test")
+        seen = {}
+
+        async def call():
+            seen["deadline"] = request_deadline.get()
+            seen["user"] = llm_user.get()
+            await asyncio.sleep(0.2)
+            return "done"
+
+        async def short_caller():
+            # Just past the deadline reserve, so the wait starts but ends well before the call
+            with deadline_scope(DEADLINE_RESERVE_SECONDS + 0.05), llm_request_context(user_id=1):
+                return await flight.do("k", call)
+
+        async def patient_caller():
+            await asyncio.sleep(0)
+            return await flight.do("k", call)
+
+        results = await asyncio.gather(short_caller(), patient_caller(), return_exceptions=True)
+        return flight, seen, results
+
+    flight, seen, (short, patient) = asyncio.run(scenario())
+    assert seen == {"deadline": None, "user": None}
+    # The starter's own deadline ends its wait, not the call the other caller is waiting on
+    assert isinstance(short, DeadlineExceeded)
+    assert patient == "done"
+    assert flight.deadline_exceeded == 1
+    assert flight.executions == 1
+
+def test_calls_are_only_shared_within_a_priority_class():
+    async def scenario():
+        flight = SingleFlight("test")
+        priorities = []
+
+        async def call():
+            priorities.append(llm_priority.get())
+            await asyncio.sleep(0.01)
+            return "done"
+
+        async def caller(priority):
+            with llm_request_context(priority=priority):
+                return await flight.do("k", call)
+
+        await asyncio.gather(caller(PRIORITY_PREFETCH), caller(PRIORITY_INTERACTIVE), caller(PRIORITY_INTERACTIVE))
+        return flight, priorities
+
+    flight, priorities = asyncio.run(scenario())
+    assert sorted(priorities) == sorted([PRIORITY_PREFETCH, PRIORITY_INTERACTIVE])
+    assert flight.executions == 2
+    assert flight.coalesced == 1
+
+def test_expired_deadline_fails_before_starting_the_call():
+    async def scenario():
+        flight = SingleFlight("test")
+
+        async def call():
+            return "done"
+
+        with deadline_scope(0):
+            return await flight.do("k", call)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(scenario())
+
+def test_caller_after_an_abandoned_call_starts_a_new_one():
+    async def scenario():
+        flight = SingleFlight("test")
+
+        async def call():
+            await asyncio.sleep(0.01)
+            return "done"
+
+        with deadline_scope(0):
+            with pytest.raises(DeadlineExceeded):
+                await flight.do("k", call)
+        return flight, await flight.do("k", call)
+
+    flight, result = asyncio.run(scenario())
+    assert result == "done"
+    assert flight.executions == 2
+
+def test_waiter_out_of_time_gets_the_fallback_recipe(monkeypatch):
+    import utils.openai_helper as openai_helper
+
+    async def slow_generation(*args):
+        await asyncio.sleep(0.3)
+        return {"title": "Shared Dish"}
+
+    monkeypatch.setattr(openai_helper, "_generate_recipe", slow_generation)
+
+    async def scenario():
+        async def request(deadline):
+            with deadline_scope(deadline):
+                return await openai_helper.generate_recipe(["Italian"], [], {}, "dinner", "medium", 30)
+
+        patient = asyncio.ensure_future(request(None))
+        await asyncio.sleep(0)
+        short = await request(DEADLINE_RESERVE_SECONDS + 0.05)
+        return short, await patient
+
+    short, patient = asyncio.run(scenario())
+    assert short["title"] != "Shared Dish"
+    assert short["ingredients"]
+    assert patient == {"title": "Shared Dish"}
+
+def test_waiter_out_of_time_gets_fallback_recommendations(monkeypatch):
+    import utils.openai_helper as openai_helper
+
+    async def slow_recommendations(*args):
+        await asyncio.sleep(0.3)
+        return [{"name": "Shared"}]
+
+    monkeypatch.setattr(openai_helper, "_get_cuisine_recommendations", slow_recommendations)
+
+    async def scenario():
+        async def request(deadline):
+            with deadline_scope(deadline):
+                return await openai_helper.get_cuisine_recommendations("I want to eat biryani", 3)
+
+        patient = asyncio.ensure_future(request(None))
+        await asyncio.sleep(0)
+        short = await request(DEADLINE_RESERVE_SECONDS + 0.05)
+        return short, await patient
+
+    short, patient = asyncio.run(scenario())
+    assert short and short != [{"name": "Shared"}]
+    assert patient == [{"name": "Shared"}]
@@ -1,4 +1,6 @@
-from fastapi import Depends, HTTPException, status
+import os
+import secrets
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
@@ -11,6 +13,9 @@ from utils.security import SECRET_KEY, ALGORITHM
 # OAuth2 scheme for token verification - ensure the tokenUrl matches your routes
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
+# Shared secret for scraping /metrics; when unset, any signed-in active user may read it
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     """
     Decodes and validates JWT token to authenticate current user
@@ -51,4 +56,16 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
     """
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user 
\ No newline at end of file
+    return current_user
+
+async def require_metrics_access(request: Request, db: Session = Depends(get_db)):
+    """
+    Guards /metrics: with METRICS_TOKEN set, the X-Metrics-Token header must match it;
+    otherwise the caller must be an authenticated, active user
+    """
+    if METRICS_TOKEN:
+        if not secrets.compare_digest(request.headers.get("x-metrics-token", ""), METRICS_TOKEN):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid metrics token")
+        return
+    token = await oauth2_scheme(request)
+    await get_current_active_user(await get_current_user(token, db))
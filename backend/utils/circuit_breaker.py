@@ -0,0 +1,323 @@
+"""
+Circuit breakers and a retry budget for the OpenAI code paths.
+
+Each model gets a breaker that watches a rolling window of calls. When the
+error rate or the share of slow calls crosses its threshold the breaker opens,
+and calls fail immediately with CircuitOpenError so callers serve their local
+fallback at once instead of waiting for a timeout. After a cool-down the
+breaker half-opens and lets a few probe calls through; if they all succeed it
+closes again, otherwise it reopens.
+
+A streamed call is timed to its first chunk: how long the whole stream takes
+depends on the length of the answer and on how fast the consumer reads it,
+not on the provider's health.
+
+The retry budget caps retries to a fraction of recent requests, so retries
+cannot multiply load while the provider is struggling.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import httpx
+from tenacity import retry_base
+
+from utils.metrics import register_stats_provider
+
+logger = logging.getLogger(__name__)
+
+# Breaker configuration
+LLM_BREAKER_ENABLED = os.getenv("LLM_BREAKER_ENABLED", "true").lower() == "true"
+LLM_BREAKER_WINDOW_SECONDS = float(os.getenv("LLM_BREAKER_WINDOW_SECONDS", "60"))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+LLM_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("LLM_BREAKER_SLOW_CALL_SECONDS", "20"))
+LLM_BREAKER_SLOW_CALL_RATE = float(os.getenv("LLM_BREAKER_SLOW_CALL_RATE", "0.8"))
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+LLM_BREAKER_HALF_OPEN_PROBES = int(os.getenv("LLM_BREAKER_HALF_OPEN_PROBES", "2"))
+
+# Retry budget configuration
+LLM_RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.2"))
+LLM_RETRY_BUDGET_MIN_RETRIES = int(os.getenv("LLM_RETRY_BUDGET_MIN_RETRIES", "3"))
+LLM_RETRY_BUDGET_WINDOW_SECONDS = float(os.getenv("LLM_RETRY_BUDGET_WINDOW_SECONDS", "10"))
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of making a call while the breaker is open
+    """
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+def counts_as_failure(error: BaseException) -> bool:
+    """
+    Whether an error says something about the provider's health
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        # Client errors other than rate limiting are our own mistakes
+        status_code = error.response.status_code
+        return status_code >= 500 or status_code == 429
+    return True
+
+class _BreakerCall:
+    __slots__ = ("started", "stopped")
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.stopped: Optional[float] = None
+
+    def start(self):
+        """
+        Restart the latency clock, e.g. after waiting in a queue
+        """
+        self.started = time.monotonic()
+
+    def stop(self):
+        """
+        Stop the latency clock, e.g. when the first chunk of a stream arrives
+        """
+        if self.stopped is None:
+            self.stopped = time.monotonic()
+
+    def latency(self) -> float:
+        return (self.stopped if self.stopped is not None else time.monotonic()) - self.started
+
+class CircuitBreaker:
+    """
+    Rolling-window breaker over error rate and slow-call rate
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.state = STATE_CLOSED
+        self.opened_at = 0.0
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+        # Metrics
+        self.opened = 0
+        self.rejected = 0
+        self.successes = 0
+        self.failures = 0
+        self.slow_calls = 0
+
+    def _trim(self, now: float):
+        while self._calls and self._calls[0][0] < now - LLM_BREAKER_WINDOW_SECONDS:
+            self._calls.popleft()
+
+    def _rates(self) -> Tuple[int, float, float]:
+        total = len(self._calls)
+        if not total:
+            return 0, 0.0, 0.0
+        failures = sum(1 for _, failed, _ in self._calls if failed)
+        slow = sum(1 for _, _, is_slow in self._calls if is_slow)
+        return total, failures / total, slow / total
+
+    def retry_after(self) -> float:
+        if self.state != STATE_OPEN:
+            return 0.0
+        return max(self.opened_at + LLM_BREAKER_OPEN_SECONDS - time.monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        """
+        Whether a call may go out now; a half-open breaker admits a few probes
+        """
+        if not LLM_BREAKER_ENABLED:
+            return True
+        if self.state == STATE_OPEN:
+            if self.retry_after() > 0:
+                self.rejected += 1
+                return False
+            self.state = STATE_HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+            logger.info(f"Circuit '{self.name}' half-open, probing")
+        if self.state == STATE_HALF_OPEN:
+            if self._probes_in_flight + self._probe_successes >= LLM_BREAKER_HALF_OPEN_PROBES:
+                self.rejected += 1
+                return False
+            self._probes_in_flight += 1
+        return True
+
+    def _open(self, reason: str):
+        self.state = STATE_OPEN
+        self.opened_at = time.monotonic()
+        self.opened += 1
+        self._calls.clear()
+        logger.warning(f"Circuit '{self.name}' opened: {reason}")
+
+    def record(self, latency: float, failed: bool):
+        """
+        Record the outcome of an admitted call
+        """
+        is_slow = latency >= LLM_BREAKER_SLOW_CALL_SECONDS
+        if failed:
+            self.failures += 1
+        else:
+            self.successes += 1
+        if is_slow:
+            self.slow_calls += 1
+        if not LLM_BREAKER_ENABLED:
+            return
+
+        if self.state == STATE_HALF_OPEN:
+            self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+            if failed or is_slow:
+                self._open("probe failed")
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= LLM_BREAKER_HALF_OPEN_PROBES:
+                self.state = STATE_CLOSED
+                self._calls.clear()
+                logger.info(f"Circuit '{self.name}' closed after successful probes")
+            return
+        if self.state == STATE_OPEN:
+            # A call admitted before the breaker opened
+            return
+
+        now = time.monotonic()
+        self._calls.append((now, failed, is_slow))
+        self._trim(now)
+        total, error_rate, slow_rate = self._rates()
+        if total < LLM_BREAKER_MIN_CALLS:
+            return
+        if error_rate >= LLM_BREAKER_ERROR_RATE:
+            self._open(f"error rate {error_rate:.0%} over {total} calls")
+        elif slow_rate >= LLM_BREAKER_SLOW_CALL_RATE:
+            self._open(f"slow call rate {slow_rate:.0%} over {total} calls")
+
+    def release(self):
+        """
+        Forget an admitted call whose outcome says nothing about the provider
+        """
+        if self.state == STATE_HALF_OPEN:
+            self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+
+    @contextmanager
+    def guard(self, ignore: Tuple[type, ...] = ()):
+        """
+        Admit a call or raise CircuitOpenError, and record how the call went.
+        Errors of the ignored types are not held against the provider.
+        """
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after())
+        call = _BreakerCall()
+        try:
+            yield call
+        except asyncio.CancelledError:
+            # Abandoned by the caller; only a call that already ran long is telling
+            latency = call.latency()
+            if latency >= LLM_BREAKER_SLOW_CALL_SECONDS:
+                self.record(latency, failed=False)
+            else:
+                self.release()
+            raise
+        except ignore:
+            self.release()
+            raise
+        except Exception as e:
+            self.record(call.latency(), failed=counts_as_failure(e))
+            raise
+        except BaseException:
+            # E.g. a streaming consumer closing the generator early
+            self.release()
+            raise
+        else:
+            self.record(call.latency(), failed=False)
+
+    def stats(self) -> Dict[str, Any]:
+        self._trim(time.monotonic())
+        total, error_rate, slow_rate = self._rates()
+        return {
+            "state": self.state,
+            "retry_after_seconds": round(self.retry_after(), 1),
+            "window_calls": total,
+            "window_error_rate": error_rate,
+            "window_slow_call_rate": slow_rate,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "successes": self.successes,
+            "failures": self.failures,
+            "slow_calls": self.slow_calls
+        }
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """
+    Return the breaker for a model (or other dependency), creating it on first use
+    """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = CircuitBreaker(name)
+        _breakers[name] = breaker
+    return breaker
+
+class RetryBudget:
+    """
+    Allows retries up to a fraction of the requests made in a sliding window
+    """
+    def __init__(self, ratio: float = LLM_RETRY_BUDGET_RATIO, min_retries: int = LLM_RETRY_BUDGET_MIN_RETRIES,
+                 window_seconds: float = LLM_RETRY_BUDGET_WINDOW_SECONDS):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window_seconds = window_seconds
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+
+        # Metrics
+        self.retries_allowed = 0
+        self.retries_denied = 0
+
+    def _trim(self, now: float):
+        for events in (self._requests, self._retries):
+            while events and events[0] < now - self.window_seconds:
+                events.popleft()
+
+    def record_request(self):
+        self._requests.append(time.monotonic())
+
+    def try_spend(self) -> bool:
+        """
+        Take one retry from the budget if there is room
+        """
+        now = time.monotonic()
+        self._trim(now)
+        if len(self._retries) < self.min_retries + self.ratio * len(self._requests):
+            self._retries.append(now)
+            self.retries_allowed += 1
+            return True
+        self.retries_denied += 1
+        logger.warning("Retry budget exhausted, not retrying")
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        self._trim(time.monotonic())
+        return {
+            "window_requests": len(self._requests),
+            "window_retries": len(self._retries),
+            "retries_allowed": self.retries_allowed,
+            "retries_denied": self.retries_denied
+        }
+
+llm_retry_budget = RetryBudget()
+
+class retry_if_budget_allows(retry_base):
+    """
+    Tenacity retry condition that spends from the LLM retry budget.
+    Combine it last with '&' so the budget is only spent on retryable errors.
+    """
+    def __call__(self, retry_state) -> bool:
+        return llm_retry_budget.try_spend()
+
+register_stats_provider("circuit_breakers", lambda: {name: b.stats() for name, b in _breakers.items()})
+register_stats_provider("retry_budget", llm_retry_budget.stats)
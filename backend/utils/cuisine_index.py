@@ -0,0 +1,256 @@
+"""
+Precompiled local cuisine knowledge used by the exploration fallback.
+
+The dish data lives in data/cuisine_dishes.json (plus any files listed in
+CUISINE_DATA_PATHS) and is compiled once per process into:
+- a trie over dish-name tokens, so "biry" or "tacos" still find their dishes
+- ingredient token -> dish postings
+- a cuisine x cuisine similarity matrix derived from shared ingredients
+- keyword -> cuisine affinities for foods that are not dishes in the data
+"""
+import os
+import re
+import json
+import logging
+from typing import List, Dict, Any, Optional, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CUISINE_DATA_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cuisine_dishes.json"
+)
+# Additional data files, separated by os.pathsep, merged over the default one
+CUISINE_DATA_PATHS = os.getenv("CUISINE_DATA_PATHS", "")
+
+# Scores assigned to a cuisine by the kind of match found for a query token
+DISH_NAME_MATCH_SCORE = 0.9
+INGREDIENT_MATCH_SCORE = 0.7
+DEFAULT_CUISINE_SCORE = 0.3
+# How much of a directly matched cuisine's score flows to similar cuisines
+SIMILARITY_PROPAGATION = 0.8
+# Shortest query token allowed to match dish names by prefix
+MIN_PREFIX_LENGTH = 4
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def _stem(token: str) -> str:
+    # Crude plural folding, applied identically to data and queries
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(token) for token in _TOKEN_PATTERN.findall((text or "").lower())]
+
+class _TrieNode:
+    __slots__ = ("children", "exact", "below")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        # Dishes whose name contains exactly this token
+        self.exact: Set[int] = set()
+        # Dishes whose name contains a token starting with this prefix
+        self.below: Set[int] = set()
+
+class DishNameTrie:
+    """
+    Trie over the tokens of dish names
+    """
+    def __init__(self):
+        self.root = _TrieNode()
+
+    def insert(self, token: str, dish_id: int):
+        node = self.root
+        for char in token:
+            node = node.children.setdefault(char, _TrieNode())
+            node.below.add(dish_id)
+        node.exact.add(dish_id)
+
+    def match(self, token: str) -> Tuple[Set[int], Set[int]]:
+        """
+        Return (exact matches, prefix-only matches) for a query token
+        """
+        node = self.root
+        for char in token:
+            node = node.children.get(char)
+            if node is None:
+                return set(), set()
+        if len(token) < MIN_PREFIX_LENGTH:
+            return node.exact, set()
+        return node.exact, node.below - node.exact
+
+class CuisineIndex:
+    """
+    Compiled, read-only view of the local cuisine knowledge
+    """
+    def __init__(self, cuisines: Dict[str, List[Dict[str, Any]]], keyword_affinities: Dict[str, Dict[str, float]]):
+        self.cuisine_names: List[str] = list(cuisines.keys())
+        self.cuisine_ids = {name: i for i, name in enumerate(self.cuisine_names)}
+
+        self.dishes: List[Dict[str, Any]] = []
+        self.dish_cuisine: List[int] = []
+        self.dishes_by_cuisine: List[List[int]] = [[] for _ in self.cuisine_names]
+        self.name_trie = DishNameTrie()
+        self.ingredient_postings: Dict[str, Set[int]] = {}
+
+        for cuisine, dishes in cuisines.items():
+            cuisine_id = self.cuisine_ids[cuisine]
+            for dish in dishes:
+                dish_id = len(self.dishes)
+                self.dishes.append(dish)
+                self.dish_cuisine.append(cuisine_id)
+                self.dishes_by_cuisine[cuisine_id].append(dish_id)
+                for token in tokenize(dish["name"]):
+                    self.name_trie.insert(token, dish_id)
+                for ingredient in dish.get("key_ingredients", []):
+                    for token in tokenize(ingredient):
+                        self.ingredient_postings.setdefault(token, set()).add(dish_id)
+
+        self.keyword_affinities = {
+            _stem(keyword.lower()): {c: float(score) for c, score in affinities.items() if c in self.cuisine_ids}
+            for keyword, affinities in keyword_affinities.items()
+        }
+        self.similarity = self._build_similarity_matrix()
+
+    def _build_similarity_matrix(self) -> np.ndarray:
+        """
+        Cosine similarity between cuisines over their ingredient tokens
+        """
+        vocabulary = {token: i for i, token in enumerate(self.ingredient_postings)}
+        profiles = np.zeros((len(self.cuisine_names), max(len(vocabulary), 1)), dtype=np.float32)
+        for token, dish_ids in self.ingredient_postings.items():
+            for dish_id in dish_ids:
+                profiles[self.dish_cuisine[dish_id], vocabulary[token]] += 1.0
+
+        norms = np.linalg.norm(profiles, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        profiles /= norms
+        similarity = profiles @ profiles.T
+        np.fill_diagonal(similarity, 0.0)
+        return similarity
+
+    def recommend(self, query: str, food_item: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Rank dishes for a query and return them in the exploration response format
+        """
+        cuisine_scores = np.zeros(len(self.cuisine_names), dtype=np.float32)
+        dish_scores: Dict[int, float] = {}
+        name_matches: Set[int] = set()
+        ingredient_matches: Dict[int, str] = {}
+        direct_match = False
+
+        for token in tokenize(query):
+            exact, prefix = self.name_trie.match(token)
+            for dish_id in exact:
+                dish_scores[dish_id] = dish_scores.get(dish_id, 0.0) + 1.0
+            for dish_id in prefix:
+                dish_scores[dish_id] = dish_scores.get(dish_id, 0.0) + 0.8
+            for dish_id in exact | prefix:
+                name_matches.add(dish_id)
+                cuisine_id = self.dish_cuisine[dish_id]
+                cuisine_scores[cuisine_id] = max(cuisine_scores[cuisine_id], DISH_NAME_MATCH_SCORE)
+                direct_match = True
+
+            for dish_id in self.ingredient_postings.get(token, ()):
+                dish_scores[dish_id] = dish_scores.get(dish_id, 0.0) + 0.5
+                ingredient_matches.setdefault(dish_id, token)
+                cuisine_id = self.dish_cuisine[dish_id]
+                cuisine_scores[cuisine_id] = max(cuisine_scores[cuisine_id], INGREDIENT_MATCH_SCORE)
+                direct_match = True
+
+            for cuisine, score in self.keyword_affinities.get(token, {}).items():
+                cuisine_id = self.cuisine_ids[cuisine]
+                cuisine_scores[cuisine_id] = max(cuisine_scores[cuisine_id], score)
+
+        if direct_match:
+            # Let cuisines that share ingredients with the matches come next
+            propagated = (self.similarity * cuisine_scores[:, None]).max(axis=0) * SIMILARITY_PROPAGATION
+            cuisine_scores = np.maximum(cuisine_scores, propagated)
+        elif not cuisine_scores.any():
+            cuisine_scores[:] = DEFAULT_CUISINE_SCORE
+
+        # Stable sort keeps data-file order between equally scored cuisines
+        ranked_cuisines = [int(i) for i in np.argsort(-cuisine_scores, kind="stable") if cuisine_scores[i] > 0]
+
+        recommendations = []
+        for cuisine_id in ranked_cuisines:
+            if len(recommendations) >= limit:
+                break
+            cuisine = self.cuisine_names[cuisine_id]
+            dish_ids = sorted(self.dishes_by_cuisine[cuisine_id], key=lambda d: -dish_scores.get(d, 0.0))
+            for dish_id in dish_ids:
+                if len(recommendations) >= limit:
+                    break
+                recommendation = dict(self.dishes[dish_id])
+                if dish_id in name_matches:
+                    recommendation["similarity_reason"] = f"This is a variation of {food_item} from {cuisine} cuisine."
+                elif dish_id in ingredient_matches:
+                    recommendation["similarity_reason"] = f"This {cuisine} dish is built around {ingredient_matches[dish_id]}, just like {food_item}."
+                else:
+                    recommendation["similarity_reason"] = f"This {cuisine} dish has a similar texture and flavor profile to {food_item}."
+                recommendations.append(recommendation)
+
+        # Fill with generic recommendations from the best matching cuisines
+        for i in range(len(recommendations), limit):
+            if not ranked_cuisines:
+                break
+            cuisine = self.cuisine_names[ranked_cuisines[i % len(ranked_cuisines)]]
+            recommendations.append({
+                "name": f"{cuisine} {['Specialty', 'Delicacy', 'Classic', 'Favorite'][i % 4]}",
+                "description": f"A traditional {cuisine} dish with flavors that complement {food_item}.",
+                "key_ingredients": [
+                    f"{['Fresh', 'Aromatic', 'Traditional', 'Local'][i % 4]} ingredients",
+                    f"{cuisine} spices and herbs",
+                    "Regional vegetables",
+                    "Authentic seasonings"
+                ],
+                "flavor_profile": f"{['Rich and aromatic', 'Perfectly balanced', 'Bold and flavorful', 'Delicate and nuanced'][i % 4]}",
+                "similarity_reason": f"Uses cooking techniques and flavor combinations that would appeal to fans of {food_item}."
+            })
+
+        return recommendations[:limit]
+
+def load_cuisine_data(paths: List[str]) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, Dict[str, float]]]:
+    """
+    Load and merge cuisine data files; later files add dishes and override affinities
+    """
+    cuisines: Dict[str, List[Dict[str, Any]]] = {}
+    affinities: Dict[str, Dict[str, float]] = {}
+
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Could not load cuisine data from {path}: {str(e)}")
+            continue
+
+        for cuisine, dishes in data.get("cuisines", {}).items():
+            existing = cuisines.setdefault(cuisine, [])
+            known_names = {dish["name"].lower() for dish in existing}
+            for dish in dishes:
+                if dish.get("name") and dish["name"].lower() not in known_names:
+                    existing.append(dish)
+                    known_names.add(dish["name"].lower())
+
+        for keyword, scores in data.get("keyword_affinities", {}).items():
+            affinities.setdefault(keyword, {}).update(scores)
+
+    return cuisines, affinities
+
+_cuisine_index: Optional[CuisineIndex] = None
+
+def get_cuisine_index() -> CuisineIndex:
+    """
+    Return the process-wide cuisine index, compiling it on first use
+    """
+    global _cuisine_index
+    if _cuisine_index is None:
+        paths = [DEFAULT_CUISINE_DATA_PATH] + [p for p in CUISINE_DATA_PATHS.split(os.pathsep) if p]
+        cuisines, affinities = load_cuisine_data(paths)
+        _cuisine_index = CuisineIndex(cuisines, affinities)
+        logger.info(f"Compiled cuisine index with {len(_cuisine_index.dishes)} dishes "
+                    f"across {len(_cuisine_index.cuisine_names)} cuisines")
+    return _cuisine_index
@@ -0,0 +1,175 @@
+"""
+Per-request deadlines, propagated to LLM calls, retries and database statements.
+
+Every HTTP request gets a deadline when it arrives: the client's own budget
+from the X-Request-Deadline header, or REQUEST_DEADLINE_SECONDS. The
+deadline is held in a context variable, so it follows the request through
+every await and into the tasks it creates. Work that outlives the request,
+such as background prefetches, runs under deadline_scope(None).
+
+Code that waits on something slow sizes its timeout from what is left:
+- LLM calls cap their HTTP timeout and their wait for rate-limit capacity.
+- Retries stop when the next attempt could not finish in time.
+- Database statements get a statement timeout (Postgres) or are
+  interrupted (SQLite) once the deadline itself has passed.
+
+For LLM calls and retries a margin of DEADLINE_RESERVE_SECONDS is kept back,
+so the caller still has time to take its fallback path and respond. Running out raises
+DeadlineExceeded, which the LLM helpers already treat like any other
+failure and answer with their local fallbacks.
+
+X-Request-Deadline holds either the seconds the client will wait, such as
+"8" or "2.5", or an absolute Unix timestamp in seconds.
+"""
+import os
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from tenacity import retry_base
+
+# Deadline configuration
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+# Upper bound on a deadline a client may ask for
+REQUEST_DEADLINE_MAX_SECONDS = float(os.getenv("REQUEST_DEADLINE_MAX_SECONDS", "120"))
+# Time kept back for the fallback path and the response itself
+DEADLINE_RESERVE_SECONDS = float(os.getenv("DEADLINE_RESERVE_SECONDS", "0.5"))
+# A retry is only attempted with at least this much time left after the reserve
+DEADLINE_MIN_ATTEMPT_SECONDS = float(os.getenv("DEADLINE_MIN_ATTEMPT_SECONDS", "1"))
+
+DEADLINE_HEADER = "x-request-deadline"
+
+# Absolute deadline on the time.monotonic() clock; None means no deadline
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when the current request has no time left for the work asked of it
+    """
+    pass
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]):
+    """
+    Run the block with a deadline the given number of seconds from now, or
+    with no deadline at all for None. A block never extends an outer deadline.
+    """
+    if seconds is None:
+        deadline = None
+    else:
+        deadline = time.monotonic() + seconds
+        outer = request_deadline.get()
+        if outer is not None:
+            deadline = min(deadline, outer)
+    token = request_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        request_deadline.reset(token)
+
+def remaining(reserve: float = DEADLINE_RESERVE_SECONDS) -> Optional[float]:
+    """
+    Seconds left before the current deadline, less the reserve; None without a deadline
+    """
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic() - reserve
+
+def timeout_for(default: float) -> float:
+    """
+    The timeout for a call that would normally get `default` seconds, capped by the
+    time left. Raises DeadlineExceeded when there is none.
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline reached")
+    return min(default, left)
+
+def parse_deadline_header(value: str) -> Optional[float]:
+    """
+    Seconds of budget described by an X-Request-Deadline value, or None if it is invalid
+    """
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    # Large values are absolute Unix timestamps rather than durations
+    seconds = number - time.time() if number > 1e9 else number
+    return min(max(seconds, 0.0), REQUEST_DEADLINE_MAX_SECONDS)
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware setting the deadline of each HTTP request
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        seconds = REQUEST_DEADLINE_SECONDS
+        for name, value in scope.get("headers", ()):
+            if name.decode("latin-1").lower() == DEADLINE_HEADER:
+                parsed = parse_deadline_header(value.decode("latin-1"))
+                if parsed is not None:
+                    seconds = parsed
+                break
+        token = request_deadline.set(time.monotonic() + seconds)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_deadline.reset(token)
+
+def has_time_for_attempt() -> bool:
+    """
+    Whether another LLM attempt could still finish before the deadline
+    """
+    left = remaining()
+    return left is None or left >= DEADLINE_MIN_ATTEMPT_SECONDS
+
+class retry_if_deadline_allows(retry_base):
+    """
+    Tenacity retry condition that stops once another attempt could not finish in time.
+    Combine it with '&' like retry_if_budget_allows.
+    """
+    def __call__(self, retry_state) -> bool:
+        return has_time_for_attempt()
+
+def install_statement_deadlines(engine):
+    """
+    Give every statement run on the engine a timeout from the current deadline
+    """
+    if engine.dialect.name == "postgresql":
+        @event.listens_for(engine, "before_cursor_execute")
+        def set_statement_timeout(conn, cursor, statement, parameters, context, executemany):
+            # Statements may use the reserve too: the fallback path still reads and writes
+            left = remaining(reserve=0)
+            # Whole seconds (0 = no timeout), so the setting only changes about once a second
+            timeout_ms = max(math.ceil(left), 1) * 1000 if left is not None else 0
+            # statement_timeout is per connection: only send it when it changes
+            if conn.info.get("statement_timeout_ms") != timeout_ms:
+                cursor.execute(f"SET statement_timeout = {timeout_ms}")
+                conn.info["statement_timeout_ms"] = timeout_ms
+
+        @event.listens_for(engine, "rollback")
+        def forget_statement_timeout(conn):
+            # A rollback also undoes a SET made inside the transaction
+            conn.info.pop("statement_timeout_ms", None)
+
+    elif engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "before_cursor_execute")
+        def set_progress_deadline(conn, cursor, statement, parameters, context, executemany):
+            dbapi_connection = conn.connection.dbapi_connection
+            deadline = request_deadline.get()
+            if deadline is None:
+                dbapi_connection.set_progress_handler(None, 0)
+                return
+            # A non-zero return interrupts the statement with OperationalError
+            dbapi_connection.set_progress_handler(lambda: int(time.monotonic() >= deadline), 10000)
@@ -0,0 +1,336 @@
+"""
+Semantic cache for cuisine exploration queries.
+
+Queries are normalized ("I want biryani", "biryani please" and "Biryani!" all
+become "biryani") and embedded locally with a hashed bag of words and character
+trigrams. A lookup returns the stored recommendations of the nearest cached
+query when its cosine similarity clears the threshold and the dietary
+restrictions and allergies are identical.
+"""
+import os
+import re
+import json
+import time
+import zlib
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from utils.metrics import register_stats_provider
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+EXPLORE_CACHE_PATH = os.getenv("EXPLORE_CACHE_PATH", "./explore_cache.json")
+EXPLORE_CACHE_MAX_ENTRIES = int(os.getenv("EXPLORE_CACHE_MAX_ENTRIES", "2000"))
+EXPLORE_CACHE_TTL_SECONDS = int(os.getenv("EXPLORE_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+EXPLORE_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("EXPLORE_CACHE_SIMILARITY_THRESHOLD", "0.9"))
+# Persist to disk after this many new entries (and always on shutdown). The
+# file is written in a worker thread, never on the event loop.
+EXPLORE_CACHE_SAVE_EVERY = int(os.getenv("EXPLORE_CACHE_SAVE_EVERY", "20"))
+
+# Dimension of the hashed embedding space
+EMBEDDING_DIM = 512
+
+# Words that carry no information about the dish being asked for
+FILLER_WORDS = {
+    "i", "im", "id", "me", "my", "we", "want", "wanna", "would", "like", "love", "to", "eat",
+    "some", "something", "a", "an", "the", "please", "pls", "give", "show", "find", "get",
+    "recommend", "recommendations", "suggest", "suggestions", "similar", "dishes", "dish",
+    "food", "foods", "craving", "crave", "in", "mood", "for", "of", "feel", "feeling",
+    "today", "tonight", "now", "can", "you", "could", "have", "any", "good", "and", "or", "with"
+}
+
+_NON_WORD = re.compile(r"[^a-z0-9\s]+")
+
+def normalize_query(query: str) -> str:
+    """
+    Lowercase, strip punctuation and filler words from an exploration query
+    """
+    words = _NON_WORD.sub(" ", (query or "").lower()).split()
+    content_words = [word for word in words if word not in FILLER_WORDS]
+    # A query made only of filler words still needs a stable key
+    return " ".join(content_words or words)
+
+def _feature_index(feature: str) -> int:
+    return zlib.crc32(feature.encode("utf-8")) % EMBEDDING_DIM
+
+def embed_query(normalized_query: str) -> np.ndarray:
+    """
+    Embed a normalized query as an L2-normalized hashed feature vector
+    """
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for word in normalized_query.split():
+        # Whole words dominate, trigrams make the match robust to typos and plurals
+        vector[_feature_index(f"w:{word}")] += 2.0
+        padded = f"#{word}#"
+        for i in range(len(padded) - 2):
+            vector[_feature_index(f"c:{padded[i:i + 3]}")] += 1.0
+
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+def restrictions_key(dietary_restrictions: Optional[List[str]], allergies: Optional[List[str]]) -> str:
+    """
+    Canonical key for the dietary restrictions and allergies of a query
+    """
+    restrictions = sorted({r.strip().lower() for r in dietary_restrictions or [] if r and r.strip()})
+    allergens = sorted({a.strip().lower() for a in allergies or [] if a and a.strip()})
+    return f"{','.join(restrictions)}|{','.join(allergens)}"
+
+class ExploreCacheEntry:
+    __slots__ = ("normalized_query", "restrictions", "limit", "result", "created_at", "embedding")
+
+    def __init__(self, normalized_query: str, restrictions: str, limit: int,
+                 result: List[Dict[str, Any]], created_at: float):
+        self.normalized_query = normalized_query
+        self.restrictions = restrictions
+        self.limit = limit
+        self.result = result
+        self.created_at = created_at
+        self.embedding = embed_query(normalized_query)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "normalized_query": self.normalized_query,
+            "restrictions": self.restrictions,
+            "limit": self.limit,
+            "result": self.result,
+            "created_at": self.created_at
+        }
+
+class ExploreSemanticCache:
+    """
+    Bounded, TTL-limited LRU cache of exploration results with nearest-neighbour lookup
+    """
+    def __init__(
+        self,
+        path: Optional[str] = EXPLORE_CACHE_PATH,
+        max_entries: int = EXPLORE_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = EXPLORE_CACHE_TTL_SECONDS,
+        similarity_threshold: float = EXPLORE_CACHE_SIMILARITY_THRESHOLD
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[Tuple[str, str], ExploreCacheEntry]" = OrderedDict()
+        # Per restrictions key: (entry keys, embedding matrix), rebuilt lazily after writes
+        self._index: Dict[str, Tuple[List[Tuple[str, str]], np.ndarray]] = {}
+        self._unsaved_writes = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def _is_expired(self, entry: ExploreCacheEntry, now: float) -> bool:
+        return now - entry.created_at > self.ttl_seconds
+
+    def _restriction_index(self, restrictions: str) -> Tuple[List[Tuple[str, str]], np.ndarray]:
+        index = self._index.get(restrictions)
+        if index is None:
+            keys = [key for key, entry in self._entries.items() if entry.restrictions == restrictions]
+            if keys:
+                matrix = np.vstack([self._entries[key].embedding for key in keys])
+            else:
+                matrix = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+            index = (keys, matrix)
+            self._index[restrictions] = index
+        return index
+
+    def _remove(self, key: Tuple[str, str]):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._index.pop(entry.restrictions, None)
+
+    def get(
+        self,
+        query: str,
+        limit: int,
+        dietary_restrictions: Optional[List[str]] = None,
+        allergies: Optional[List[str]] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Return cached recommendations for a semantically equivalent query, if any
+        """
+        normalized = normalize_query(query)
+        restrictions = restrictions_key(dietary_restrictions, allergies)
+        now = time.time()
+
+        keys, matrix = self._restriction_index(restrictions)
+        if not keys:
+            self.misses += 1
+            return None
+
+        similarities = matrix @ embed_query(normalized)
+        # Walk candidates from most to least similar until one is usable
+        for idx in np.argsort(similarities)[::-1]:
+            if similarities[idx] < self.similarity_threshold:
+                break
+            key = keys[idx]
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            if self._is_expired(entry, now):
+                self.expirations += 1
+                self._remove(key)
+                continue
+            if entry.limit < limit:
+                continue
+            self._entries.move_to_end(key)
+            self.hits += 1
+            logger.info(f"Explore cache hit: '{query}' matched '{entry.normalized_query}' "
+                        f"(similarity {similarities[idx]:.3f})")
+            return [dict(item) for item in entry.result[:limit]]
+
+        self.misses += 1
+        return None
+
+    def put(
+        self,
+        query: str,
+        limit: int,
+        result: List[Dict[str, Any]],
+        dietary_restrictions: Optional[List[str]] = None,
+        allergies: Optional[List[str]] = None
+    ):
+        """
+        Store recommendations for a query, evicting the least recently used entries
+        """
+        if not result:
+            return
+        entry = ExploreCacheEntry(
+            normalize_query(query),
+            restrictions_key(dietary_restrictions, allergies),
+            limit,
+            [dict(item) for item in result],
+            time.time()
+        )
+        key = (entry.restrictions, entry.normalized_query)
+        self._remove(key)
+        self._entries[key] = entry
+        self._index.pop(entry.restrictions, None)
+
+        while len(self._entries) > self.max_entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+        self._unsaved_writes += 1
+        if self._unsaved_writes >= EXPLORE_CACHE_SAVE_EVERY:
+            self._schedule_flush()
+
+    def load(self):
+        """
+        Load persisted entries, dropping any that expired while the process was down
+        """
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Could not load explore cache from {self.path}: {str(e)}")
+            return
+
+        now = time.time()
+        loaded = 0
+        for item in stored.get("entries", []):
+            try:
+                entry = ExploreCacheEntry(
+                    item["normalized_query"],
+                    item["restrictions"],
+                    int(item["limit"]),
+                    item["result"],
+                    float(item["created_at"])
+                )
+            except (KeyError, TypeError, ValueError):
+                continue
+            if self._is_expired(entry, now):
+                continue
+            self._entries[(entry.restrictions, entry.normalized_query)] = entry
+            loaded += 1
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._index.clear()
+        logger.info(f"Loaded {loaded} explore cache entries from {self.path}")
+
+    def _snapshot(self) -> Dict[str, Any]:
+        # Entries are never changed after they are stored, so a shallow copy is a consistent snapshot
+        return {"entries": [entry.to_dict() for entry in self._entries.values()]}
+
+    def _write(self, snapshot: Dict[str, Any]) -> bool:
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+            return True
+        except OSError as e:
+            logger.error(f"Could not save explore cache to {self.path}: {str(e)}")
+            return False
+
+    def _schedule_flush(self):
+        if not self.path or (self._flush_task is not None and not self._flush_task.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Outside the event loop (scripts) there is nothing to block
+            self.save()
+            return
+        self._flush_task = loop.create_task(self.flush())
+
+    async def flush(self):
+        """
+        Atomically write the cache to disk from a worker thread
+        """
+        if not self.path:
+            return
+        # The snapshot is taken on the event loop, where the entries are changed
+        snapshot = self._snapshot()
+        written = self._unsaved_writes
+        if await asyncio.to_thread(self._write, snapshot):
+            self._unsaved_writes -= written
+
+    async def close(self):
+        """
+        Wait for a flush in progress, then write what is left
+        """
+        if self._flush_task is not None:
+            await self._flush_task
+            self._flush_task = None
+        if self._unsaved_writes:
+            await self.flush()
+
+    def save(self):
+        """
+        Atomically write the cache to disk, blocking the caller
+        """
+        if not self.path:
+            return
+        written = self._unsaved_writes
+        if self._write(self._snapshot()):
+            self._unsaved_writes -= written
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions
+        }
+
+# Process-wide cache instance
+explore_cache = ExploreSemanticCache()
+register_stats_provider("explore_cache", explore_cache.stats)
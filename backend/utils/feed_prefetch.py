@@ -0,0 +1,175 @@
+"""
+Background preparation of the next page of a user's personalized feed.
+
+When /recommendations/user serves page N, page N+1 is usually requested
+seconds later, and if the feed is too short for it that request generates
+recipes inline while the user waits. After serving a page, the route asks
+the prefetcher to make sure the following page is full. The feed size comes
+from the in-memory generation status, so the check is free. When the feed
+is short, the missing recipes are generated in the background at prefetch
+priority and land in the feed before the next request arrives.
+
+Prefetching is speculative, so it gives way to everything else:
+- each user has a budget of prefetched recipes per sliding window;
+- only one prefetch runs per user, and only PREFETCH_CONCURRENCY overall;
+- nothing starts while interactive or onboarding LLM work is queued, or
+  while the rate limit buckets are low;
+- calls run in the scheduler's prefetch class, so queued ones are
+  preempted by interactive requests.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict
+
+from sqlalchemy.orm import Session
+
+from utils.circuit_breaker import CircuitOpenError
+from utils.deadline import deadline_scope
+from utils.generation_progress import generation_progress
+from utils.llm_scheduler import PRIORITY_PREFETCH, LLMRequestPreempted, llm_request_context, llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Prefetch configuration
+FEED_PREFETCH_ENABLED = os.getenv("FEED_PREFETCH_ENABLED", "true").lower() == "true"
+# Recipes a user may have prefetched per window
+PREFETCH_BUDGET_RECIPES = int(os.getenv("PREFETCH_BUDGET_RECIPES", "10"))
+PREFETCH_BUDGET_WINDOW_SECONDS = float(os.getenv("PREFETCH_BUDGET_WINDOW_SECONDS", "3600"))
+# Prefetches generating at once across all users
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))
+# Share of the LLM rate limit buckets that must be free before a prefetch starts
+PREFETCH_MIN_HEADROOM = float(os.getenv("PREFETCH_MIN_HEADROOM", "0.5"))
+# How long a page request waits for a prefetch of it that is still running,
+# before it is served from what is already in the feed
+PREFETCH_WAIT_SECONDS = float(os.getenv("PREFETCH_WAIT_SECONDS", "1"))
+
+class FeedPrefetcher:
+    """
+    Tops up users' feeds ahead of the page they are about to request
+    """
+    def __init__(self, generate: Callable[[int, int], Awaitable[int]]):
+        # generate(user_id, count) adds up to count recipes to the user's feed
+        # and returns how many it added
+        self.generate = generate
+        self._budgets: Dict[int, Deque[float]] = {}
+        self._running: Dict[int, asyncio.Task] = {}
+
+        # Metrics
+        self.requested = 0
+        self.already_full = 0
+        self.started = 0
+        self.skipped_busy = 0
+        self.skipped_budget = 0
+        self.skipped_running = 0
+        self.waited = 0
+        self.wait_timeouts = 0
+        self.prefetched = 0
+        self.preempted = 0
+        self.failed = 0
+
+    def _budget_left(self, user_id: int) -> int:
+        spent = self._budgets.get(user_id)
+        if spent is None:
+            return PREFETCH_BUDGET_RECIPES
+        cutoff = time.monotonic() - PREFETCH_BUDGET_WINDOW_SECONDS
+        while spent and spent[0] <= cutoff:
+            spent.popleft()
+        if not spent:
+            del self._budgets[user_id]
+            return PREFETCH_BUDGET_RECIPES
+        return PREFETCH_BUDGET_RECIPES - len(spent)
+
+    def _spend(self, user_id: int, count: int):
+        now = time.monotonic()
+        self._budgets.setdefault(user_id, deque()).extend([now] * count)
+
+    def page_served(self, db: Session, user_id: int, offset: int, limit: int):
+        """
+        Prepare the page after the one just served, in the background
+        """
+        if not FEED_PREFETCH_ENABLED:
+            return
+        self.requested += 1
+        if user_id in self._running:
+            self.skipped_running += 1
+            return
+
+        try:
+            status = generation_progress.status(db, user_id)
+        except Exception as e:
+            logger.error(f"Error reading feed status for prefetch: {str(e)}")
+            return
+        # A running generation is already filling the feed
+        if status["is_generating"] or not status["has_preferences"]:
+            return
+        missing = offset + 2 * limit - status["recipes_count"]
+        if missing <= 0:
+            self.already_full += 1
+            return
+
+        count = min(missing, self._budget_left(user_id))
+        if count <= 0:
+            self.skipped_budget += 1
+            return
+        if len(self._running) >= PREFETCH_CONCURRENCY or not llm_scheduler.has_headroom(PREFETCH_MIN_HEADROOM):
+            self.skipped_busy += 1
+            return
+
+        # Charged up front so concurrent pages cannot overspend the budget
+        self._spend(user_id, count)
+        self.started += 1
+        task = asyncio.create_task(self._prefetch(user_id, count))
+        self._running[user_id] = task
+        task.add_done_callback(lambda _: self._running.pop(user_id, None))
+
+    async def wait(self, user_id: int) -> bool:
+        """
+        Give a prefetch already under way for the user a short time to finish before
+        their page is read. Returns whether it is still running afterwards, in which
+        case the page should not generate the same recipes inline.
+        """
+        task = self._running.get(user_id)
+        if task is None:
+            return False
+        self.waited += 1
+        done, _ = await asyncio.wait({task}, timeout=PREFETCH_WAIT_SECONDS)
+        if not done:
+            self.wait_timeouts += 1
+            return True
+        return False
+
+    async def _prefetch(self, user_id: int, count: int):
+        logger.info(f"Prefetching {count} recipes for the next feed page of user {user_id}")
+        try:
+            # The page request that triggered this is long gone by the time it finishes
+            with deadline_scope(None), llm_request_context(priority=PRIORITY_PREFETCH, user_id=user_id):
+                self.prefetched += await self.generate(user_id, count)
+        except LLMRequestPreempted:
+            self.preempted += 1
+            logger.info(f"Prefetch for user {user_id} preempted by interactive traffic")
+        except CircuitOpenError:
+            self.failed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Prefetch for user {user_id} failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": FEED_PREFETCH_ENABLED,
+            "requested": self.requested,
+            "already_full": self.already_full,
+            "started": self.started,
+            "running": len(self._running),
+            "skipped_busy": self.skipped_busy,
+            "skipped_budget": self.skipped_budget,
+            "skipped_running": self.skipped_running,
+            "waited_for": self.waited,
+            "wait_timeouts": self.wait_timeouts,
+            "prefetched_recipes": self.prefetched,
+            "preempted": self.preempted,
+            "failed": self.failed,
+            "budgeted_users": len(self._budgets)
+        }
@@ -0,0 +1,296 @@
+"""
+Incremental reconciliation of a user's AI recipe feed after a preference change.
+
+Instead of regenerating the whole feed, the old and new preferences are
+diffed and every recipe in the feed is checked against what changed, using
+its ingredients, tags and title:
+- added dietary restrictions and allergies: ingredient keyword screening
+- a lower skill level: recipes harder than the new level
+- a shorter cooking time: recipes over the new limit
+- cuisines and meal types: recipes for ones the user no longer picks
+
+Recipes that fail a check are taken out of the feed. The kept recipes are
+then matched to the newly planned (cuisine, meal type) slots, and only the
+slots left open are generated. Kept recipes that fit no slot are surplus
+(e.g. after adding a cuisine) and make room for the new mix.
+"""
+import re
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models.recipe import Recipe
+from utils.recipe_pool import recipe_pool
+
+logger = logging.getLogger(__name__)
+
+_MEAT_AND_FISH = [
+    "chicken", "beef", "pork", "lamb", "mutton", "veal", "venison", "turkey", "duck", "goose",
+    "bacon", "ham", "sausage", "prosciutto", "pancetta", "chorizo", "salami", "pepperoni", "lard",
+    "gelatin", "fish", "fish sauce", "anchovy", "anchovies", "salmon", "tuna", "cod", "tilapia",
+    "halibut", "trout", "sardine", "mackerel", "shrimp", "prawn", "crab", "lobster", "scallop",
+    "clam", "mussel", "oyster", "squid", "calamari", "octopus"
+]
+_DAIRY = [
+    "milk", "cheese", "butter", "buttermilk", "cream", "sour cream", "yogurt", "yoghurt", "ghee",
+    "whey", "parmesan", "mozzarella", "ricotta", "feta", "cheddar", "mascarpone", "paneer", "custard"
+]
+_EGGS = ["egg", "eggs", "mayonnaise", "meringue"]
+_GLUTEN = [
+    "wheat", "flour", "bread", "breadcrumbs", "panko", "pasta", "spaghetti", "linguine", "fettuccine",
+    "penne", "macaroni", "lasagna", "noodle", "couscous", "bulgur", "farro", "barley", "rye", "semolina",
+    "seitan", "soy sauce", "pita", "naan", "tortilla", "cracker", "croissant", "beer"
+]
+_TREE_NUTS = [
+    "almond", "walnut", "pecan", "cashew", "pistachio", "hazelnut", "macadamia", "pine nut",
+    "brazil nut", "praline", "marzipan", "nutella"
+]
+_PEANUTS = ["peanut", "peanut butter"]
+_SHELLFISH = ["shrimp", "prawn", "crab", "lobster", "scallop", "clam", "mussel", "oyster", "crayfish"]
+_FISH = ["fish", "fish sauce", "anchovy", "anchovies", "salmon", "tuna", "cod", "tilapia", "halibut",
+         "trout", "sardine", "mackerel"]
+_SOY = ["soy", "soy sauce", "tofu", "tempeh", "edamame", "miso"]
+_SESAME = ["sesame", "tahini"]
+
+# Ingredients that break a dietary restriction
+RESTRICTION_KEYWORDS = {
+    "vegetarian": _MEAT_AND_FISH,
+    "vegan": _MEAT_AND_FISH + _DAIRY + _EGGS + ["honey"],
+    "pescatarian": [k for k in _MEAT_AND_FISH if k not in _FISH + _SHELLFISH],
+    "gluten-free": _GLUTEN,
+    "dairy-free": _DAIRY,
+    "nut-free": _TREE_NUTS + _PEANUTS,
+    "egg-free": _EGGS
+}
+
+# Ingredients to screen for common allergies; other allergies are matched literally
+ALLERGEN_KEYWORDS = {
+    "dairy": _DAIRY,
+    "milk": _DAIRY,
+    "lactose": _DAIRY,
+    "gluten": _GLUTEN,
+    "wheat": _GLUTEN,
+    "nut": _TREE_NUTS + _PEANUTS,
+    "tree nut": _TREE_NUTS,
+    "peanut": _PEANUTS,
+    "shellfish": _SHELLFISH,
+    "seafood": _SHELLFISH + _FISH,
+    "fish": _FISH,
+    "egg": _EGGS,
+    "soy": _SOY,
+    "sesame": _SESAME
+}
+
+# A match right after one of these words is a substitute, e.g. "almond milk" or "gluten-free pasta"
+_SUBSTITUTE_QUALIFIERS = (
+    "almond", "oat", "soy", "coconut", "rice", "cashew", "vegan", "plant-based", "plant based",
+    "non-dairy", "dairy-free", "gluten-free", "egg-free", "nut-free", "vegetarian", "meatless", "mock"
+)
+
+# Skill levels and the hardest difficulty each can take on
+SKILL_RANKS = {"beginner": 0, "easy": 0, "intermediate": 1, "medium": 1, "advanced": 2, "hard": 2, "expert": 2}
+
+_keyword_patterns: Dict[Tuple[str, ...], re.Pattern] = {}
+
+def _keyword_pattern(keywords: Iterable[str]) -> re.Pattern:
+    key = tuple(sorted(set(keywords)))
+    pattern = _keyword_patterns.get(key)
+    if pattern is None:
+        qualifiers = "|".join(re.escape(q) for q in _SUBSTITUTE_QUALIFIERS)
+        words = "|".join(re.escape(k) for k in sorted(key, key=len, reverse=True))
+        pattern = re.compile(rf"(?<![\w-])(?:(?P<qualifier>{qualifiers})[\s-]+)?(?P<word>(?:{words})(?:e?s)?)\b")
+        _keyword_patterns[key] = pattern
+    return pattern
+
+def _find_keyword(text: str, keywords: Iterable[str]) -> Optional[str]:
+    """
+    First keyword in the text that is not qualified as a substitute
+    """
+    for match in _keyword_pattern(keywords).finditer(text):
+        if not match.group("qualifier"):
+            return match.group("word")
+    return None
+
+def _normalize(values: Iterable[str]) -> List[str]:
+    return sorted({v.strip().lower() for v in values or [] if v and v.strip()})
+
+def _allergen_keywords(allergy: str) -> List[str]:
+    singular = re.sub(r"(e?s)$", "", allergy) if allergy.endswith("s") else allergy
+    return ALLERGEN_KEYWORDS.get(allergy) or ALLERGEN_KEYWORDS.get(singular) or [singular]
+
+def preference_snapshot(user_preferences) -> Dict[str, Any]:
+    """
+    The preference values that decide which AI recipes belong in a user's feed
+    """
+    # Restrictions from the stored list plus the boolean flags
+    restrictions = set(user_preferences.dietary_restrictions_list)
+    if user_preferences.vegetarian: restrictions.add("vegetarian")
+    if user_preferences.vegan: restrictions.add("vegan")
+    if user_preferences.gluten_free: restrictions.add("gluten-free")
+    if user_preferences.dairy_free: restrictions.add("dairy-free")
+    if user_preferences.nut_free: restrictions.add("nut-free")
+
+    meal_types = []
+    if user_preferences.breakfast:
+        meal_types.append("breakfast")
+    if user_preferences.lunch:
+        meal_types.append("lunch")
+    if user_preferences.dinner:
+        meal_types.append("dinner")
+    if user_preferences.snacks:
+        meal_types.append("snack")
+    if user_preferences.desserts:
+        meal_types.append("dessert")
+
+    return {
+        # Sorted so identical preferences always produce identical prompts
+        "dietary_restrictions": sorted(restrictions),
+        "allergies": user_preferences.allergies_list,
+        "health_goals": user_preferences.health_goals_list,
+        "cuisines": user_preferences.favorite_cuisines_list,
+        "meal_types": meal_types,
+        "skill_level": user_preferences.cooking_skill_level or "medium",
+        "max_cooking_time": user_preferences.cooking_time_max or 60
+    }
+
+def diff_preferences(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    What changed between two preference snapshots, as far as feed recipes are concerned
+    """
+    diff = {}
+    added_restrictions = set(_normalize(new["dietary_restrictions"])) - set(_normalize(old["dietary_restrictions"]))
+    if added_restrictions:
+        diff["added_restrictions"] = sorted(added_restrictions)
+    added_allergies = set(_normalize(new["allergies"])) - set(_normalize(old["allergies"]))
+    if added_allergies:
+        diff["added_allergies"] = sorted(added_allergies)
+    if _normalize(new["cuisines"]) != _normalize(old["cuisines"]):
+        diff["cuisines"] = _normalize(new["cuisines"])
+    if _normalize(new["meal_types"]) != _normalize(old["meal_types"]):
+        diff["meal_types"] = _normalize(new["meal_types"])
+    new_skill = SKILL_RANKS.get((new["skill_level"] or "").lower())
+    old_skill = SKILL_RANKS.get((old["skill_level"] or "").lower())
+    if new_skill is not None and old_skill is not None and new_skill < old_skill:
+        diff["skill_rank"] = new_skill
+    if (new["max_cooking_time"] or 0) < (old["max_cooking_time"] or 0):
+        diff["max_cooking_time"] = new["max_cooking_time"]
+    return diff
+
+def recipe_slot(recipe: Recipe) -> Tuple[Optional[str], Optional[str]]:
+    """
+    (cuisine, meal type) a feed recipe was made for; the meal type is only known for shared recipes
+    """
+    if recipe.preference_signature:
+        cuisine, meal_type = recipe.preference_signature.split("/")[:2]
+        return cuisine or None, meal_type or None
+    return (recipe.cuisine or "").strip().lower() or None, None
+
+def recipe_violation(recipe: Recipe, diff: Dict[str, Any]) -> Optional[str]:
+    """
+    Why a feed recipe no longer fits the changed preferences, or None if it still does
+    """
+    text = " ".join([recipe.title or ""] + recipe.ingredients_list + recipe.tags_list).lower()
+
+    for restriction in diff.get("added_restrictions", []):
+        keywords = RESTRICTION_KEYWORDS.get(restriction.replace(" ", "-"))
+        found = _find_keyword(text, keywords) if keywords else None
+        if found:
+            return f"'{found}' is not {restriction}"
+
+    for allergy in diff.get("added_allergies", []):
+        found = _find_keyword(text, _allergen_keywords(allergy))
+        if found:
+            return f"'{found}' conflicts with the {allergy} allergy"
+
+    if "skill_rank" in diff:
+        difficulty = SKILL_RANKS.get((recipe.difficulty or "").lower())
+        if difficulty is not None and difficulty > diff["skill_rank"]:
+            return f"'{recipe.difficulty}' is too hard"
+
+    if "max_cooking_time" in diff:
+        total_time = recipe.total_time or ((recipe.prep_time or 0) + (recipe.cooking_time or 0))
+        if total_time > diff["max_cooking_time"]:
+            return f"{total_time} minutes is over the time limit"
+
+    cuisine, meal_type = recipe_slot(recipe)
+    if diff.get("cuisines") and cuisine and not any(c in cuisine or cuisine in c for c in diff["cuisines"]):
+        return f"cuisine '{cuisine}' is no longer a favorite"
+    if "meal_types" in diff and meal_type and meal_type not in diff["meal_types"]:
+        return f"meal type '{meal_type}' is no longer wanted"
+    return None
+
+def match_slots(
+    kept: List[Recipe],
+    slots: List[Tuple[Optional[str], str, int]]
+) -> Tuple[List[Tuple[Optional[str], str, int]], List[Recipe]]:
+    """
+    Match kept recipes to planned slots; returns the open slots and the surplus recipes
+    """
+    remaining = list(kept)
+    open_slots = []
+    for slot in slots:
+        cuisine, meal_type, _ = slot
+        cuisine = (cuisine or "").lower() or None
+        match = None
+        # An exact (cuisine, meal type) match first, then a recipe of unknown meal type
+        for exact in (True, False):
+            for recipe in remaining:
+                recipe_cuisine, recipe_meal = recipe_slot(recipe)
+                if cuisine and recipe_cuisine and cuisine not in recipe_cuisine and recipe_cuisine not in cuisine:
+                    continue
+                if exact and recipe_meal != meal_type:
+                    continue
+                if not exact and recipe_meal is not None:
+                    continue
+                match = recipe
+                break
+            if match is not None:
+                break
+        if match is None:
+            open_slots.append(slot)
+        else:
+            remaining.remove(match)
+    return open_slots, remaining
+
+def reconcile_feed(
+    db: Session,
+    user_id: int,
+    previous: Dict[str, Any],
+    current: Dict[str, Any],
+    slots: List[Tuple[Optional[str], str, int]]
+) -> Optional[Tuple[List[Recipe], List[Tuple[Optional[str], str, int]]]]:
+    """
+    Drop the feed recipes that no longer fit and return (kept recipes, open slots).
+    Returns None when the user has no feed to reconcile.
+    """
+    feed = recipe_pool.feed_recipes(db, user_id)
+    if not feed:
+        return None
+
+    diff = diff_preferences(previous, current)
+    kept = []
+    dropped = []
+    for recipe in feed:
+        reason = recipe_violation(recipe, diff)
+        if reason is None:
+            kept.append(recipe)
+        else:
+            logger.info(f"Replacing recipe '{recipe.title}' for user {user_id}: {reason}")
+            dropped.append(recipe)
+
+    open_slots, surplus = match_slots(kept, slots)
+    for recipe in surplus:
+        logger.info(f"Replacing recipe '{recipe.title}' for user {user_id}: no matching slot")
+    dropped.extend(surplus)
+    kept = [recipe for recipe in kept if recipe not in surplus]
+
+    for recipe in dropped:
+        recipe_pool.remove_from_feed(db, user_id, recipe)
+    db.commit()
+
+    logger.info(
+        f"Reconciled feed of user {user_id} (changed: {', '.join(diff) or 'nothing'}): "
+        f"kept {len(kept)}, replaced {len(dropped)}, topping up {len(open_slots)} slots"
+    )
+    return kept, open_slots
@@ -0,0 +1,278 @@
+"""
+Recipe generation progress, cached in memory and pushed to clients as it happens.
+
+The durable status of each user lives in the generation_status table (see
+utils/generation_status.py) and is read with one primary-key lookup. This
+module keeps the latest status per user in memory for a short TTL, so status
+polls rarely touch the database at all, and fans progress events out to the
+user's open streams: queued, started, every recipe that lands in the feed,
+complete and failed.
+
+Generation may run in a standalone worker process, whose events never reach
+this process. For users with an open stream whose generation is not running
+locally, a relay re-reads their status rows about once a second and
+publishes whatever changed.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from database.database import SessionLocal, engine
+from models.generation_status import GenerationStatus
+from models.preference import UserPreference
+from utils.generation_status import (
+    GENERATING_STATES, STATUS_COMPLETE, STATUS_FAILED, STATUS_IDLE, STATUS_QUEUED, STATUS_RUNNING,
+    create_status, read_statuses
+)
+from utils.job_queue import has_active_job
+from utils.metrics import register_stats_provider
+from utils.recipe_pool import USER_FEED_CONDITION
+from utils.state_manager import active_generation_tasks
+
+logger = logging.getLogger(__name__)
+
+# Feed size at which a user's generation counts as complete
+GENERATION_TARGET_RECIPES = int(os.getenv("GENERATION_TARGET_RECIPES", "6"))
+# How long a user's status is served from memory before it is re-read
+GENERATION_STATUS_TTL_SECONDS = float(os.getenv("GENERATION_STATUS_TTL_SECONDS", "2"))
+# How often the relay re-reads generations running in other processes
+GENERATION_RELAY_INTERVAL_SECONDS = float(os.getenv("GENERATION_RELAY_INTERVAL_SECONDS", "1"))
+# Events buffered per stream; a client that falls further behind misses the oldest
+GENERATION_STREAM_BUFFER = int(os.getenv("GENERATION_STREAM_BUFFER", "100"))
+# Cached statuses kept before expired ones are pruned
+GENERATION_STATUS_MAX_USERS = int(os.getenv("GENERATION_STATUS_MAX_USERS", "10000"))
+
+# Status fields mirrored from the generation_status row
+ROW_FIELDS = ("state", "target", "completed", "failed", "recipes_count")
+
+def _row_status(row: GenerationStatus) -> Dict[str, Any]:
+    return {field: getattr(row, field) for field in ROW_FIELDS}
+
+def load_status(db: Session, user_id: int) -> Dict[str, Any]:
+    """
+    Read a user's generation status from the database
+    """
+    row = db.query(GenerationStatus).filter(GenerationStatus.user_id == user_id).first()
+    if row is not None:
+        # Status rows are only written for users with preferences
+        return {**_row_status(row), "has_preferences": True}
+
+    has_preferences = db.query(UserPreference.id).filter(UserPreference.user_id == user_id).first() is not None
+    if not has_preferences:
+        return {"state": STATUS_IDLE, "target": 0, "completed": 0, "failed": 0, "recipes_count": 0, "has_preferences": False}
+
+    # Users from before status rows existed: count their feed once and store the result
+    recipes_count = db.execute(
+        text(f"SELECT COUNT(*) FROM recipes WHERE {USER_FEED_CONDITION}"),
+        {"user_id": user_id}
+    ).scalar() or 0
+    state = STATUS_QUEUED if has_active_job(db, user_id) else STATUS_IDLE
+    create_status(db, user_id, state=state, recipes_count=recipes_count)
+    db.commit()
+    row = db.query(GenerationStatus).filter(GenerationStatus.user_id == user_id).first()
+    return {**_row_status(row), "has_preferences": True}
+
+class GenerationProgress:
+    """
+    Latest generation status per user, with subscriptions to its changes
+    """
+    def __init__(self):
+        self._status: Dict[int, Dict[str, Any]] = {}
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._relay_task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.events = 0
+        self.dropped = 0
+        self.relayed = 0
+
+    def status(self, db: Session, user_id: int) -> Dict[str, Any]:
+        """
+        A user's generation status, from memory when it is fresh
+        """
+        entry = self._status.get(user_id)
+        if entry is not None and time.monotonic() < entry["expires_at"]:
+            self.hits += 1
+        else:
+            self.misses += 1
+            entry = self._update(user_id, load_status(db, user_id))
+        return self._public(entry)
+
+    def _public(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        is_generating = entry["state"] in GENERATING_STATES
+        return {
+            "is_generating": is_generating,
+            "recipes_count": entry["recipes_count"],
+            "has_preferences": entry["has_preferences"],
+            # Complete once nothing is running and the feed is full (or there is nothing to fill it for)
+            "generation_complete": not is_generating and (
+                entry["recipes_count"] >= GENERATION_TARGET_RECIPES or not entry["has_preferences"]
+            ),
+            "state": entry["state"],
+            "target": entry["target"],
+            "completed": entry["completed"],
+            "failed": entry["failed"]
+        }
+
+    def _update(self, user_id: int, changes: Dict[str, Any]) -> Dict[str, Any]:
+        entry = self._status.get(user_id)
+        if entry is None:
+            if len(self._status) >= GENERATION_STATUS_MAX_USERS:
+                self._prune()
+            entry = self._status[user_id] = {
+                "state": STATUS_IDLE,
+                "target": 0,
+                "completed": 0,
+                "failed": 0,
+                "recipes_count": 0,
+                "has_preferences": True
+            }
+        entry.update(changes)
+        entry["expires_at"] = time.monotonic() + GENERATION_STATUS_TTL_SECONDS
+        return entry
+
+    def _prune(self):
+        now = time.monotonic()
+        for user_id in [
+            user_id for user_id, entry in self._status.items()
+            if entry["expires_at"] <= now and user_id not in self._subscribers
+        ]:
+            del self._status[user_id]
+
+    def publish(self, user_id: int, event: str, changes: Dict[str, Any], **data):
+        """
+        Apply a status change and send the event to the user's streams
+        """
+        status = self._public(self._update(user_id, changes))
+        self.events += 1
+        payload = {**status, **data}
+        for queue in self._subscribers.get(user_id, ()):
+            try:
+                queue.put_nowait((event, payload))
+            except asyncio.QueueFull:
+                # Drop the oldest event; the newest always carries the full status
+                self.dropped += 1
+                queue.get_nowait()
+                queue.put_nowait((event, payload))
+
+    def invalidate(self, user_id: int):
+        """
+        Forget a user's cached status, so the next read goes to the database
+        """
+        self._status.pop(user_id, None)
+
+    # Pipeline hooks, called once the matching status row change is committed
+
+    def queued(self, user_id: int, target: int):
+        self.publish(user_id, "queued", {
+            "state": STATUS_QUEUED, "has_preferences": True, "target": target, "completed": 0, "failed": 0
+        })
+
+    def started(self, user_id: int, target: int, recipes_count: int):
+        self.publish(user_id, "started", {
+            "state": STATUS_RUNNING, "has_preferences": True, "target": target,
+            "completed": 0, "failed": 0, "recipes_count": recipes_count
+        })
+
+    def recipe_ready(self, user_id: int, completed: int, recipes_count: int, recipe_id: int, title: str):
+        self.publish(
+            user_id, "recipe", {"completed": completed, "recipes_count": recipes_count},
+            recipe_id=recipe_id, title=title
+        )
+
+    def finished(self, user_id: int, recipes_count: int, failed: int, more_queued: bool = False):
+        # A request merged in while this one ran keeps the user generating
+        state = STATUS_QUEUED if more_queued else STATUS_COMPLETE
+        self.publish(user_id, "complete" if not more_queued else "queued", {
+            "state": state, "recipes_count": recipes_count, "failed": failed
+        })
+
+    def failed(self, user_id: int, detail: str):
+        # Whether the job is retried is up to the queue: send the error now and
+        # take the state from the database on the next read
+        self.publish(user_id, "error", {}, detail=detail)
+        self._status[user_id]["expires_at"] = 0
+
+    # Streams
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=GENERATION_STREAM_BUFFER)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    # Relay for generations running in other processes
+
+    def start(self):
+        if self._relay_task is not None:
+            return
+        # Deployments created before status rows existed do not have the table yet
+        GenerationStatus.__table__.create(bind=engine, checkfirst=True)
+        self._relay_task = asyncio.create_task(self._relay())
+
+    async def stop(self):
+        if self._relay_task is not None:
+            self._relay_task.cancel()
+            try:
+                await self._relay_task
+            except asyncio.CancelledError:
+                pass
+            self._relay_task = None
+
+    async def _relay(self):
+        while True:
+            await asyncio.sleep(GENERATION_RELAY_INTERVAL_SECONDS)
+            # Generations running here report their own progress
+            users = [user_id for user_id in self._subscribers if user_id not in active_generation_tasks]
+            if not users:
+                continue
+            db = SessionLocal()
+            try:
+                for user_id, row in read_statuses(db, users).items():
+                    status = _row_status(row)
+                    entry = self._status.get(user_id)
+                    if entry is not None and all(entry[field] == status[field] for field in ROW_FIELDS):
+                        # Unchanged, but known to be current
+                        self._update(user_id, {})
+                        continue
+                    self.relayed += 1
+                    if row.state in GENERATING_STATES:
+                        event = "progress"
+                    else:
+                        event = "complete" if row.state != STATUS_FAILED else "error"
+                    self.publish(user_id, event, status)
+            except SQLAlchemyError as e:
+                logger.error(f"Error relaying generation progress: {str(e)}")
+            finally:
+                db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._status),
+            "streams": sum(len(queues) for queues in self._subscribers.values()),
+            "status_hits": self.hits,
+            "status_misses": self.misses,
+            "status_hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "events": self.events,
+            "dropped_events": self.dropped,
+            "relayed_changes": self.relayed
+        }
+
+generation_progress = GenerationProgress()
+
+register_stats_provider("generation_progress", generation_progress.stats)
@@ -0,0 +1,89 @@
+"""
+Durable per-user recipe generation status, kept in the generation_status table.
+
+Every change is written in the same transaction as the work it describes:
+the job queue sets the state as jobs are queued, retried and finished, and
+the generation pipeline counts each recipe as it commits it. Any API process
+or worker can then answer a status question with a single primary-key read
+instead of counting the user's recipes.
+"""
+from datetime import datetime
+from typing import Dict, Iterable
+
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models.generation_status import GenerationStatus
+
+# Status states
+STATUS_IDLE = "idle"
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETE = "complete"
+STATUS_FAILED = "failed"
+
+# States in which a generation for the user is still to come
+GENERATING_STATES = (STATUS_QUEUED, STATUS_RUNNING)
+
+def _insert(db: Session):
+    # Both supported databases have INSERT ... ON CONFLICT, under their own dialect
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(GenerationStatus)
+
+def set_status(db: Session, user_id: int, **values):
+    """
+    Create or update a user's status row; the caller commits
+    """
+    values["updated_at"] = datetime.utcnow()
+    db.execute(
+        _insert(db)
+        .values(user_id=user_id, **values)
+        .on_conflict_do_update(index_elements=[GenerationStatus.user_id], set_=values)
+    )
+
+def create_status(db: Session, user_id: int, **values):
+    """
+    Create a user's status row unless one was written meanwhile; the caller commits
+    """
+    db.execute(
+        _insert(db)
+        .values(user_id=user_id, updated_at=datetime.utcnow(), **values)
+        .on_conflict_do_nothing(index_elements=[GenerationStatus.user_id])
+    )
+
+def record_recipe(db: Session, user_id: int, recipes_count: int):
+    """
+    Count one recipe added by the running generation; the caller commits
+    """
+    db.execute(
+        update(GenerationStatus)
+        .where(GenerationStatus.user_id == user_id)
+        .values(
+            completed=GenerationStatus.completed + 1,
+            recipes_count=recipes_count,
+            updated_at=datetime.utcnow()
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+def adjust_recipes_count(db: Session, user_id: int, delta: int):
+    """
+    Track a feed change made outside a generation; the caller commits
+    """
+    db.execute(
+        update(GenerationStatus)
+        .where(GenerationStatus.user_id == user_id)
+        .values(recipes_count=GenerationStatus.recipes_count + delta, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+def read_statuses(db: Session, user_ids: Iterable[int]) -> Dict[int, GenerationStatus]:
+    """
+    Status rows of the given users, by user id
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    rows = db.query(GenerationStatus).filter(GenerationStatus.user_id.in_(user_ids)).all()
+    return {row.user_id: row for row in rows}
@@ -0,0 +1,157 @@
+"""
+Hedged LLM calls: a second identical call when the first one runs long.
+
+Most calls for a prompt finish quickly, and the slow tail usually belongs to
+the one upstream request that happened to stall, not to the prompt. A hedger
+starts the call and, if it has not returned by the time most recent calls had
+(the HEDGE_PERCENTILE latency of a sliding window of samples), starts the same
+call again. Whichever finishes first wins and the other is cancelled.
+
+Hedges are extra load on the provider, so they are capped to HEDGE_BUDGET_RATIO
+of the calls in a sliding window, and skipped while the LLM scheduler has
+interactive work queued or low rate limit buckets, and when the request has
+no time left for another attempt.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Set
+
+from utils.deadline import has_time_for_attempt
+from utils.llm_scheduler import llm_scheduler
+from utils.metrics import register_stats_provider
+
+logger = logging.getLogger(__name__)
+
+# Hedging configuration
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+# Latency percentile after which the second call is started
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+# Recent latencies the percentile is taken over, and how many are needed to trust it
+HEDGE_LATENCY_SAMPLES = int(os.getenv("HEDGE_LATENCY_SAMPLES", "200"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# Hedge delay until enough latencies are known, and the bounds of the adaptive delay
+HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("HEDGE_DEFAULT_DELAY_SECONDS", "4"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.5"))
+HEDGE_MAX_DELAY_SECONDS = float(os.getenv("HEDGE_MAX_DELAY_SECONDS", "8"))
+# Hedges allowed as a share of the calls made in the budget window
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))
+HEDGE_BUDGET_WINDOW_SECONDS = float(os.getenv("HEDGE_BUDGET_WINDOW_SECONDS", "60"))
+# Share of the LLM rate limit buckets that must be free to hedge
+HEDGE_MIN_HEADROOM = float(os.getenv("HEDGE_MIN_HEADROOM", "0.2"))
+
+class Hedger:
+    """
+    Runs a call, and a second copy of it once the first is slower than usual
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._latencies: Deque[float] = deque(maxlen=HEDGE_LATENCY_SAMPLES)
+        self._calls: Deque[float] = deque()
+        self._hedges: Deque[float] = deque()
+
+        # Metrics
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.budget_denied = 0
+        self.busy_skipped = 0
+
+    def delay(self) -> float:
+        """
+        How long the first call runs before it is hedged
+        """
+        if len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY_SECONDS
+        latencies = sorted(self._latencies)
+        index = min(int(len(latencies) * HEDGE_PERCENTILE / 100), len(latencies) - 1)
+        return min(max(latencies[index], HEDGE_MIN_DELAY_SECONDS), HEDGE_MAX_DELAY_SECONDS)
+
+    def _trim(self, now: float):
+        for events in (self._calls, self._hedges):
+            while events and events[0] < now - HEDGE_BUDGET_WINDOW_SECONDS:
+                events.popleft()
+
+    def _try_hedge(self) -> bool:
+        now = time.monotonic()
+        self._trim(now)
+        if len(self._hedges) >= HEDGE_BUDGET_RATIO * len(self._calls):
+            self.budget_denied += 1
+            return False
+        if not has_time_for_attempt() or not llm_scheduler.has_headroom(HEDGE_MIN_HEADROOM):
+            self.busy_skipped += 1
+            return False
+        self._hedges.append(now)
+        return True
+
+    async def run(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the result of call(), from whichever of up to two copies of it succeeds first.
+        An error is only raised once no copy is left running.
+        """
+        if not HEDGE_ENABLED:
+            return await call()
+        self.calls += 1
+        started = time.monotonic()
+        self._calls.append(started)
+
+        primary = asyncio.ensure_future(call())
+        attempts: Set[asyncio.Future] = {primary}
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=self.delay())
+            if not done and self._try_hedge():
+                self.hedged += 1
+                logger.info(f"Hedging {self.name} call after {time.monotonic() - started:.2f}s")
+                attempts.add(asyncio.ensure_future(call()))
+            return await self._first_success(primary, attempts, started)
+        finally:
+            for attempt in attempts:
+                if not attempt.done():
+                    attempt.cancel()
+
+    async def _first_success(self, primary: asyncio.Future, attempts: Set[asyncio.Future], started: float) -> Any:
+        pending = set(attempts)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is not None:
+                    # The first call's error is the one reported if nothing succeeds
+                    if error is None or attempt is primary:
+                        error = attempt.exception()
+                    continue
+                # Measured from the first call's start even when the hedge wins: the
+                # cancelled first call took at least this long, which keeps the
+                # samples from drifting towards the fast hedges
+                self._latencies.append(time.monotonic() - started)
+                if attempt is not primary:
+                    self.hedge_wins += 1
+                elif len(attempts) > 1:
+                    self.primary_wins += 1
+                return attempt.result()
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        self._trim(time.monotonic())
+        return {
+            "enabled": HEDGE_ENABLED,
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_rate": (self.hedged / self.calls) if self.calls else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "primary_wins": self.primary_wins,
+            "hedge_win_rate": (self.hedge_wins / self.hedged) if self.hedged else 0.0,
+            "budget_denied": self.budget_denied,
+            "busy_skipped": self.busy_skipped,
+            "delay_ms": self.delay() * 1000,
+            "latency_samples": len(self._latencies),
+            "window_calls": len(self._calls),
+            "window_hedges": len(self._hedges)
+        }
+
+explore_hedger = Hedger("cuisine_recommendations")
+
+register_stats_provider("hedging", lambda: {explore_hedger.name: explore_hedger.stats()})
@@ -0,0 +1,185 @@
+"""
+Application-scoped pooled HTTP client.
+
+A single httpx.AsyncClient with keep-alive (and HTTP/2 when the h2 package is
+installed) is created at startup and closed at shutdown, so outbound calls reuse
+connections instead of paying DNS, TCP and TLS setup on every request. On top
+of the global pool limits, each host gets its own concurrency cap.
+"""
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from dotenv import load_dotenv
+
+from utils.metrics import register_stats_provider
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Pool configuration
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "20"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_DEFAULT_TIMEOUT = float(os.getenv("HTTP_DEFAULT_TIMEOUT", "60"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+
+# httpcore trace events that mark the moment a request got hold of a connection
+_CONNECTION_ACQUIRED_EVENTS = (
+    "connection.connect_tcp.started",
+    "http11.send_request_headers.started",
+    "http2.send_request_headers.started",
+)
+
+class PooledHTTPClient:
+    """
+    Shared httpx client with per-host concurrency caps and pool metrics
+    """
+    def __init__(self):
+        http2 = HTTP2_ENABLED
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+                http2 = False
+
+        self.http2 = http2
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(HTTP_DEFAULT_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT, pool=HTTP_POOL_TIMEOUT)
+        )
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+        # Metrics
+        self.requests = 0
+        self.new_connections = 0
+        self.in_flight = 0
+        self.pool_wait_total = 0.0
+        self.pool_wait_max = 0.0
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(HTTP_MAX_CONNECTIONS_PER_HOST)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    def _trace(self, started_at: float):
+        """
+        Build an httpcore trace hook that records pool wait time and new connections
+        """
+        state = {"acquired": False}
+
+        async def trace(event_name: str, info: Dict[str, Any]):
+            if event_name == "connection.connect_tcp.started":
+                self.new_connections += 1
+            if not state["acquired"] and event_name in _CONNECTION_ACQUIRED_EVENTS:
+                state["acquired"] = True
+                self._record_pool_wait(time.perf_counter() - started_at)
+
+        return trace
+
+    def _record_pool_wait(self, waited: float):
+        self.pool_wait_total += waited
+        self.pool_wait_max = max(self.pool_wait_max, waited)
+
+    @asynccontextmanager
+    async def _slot(self, url: str, extensions: Dict[str, Any]):
+        started_at = time.perf_counter()
+        async with self._host_semaphore(url):
+            extensions["trace"] = self._trace(started_at)
+            self.requests += 1
+            self.in_flight += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a request through the shared pool
+        """
+        extensions = kwargs.pop("extensions", None) or {}
+        async with self._slot(url, extensions):
+            return await self.client.request(method, url, extensions=extensions, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        """
+        Stream a response through the shared pool; the host slot is held until the body is consumed
+        """
+        extensions = kwargs.pop("extensions", None) or {}
+        async with self._slot(url, extensions):
+            async with self.client.stream(method, url, extensions=extensions, **kwargs) as response:
+                yield response
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        reused = max(self.requests - self.new_connections, 0)
+        return {
+            "http2": self.http2,
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "new_connections": self.new_connections,
+            "reused_connections": reused,
+            "connection_reuse_rate": (reused / self.requests) if self.requests else 0.0,
+            "pool_wait_avg_ms": (self.pool_wait_total / self.requests * 1000) if self.requests else 0.0,
+            "pool_wait_max_ms": self.pool_wait_max * 1000
+        }
+
+_http_client: Optional[PooledHTTPClient] = None
+
+async def start_http_client():
+    """
+    Create the shared client; called once at application startup
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = PooledHTTPClient()
+        logger.info(f"Started pooled HTTP client (http2={_http_client.http2}, "
+                    f"max_connections={HTTP_MAX_CONNECTIONS}, per_host={HTTP_MAX_CONNECTIONS_PER_HOST})")
+
+async def close_http_client():
+    """
+    Close the shared client and its connections; called at application shutdown
+    """
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+        logger.info("Closed pooled HTTP client")
+
+def get_http_client() -> PooledHTTPClient:
+    """
+    Return the shared client, creating it lazily for code running outside the app lifecycle
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = PooledHTTPClient()
+    return _http_client
+
+def _http_client_stats() -> Dict[str, Any]:
+    if _http_client is None:
+        return {"started": False}
+    return {"started": True, **_http_client.stats()}
+
+register_stats_provider("http_client", _http_client_stats)
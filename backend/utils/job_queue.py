@@ -0,0 +1,440 @@
+"""
+Durable, DB-backed queue for background recipe generation.
+
+Jobs live in the generation_jobs table, so they survive restarts and deploys.
+A job moves pending -> running -> succeeded, or back to pending with an
+exponential backoff when an attempt fails, until max_attempts is reached and
+it is marked failed.
+
+Each user has at most one pending job: new requests are merged into it
+(enqueue is idempotent), and a user's pending job is not claimed while
+another job of theirs is running.
+
+Workers claim a job by taking a lease. The claim is a single UPDATE whose
+candidate subquery uses SELECT ... FOR UPDATE SKIP LOCKED on Postgres, so
+concurrent workers never wait on each other. On SQLite the same UPDATE is
+atomic on its own, because SQLite serializes writers. A running job's worker
+extends the lease with heartbeats. Jobs whose lease expired, because their
+worker died, are put back to pending.
+
+Every transition also updates the user's generation_status row in the same
+transaction, so status reads agree with the queue across processes.
+"""
+import os
+import json
+import uuid
+import random
+import socket
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import exists, func, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session, aliased
+
+from database.database import SessionLocal, engine
+from models.generation_job import GenerationJob
+from models.generation_status import GenerationStatus
+from utils.generation_status import STATUS_COMPLETE, STATUS_FAILED, STATUS_QUEUED, set_status
+from utils.metrics import register_stats_provider
+
+logger = logging.getLogger(__name__)
+
+# Queue configuration
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_BACKOFF_BASE_SECONDS = float(os.getenv("JOB_BACKOFF_BASE_SECONDS", "5"))
+JOB_BACKOFF_MAX_SECONDS = float(os.getenv("JOB_BACKOFF_MAX_SECONDS", "600"))
+
+# Job states
+STATE_PENDING = "pending"
+STATE_RUNNING = "running"
+STATE_SUCCEEDED = "succeeded"
+STATE_FAILED = "failed"
+
+# Workers in this process, woken when a job is enqueued here
+_local_workers: Set["JobWorker"] = set()
+
+def enqueue_generation(
+    db: Session,
+    user_id: int,
+    preferences_id: int,
+    count: int,
+    previous_preferences: Optional[Dict[str, Any]] = None
+) -> GenerationJob:
+    """
+    Queue a feed generation for the user, merging it into their pending job if there is one
+    """
+    previous = json.dumps(previous_preferences) if previous_preferences is not None else None
+    for _ in range(2):
+        job = db.query(GenerationJob).filter(
+            GenerationJob.user_id == user_id,
+            GenerationJob.state == STATE_PENDING
+        ).first()
+        if job is not None:
+            # The feed still reflects the preferences from before the pending job,
+            # so an incremental job keeps its original snapshot; a full one stays full
+            if job.previous_preferences is None or previous is None:
+                job.previous_preferences = None
+            job.preferences_id = preferences_id
+            job.count = max(job.count, count)
+            job.run_after = datetime.utcnow()
+            set_status(db, user_id, state=STATUS_QUEUED, target=job.count, completed=0, failed=0)
+            db.commit()
+            logger.info(f"Merged generation request for user {user_id} into pending job {job.id}")
+            break
+
+        job = GenerationJob(
+            user_id=user_id,
+            preferences_id=preferences_id,
+            count=count,
+            previous_preferences=previous,
+            state=STATE_PENDING,
+            max_attempts=JOB_MAX_ATTEMPTS,
+            run_after=datetime.utcnow()
+        )
+        db.add(job)
+        set_status(db, user_id, state=STATUS_QUEUED, target=count, completed=0, failed=0)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another request created the pending job first: merge into it
+            db.rollback()
+            continue
+        logger.info(f"Queued generation job {job.id} for user {user_id}")
+        break
+
+    for worker in _local_workers:
+        worker.notify()
+    return job
+
+def has_active_job(db: Session, user_id: int) -> bool:
+    """
+    Whether a generation for the user is queued or running
+    """
+    return db.query(exists().where(
+        GenerationJob.user_id == user_id,
+        GenerationJob.state.in_((STATE_PENDING, STATE_RUNNING))
+    )).scalar()
+
+def has_pending_job(db: Session, user_id: int) -> bool:
+    """
+    Whether a generation for the user is waiting to run
+    """
+    return db.query(exists().where(
+        GenerationJob.user_id == user_id,
+        GenerationJob.state == STATE_PENDING
+    )).scalar()
+
+def claim_job(db: Session, worker_id: str) -> Optional[GenerationJob]:
+    """
+    Lease the next runnable job, or return None if there is none.
+    The job is returned detached so it outlives the session's later commits.
+    """
+    now = datetime.utcnow()
+    running = aliased(GenerationJob)
+    user_busy = exists().where(running.user_id == GenerationJob.user_id, running.state == STATE_RUNNING)
+    candidate = (
+        select(GenerationJob.id)
+        .where(GenerationJob.state == STATE_PENDING, GenerationJob.run_after <= now, ~user_busy)
+        .order_by(GenerationJob.run_after, GenerationJob.id)
+        .limit(1)
+        # Postgres skips rows other workers are claiming; SQLite serializes the UPDATE instead
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    lease_owner = f"{worker_id}:{uuid.uuid4().hex[:8]}"
+    result = db.execute(
+        update(GenerationJob)
+        .where(GenerationJob.id == candidate, GenerationJob.state == STATE_PENDING)
+        .values(
+            state=STATE_RUNNING,
+            lease_owner=lease_owner,
+            lease_expires_at=now + timedelta(seconds=JOB_LEASE_SECONDS),
+            heartbeat_at=now,
+            started_at=now,
+            updated_at=now
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    if not result.rowcount:
+        return None
+    job = db.query(GenerationJob).filter(GenerationJob.lease_owner == lease_owner).first()
+    if job is not None:
+        db.expunge(job)
+    return job
+
+def heartbeat(db: Session, job_id: int, lease_owner: str) -> bool:
+    """
+    Extend a running job's lease; False means the lease was lost
+    """
+    now = datetime.utcnow()
+    result = db.execute(
+        update(GenerationJob)
+        .where(
+            GenerationJob.id == job_id,
+            GenerationJob.lease_owner == lease_owner,
+            GenerationJob.state == STATE_RUNNING
+        )
+        .values(heartbeat_at=now, lease_expires_at=now + timedelta(seconds=JOB_LEASE_SECONDS), updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return bool(result.rowcount)
+
+def _backoff_seconds(attempts: int) -> float:
+    delay = min(JOB_BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0), JOB_BACKOFF_MAX_SECONDS)
+    # Full jitter keeps retries of jobs that failed together from bunching up
+    return random.uniform(delay / 2, delay)
+
+def _record_outcome(db: Session, job: GenerationJob):
+    """
+    Reflect a job's new state in the user's generation status
+    """
+    if job.state == STATE_PENDING or has_pending_job(db, job.user_id):
+        # Retried, or superseded by a request queued meanwhile
+        state = STATUS_QUEUED
+    elif job.state == STATE_SUCCEEDED:
+        state = STATUS_COMPLETE
+    else:
+        state = STATUS_FAILED
+    set_status(db, job.user_id, state=state)
+
+def finish_job(db: Session, job_id: int, lease_owner: str, error: Optional[str] = None) -> Optional[str]:
+    """
+    Record the outcome of a job attempt; returns the job's new state, or None if the lease was lost
+    """
+    job = db.query(GenerationJob).filter(
+        GenerationJob.id == job_id,
+        GenerationJob.lease_owner == lease_owner,
+        GenerationJob.state == STATE_RUNNING
+    ).first()
+    if job is None:
+        return None
+
+    now = datetime.utcnow()
+    job.attempts += 1
+    job.lease_owner = None
+    job.lease_expires_at = None
+    if error is None:
+        job.state = STATE_SUCCEEDED
+        job.finished_at = now
+        job.last_error = None
+    else:
+        job.last_error = error[:2000]
+        if job.attempts >= job.max_attempts:
+            job.state = STATE_FAILED
+            job.finished_at = now
+        elif has_pending_job(db, job.user_id):
+            # A newer request for the user is already queued and supersedes this one
+            job.state = STATE_FAILED
+            job.finished_at = now
+        else:
+            job.state = STATE_PENDING
+            job.run_after = now + timedelta(seconds=_backoff_seconds(job.attempts))
+    db.flush()
+    _record_outcome(db, job)
+    db.commit()
+    return job.state
+
+def requeue_expired(db: Session) -> int:
+    """
+    Put running jobs whose lease expired back to pending; returns how many
+    """
+    now = datetime.utcnow()
+    expired = db.query(GenerationJob).filter(
+        GenerationJob.state == STATE_RUNNING,
+        GenerationJob.lease_expires_at < now
+    ).all()
+    requeued = 0
+    for job in expired:
+        job.attempts += 1
+        job.lease_owner = None
+        job.lease_expires_at = None
+        job.last_error = "Lease expired"
+        if job.attempts >= job.max_attempts or has_pending_job(db, job.user_id):
+            job.state = STATE_FAILED
+            job.finished_at = now
+        else:
+            job.state = STATE_PENDING
+            job.run_after = now
+            requeued += 1
+        # Flush per job so the pending check sees the jobs requeued before it
+        db.flush()
+        _record_outcome(db, job)
+    db.commit()
+    if expired:
+        logger.warning(f"Found {len(expired)} generation jobs with expired leases, requeued {requeued}")
+    return requeued
+
+def queue_stats() -> Dict[str, Any]:
+    db = SessionLocal()
+    try:
+        counts = dict(db.query(GenerationJob.state, func.count(GenerationJob.id)).group_by(GenerationJob.state).all())
+        oldest_pending = db.query(func.min(GenerationJob.created_at)).filter(GenerationJob.state == STATE_PENDING).scalar()
+    except SQLAlchemyError:
+        return {}
+    finally:
+        db.close()
+    return {
+        "jobs": counts,
+        "oldest_pending_age_seconds": round((datetime.utcnow() - oldest_pending).total_seconds(), 1) if oldest_pending else 0.0,
+        "workers": [worker.stats() for worker in _local_workers]
+    }
+
+class JobWorker:
+    """
+    Claims and runs generation jobs with bounded concurrency
+    """
+    def __init__(self, handler: Callable[[GenerationJob], Awaitable[Any]], concurrency: int = 1,
+                 worker_id: Optional[str] = None):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self._wake: Optional[asyncio.Event] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+        self._stopping = False
+
+        # Metrics
+        self.claimed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.leases_lost = 0
+
+    def notify(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    def start(self):
+        if self._loop_task is not None:
+            return
+        # Deployments created before the queue existed do not have its tables yet
+        GenerationJob.__table__.create(bind=engine, checkfirst=True)
+        GenerationStatus.__table__.create(bind=engine, checkfirst=True)
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._loop_task = asyncio.create_task(self._run())
+        _local_workers.add(self)
+        logger.info(f"Generation worker {self.worker_id} started with concurrency {self.concurrency}")
+
+    async def stop(self, drain_timeout: Optional[float] = None):
+        """
+        Stop claiming jobs and wait for running ones to finish (up to drain_timeout seconds).
+        Jobs still running after that are cancelled; their leases expire and they are retried.
+        """
+        if self._loop_task is None:
+            return
+        self._stopping = True
+        _local_workers.discard(self)
+        self._loop_task.cancel()
+        try:
+            await self._loop_task
+        except asyncio.CancelledError:
+            pass
+        self._loop_task = None
+
+        if self._running:
+            logger.info(f"Draining {len(self._running)} running generation jobs")
+            _, still_running = await asyncio.wait(set(self._running), timeout=drain_timeout)
+            for task in still_running:
+                task.cancel()
+            if still_running:
+                await asyncio.wait(still_running)
+        logger.info(f"Generation worker {self.worker_id} stopped")
+
+    async def _run(self):
+        next_expiry_check = 0.0
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            try:
+                db = SessionLocal()
+                try:
+                    if loop.time() >= next_expiry_check:
+                        requeue_expired(db)
+                        next_expiry_check = loop.time() + JOB_LEASE_SECONDS / 2
+                    while len(self._running) < self.concurrency:
+                        job = claim_job(db, self.worker_id)
+                        if job is None:
+                            break
+                        self.claimed += 1
+                        task = asyncio.create_task(self._execute(job.id, job.lease_owner, job))
+                        self._running.add(task)
+                        task.add_done_callback(self._on_done)
+                finally:
+                    db.close()
+            except SQLAlchemyError as e:
+                logger.error(f"Error claiming generation jobs: {str(e)}")
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), JOB_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def _on_done(self, task: asyncio.Task):
+        self._running.discard(task)
+        # A free slot: look for the next job straight away
+        self.notify()
+
+    async def _execute(self, job_id: int, lease_owner: str, job: GenerationJob):
+        logger.info(f"Running generation job {job_id} for user {job.user_id} (attempt {job.attempts + 1})")
+        work = asyncio.create_task(self.handler(job))
+        error = None
+        try:
+            while True:
+                done, _ = await asyncio.wait({work}, timeout=JOB_HEARTBEAT_SECONDS)
+                if done:
+                    break
+                db = SessionLocal()
+                try:
+                    if not heartbeat(db, job_id, lease_owner):
+                        # Another worker took over after our lease expired
+                        self.leases_lost += 1
+                        logger.warning(f"Lost lease on generation job {job_id}, abandoning it")
+                        work.cancel()
+                        return
+                except SQLAlchemyError as e:
+                    logger.error(f"Heartbeat for generation job {job_id} failed: {str(e)}")
+                finally:
+                    db.close()
+            work.result()
+        except asyncio.CancelledError:
+            work.cancel()
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)}"
+            logger.error(f"Generation job {job_id} failed: {error}")
+
+        db = SessionLocal()
+        try:
+            state = finish_job(db, job_id, lease_owner, error)
+        except SQLAlchemyError as e:
+            logger.error(f"Error recording outcome of generation job {job_id}: {str(e)}")
+            return
+        finally:
+            db.close()
+        if state == STATE_SUCCEEDED:
+            self.succeeded += 1
+        elif state is not None:
+            self.failed += 1
+            if state == STATE_PENDING:
+                logger.info(f"Generation job {job_id} will be retried")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "concurrency": self.concurrency,
+            "running": len(self._running),
+            "claimed": self.claimed,
+            "succeeded": self.succeeded,
+            "failed_attempts": self.failed,
+            "leases_lost": self.leases_lost
+        }
+
+register_stats_provider("generation_jobs", queue_stats)
@@ -0,0 +1,460 @@
+"""
+Incremental JSON helpers for streamed LLM output.
+"""
+import re
+import json
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class JSONObjectStream:
+    """
+    Split a streamed JSON array (or a run of JSON objects) into complete objects.
+
+    Text is fed in arbitrary chunks; every outermost object whose closing brace
+    has been seen is returned from feed(), repaired by TolerantJSONParser the
+    same way complete responses are. Prose or code fences around the JSON are
+    ignored, and an unfinished trailing object is simply never emitted.
+    """
+    def __init__(self):
+        self._parser = TolerantJSONParser(emit_objects=True)
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        return self._parser.feed(chunk)
+
+class JSONFieldStream:
+    """
+    Incrementally parse a single streamed JSON object into field events.
+
+    feed() returns (kind, key, value) tuples as soon as each part is complete:
+    - ("item", key, value) for every element of a top-level array member
+    - ("field", key, value) for every top-level member, arrays included
+
+    Text before the object (prose, code fences) is ignored, as is anything after
+    its closing brace. Members that do not decode are skipped with a warning.
+    """
+    def __init__(self):
+        self._buffer: List[str] = []
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escaped = False
+        self._done = False
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None
+        self._member_start: Optional[int] = None
+        self._item_start: Optional[int] = None
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    def _decode(self, start: int, end: int) -> Tuple[bool, Any]:
+        text = "".join(self._buffer[start:end]).strip()
+        try:
+            return True, json.loads(text)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Skipping malformed streamed value for '{self._key}': {str(e)}")
+            return False, None
+
+    def _end_member(self, end: int, events: List[Tuple[str, str, Any]]):
+        if self._member_start is None:
+            return
+        ok, value = self._decode(self._member_start, end)
+        self._member_start = None
+        if ok and self._key is not None:
+            events.append(("field", self._key, value))
+
+    def _end_item(self, end: int, events: List[Tuple[str, str, Any]]):
+        if self._item_start is None:
+            return
+        ok, value = self._decode(self._item_start, end)
+        self._item_start = None
+        if ok and self._key is not None:
+            events.append(("item", self._key, value))
+
+    def _in_member_array(self) -> bool:
+        return len(self._stack) == 2 and self._stack[1] == "["
+
+    def feed(self, chunk: str) -> List[Tuple[str, str, Any]]:
+        events: List[Tuple[str, str, Any]] = []
+        for char in chunk:
+            if self._done:
+                break
+            if not self._stack:
+                # Outside the object: wait for its opening brace
+                if char == "{":
+                    self._stack.append(char)
+                    self._buffer = [char]
+                    self._expect_key = True
+                continue
+
+            self._buffer.append(char)
+            pos = len(self._buffer) - 1
+            depth = len(self._stack)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    # A string that closes a key, a member value or an array item
+                    if depth == 1 and self._key_start is not None:
+                        ok, key = self._decode(self._key_start, pos + 1)
+                        self._key = key if ok else None
+                        self._key_start = None
+                    elif depth == 1 and self._member_start is not None and self._buffer[self._member_start] == '"':
+                        self._end_member(pos + 1, events)
+                    elif self._in_member_array() and self._item_start is not None and self._buffer[self._item_start] == '"':
+                        self._end_item(pos + 1, events)
+                continue
+
+            if char.isspace():
+                continue
+
+            if depth == 1:
+                if self._expect_key:
+                    if char == '"':
+                        self._in_string = True
+                        self._key_start = pos
+                    elif char == ":":
+                        self._expect_key = False
+                    elif char == "}":
+                        self._stack.pop()
+                        self._done = True
+                elif char == ",":
+                    # Ends a number, boolean or null member
+                    self._end_member(pos, events)
+                    self._expect_key = True
+                elif char == "}":
+                    self._end_member(pos, events)
+                    self._stack.pop()
+                    self._done = True
+                else:
+                    if self._member_start is None:
+                        self._member_start = pos
+                    if char == '"':
+                        self._in_string = True
+                    elif char in "{[":
+                        self._stack.append(char)
+                continue
+
+            if self._in_member_array():
+                if char == ",":
+                    self._end_item(pos, events)
+                elif char == "]":
+                    self._end_item(pos, events)
+                    self._stack.pop()
+                    self._end_member(pos + 1, events)
+                else:
+                    if self._item_start is None:
+                        self._item_start = pos
+                    if char == '"':
+                        self._in_string = True
+                    elif char in "{[":
+                        self._stack.append(char)
+                continue
+
+            # Inside a nested object or array
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._stack.append(char)
+            elif char in "}]":
+                self._stack.pop()
+                if len(self._stack) == 1:
+                    self._end_member(pos + 1, events)
+                elif self._in_member_array():
+                    self._end_item(pos + 1, events)
+        return events
+
+_JSON_LITERAL_PATTERN = re.compile(r"-?\d+(\.\d+)?([eE][+-]?\d+)?|true|false|null")
+_VALID_ESCAPES = set('"\\/bfnrtu')
+_STRING_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+# Runs of characters that can be copied through unchanged
+_STRING_RUNS = {
+    '"': re.compile(r'[^"\\\x00-\x1f]+'),
+    "'": re.compile(r'[^\'"\\\x00-\x1f]+'),
+}
+_WHITESPACE_RUN = re.compile(r"\s+")
+_VALUE_START = re.compile(r"[\[{]")
+
+class _Container:
+    __slots__ = ("kind", "state", "start", "safe")
+
+    def __init__(self, kind: str, safe: int):
+        # "{" or "["
+        self.kind = kind
+        # Objects: "key", "colon", "value", "after"; arrays: "value", "after"
+        self.state = "key" if kind == "{" else "value"
+        # Output position of the opening bracket
+        self.start = safe - 1
+        # Output length after the last complete member, used to cut truncated tails
+        self.safe = safe
+
+class TolerantJSONParser:
+    """
+    Single-pass, repairing parser for JSON written by an LLM.
+
+    Text is scanned once, character by character, and rewritten into valid JSON
+    while it is read:
+    - prose and code fences around the JSON are skipped
+    - trailing commas are dropped and missing commas between values are added
+    - unquoted keys and values (e.g. [1 cup rice, salt]) are quoted
+    - single-quoted strings, raw newlines and invalid escapes inside strings are fixed
+    - a truncated tail is cut back to the last complete member and all open
+      containers are closed
+
+    feed() returns every top-level value completed by the chunk; close() finishes
+    whatever is still open. Text can be passed in arbitrary chunks. With
+    emit_objects, feed() instead returns each outermost object (one not nested in
+    another object) as soon as it closes, e.g. every element of a streamed array.
+    """
+    def __init__(self, emit_objects: bool = False):
+        self._emit_objects = emit_objects
+        self._out: List[str] = []
+        self._stack: List[_Container] = []
+        self._string_quote: Optional[str] = None
+        self._escaped = False
+        self._bare: Optional[List[str]] = None
+        self._values: List[Any] = []
+
+    # Output helpers
+
+    def _begin_value(self):
+        """
+        Prepare the output for a new value (or key) after a missing comma or colon
+        """
+        top = self._stack[-1]
+        if top.state == "after":
+            # Missing comma between two values
+            self._out.append(",")
+            top.state = "key" if top.kind == "{" else "value"
+        if top.kind == "{" and top.state == "colon":
+            # Missing colon after a key
+            self._out.append(":")
+            top.state = "value"
+
+    def _end_value(self):
+        """
+        Mark the value just written as complete in its container
+        """
+        if not self._stack:
+            self._finish_root()
+            return
+        top = self._stack[-1]
+        if top.kind == "{" and top.state == "key":
+            # That was a key
+            top.state = "colon"
+            return
+        top.state = "after"
+        top.safe = len(self._out)
+
+    def _open(self, kind: str):
+        if self._stack:
+            self._begin_value()
+        self._out.append(kind)
+        self._stack.append(_Container(kind, len(self._out)))
+
+    def _close(self, truncated: bool = False):
+        container = self._stack.pop()
+        if truncated and container.safe == container.start + 1 and self._stack:
+            # Cut off before its first member: drop the container altogether
+            del self._out[container.start:]
+            return
+        if container.state != "after":
+            # Dangling comma, key or colon: drop back to the last complete member
+            del self._out[container.safe:]
+        self._out.append("}" if container.kind == "{" else "]")
+        if (
+            self._emit_objects and not truncated and container.kind == "{"
+            and all(outer.kind == "[" for outer in self._stack)
+        ):
+            self._emit_object(container)
+        self._end_value()
+
+    def _emit_object(self, container: _Container):
+        text = "".join(self._out[container.start:])
+        try:
+            self._values.append(json.loads(text))
+        except json.JSONDecodeError as e:
+            logger.warning(f"Discarding unrepairable streamed object: {str(e)}")
+
+    def _finish_root(self):
+        text = "".join(self._out)
+        self._out = []
+        if self._emit_objects:
+            # Its objects were emitted as they closed
+            return
+        try:
+            self._values.append(json.loads(text))
+        except json.JSONDecodeError as e:
+            logger.warning(f"Discarding unrepairable JSON value: {str(e)}")
+
+    def _finish_bare(self):
+        token = "".join(self._bare).strip()
+        self._bare = None
+        if not token:
+            return
+        if token.endswith(",") or token.endswith(";"):
+            token = token[:-1].rstrip()
+        if _JSON_LITERAL_PATTERN.fullmatch(token):
+            self._out.append(token)
+        else:
+            self._out.append(json.dumps(token))
+        self._end_value()
+
+    # Scanning
+
+    def feed(self, chunk: str) -> List[Any]:
+        i = 0
+        length = len(chunk)
+        while i < length:
+            # Copy or skip long runs in one step; everything else goes char by char
+            if self._string_quote is not None:
+                if not self._escaped:
+                    match = _STRING_RUNS[self._string_quote].match(chunk, i)
+                    if match:
+                        self._out.append(match.group())
+                        i = match.end()
+                        continue
+            elif self._bare is None:
+                if not self._stack:
+                    match = _VALUE_START.search(chunk, i)
+                    if match is None:
+                        break
+                    i = match.start()
+                else:
+                    match = _WHITESPACE_RUN.match(chunk, i)
+                    if match:
+                        i = match.end()
+                        continue
+            self._feed_char(chunk[i])
+            i += 1
+        values, self._values = self._values, []
+        return values
+
+    def _feed_char(self, char: str):
+        if self._string_quote is not None:
+            self._string_char(char)
+            return
+
+        if self._bare is not None:
+            top = self._stack[-1]
+            is_key = top.kind == "{" and top.state == "key"
+            if (
+                char in ",]}\n" or (is_key and char == ":")
+                # A quote after a number or literal starts the next member; the comma was left out
+                or (char == '"' and _JSON_LITERAL_PATTERN.fullmatch("".join(self._bare).strip()))
+            ):
+                self._finish_bare()
+            else:
+                self._bare.append(char)
+                return
+
+        if not self._stack:
+            # Outside any JSON value: skip prose and fences
+            if char in "{[":
+                self._open(char)
+            return
+
+        top = self._stack[-1]
+        if char.isspace():
+            return
+        if char in "}]":
+            self._close()
+        elif char == ",":
+            if top.state == "after":
+                self._out.append(",")
+                top.state = "key" if top.kind == "{" else "value"
+        elif char == ":":
+            if top.kind == "{" and top.state == "colon":
+                self._out.append(":")
+                top.state = "value"
+        elif char == "`":
+            # A closing code fence means the JSON ended, complete or not
+            self._close_all()
+        elif char in "{[":
+            if top.kind == "{" and top.state == "key":
+                return
+            self._open(char)
+        elif char in "\"'":
+            self._begin_value()
+            self._string_quote = char
+            self._out.append('"')
+        else:
+            self._begin_value()
+            self._bare = [char]
+
+    def _string_char(self, char: str):
+        if self._escaped:
+            self._escaped = False
+            if char == "'":
+                self._out.append("'")
+            elif char in _VALID_ESCAPES:
+                self._out.append("\\" + char)
+            else:
+                # Invalid escape: keep the backslash literally
+                self._out.append("\\\\" + char)
+        elif char == "\\":
+            self._escaped = True
+        elif char == self._string_quote:
+            self._string_quote = None
+            self._out.append('"')
+            self._end_value()
+        elif char == '"':
+            # Double quote inside a single-quoted string
+            self._out.append('\\"')
+        elif char in _STRING_CONTROL_ESCAPES:
+            self._out.append(_STRING_CONTROL_ESCAPES[char])
+        elif char < " ":
+            # Other control characters are not valid in JSON strings
+            return
+        else:
+            self._out.append(char)
+
+    def close(self) -> List[Any]:
+        """
+        Finish the input, repairing a truncated tail, and return the remaining values
+        """
+        self._close_all()
+        values, self._values = self._values, []
+        return values
+
+    def _close_all(self):
+        if self._stack:
+            if self._bare is not None:
+                self._finish_bare()
+            # An unterminated string is cut off along with its member
+            self._string_quote = None
+            self._escaped = False
+            while self._stack:
+                self._close(truncated=True)
+
+_DECODER = json.JSONDecoder()
+
+def parse_json_values(text: str) -> List[Any]:
+    """
+    Parse every JSON value found in an LLM response, repairing common mistakes.
+
+    Well-formed output (possibly fenced or wrapped in prose) is decoded directly by
+    the C decoder; anything else gets one pass through TolerantJSONParser.
+    """
+    match = _VALUE_START.search(text)
+    if match is None:
+        return []
+    try:
+        value, end = _DECODER.raw_decode(text, match.start())
+        if _VALUE_START.search(text, end) is None:
+            return [value]
+    except json.JSONDecodeError:
+        pass
+
+    parser = TolerantJSONParser()
+    values = parser.feed(text)
+    values.extend(parser.close())
+    return values
@@ -0,0 +1,233 @@
+"""
+Persistent, content-addressed cache of LLM responses.
+
+Requests are keyed on a hash of the model, the whitespace-normalized messages
+and the sampling parameters, so users with the same preference signature share
+responses. Each key collects LLM_CACHE_VARIANTS distinct responses from fresh
+calls; after that, lookups rotate through them, least served first, until each
+has been served LLM_CACHE_MAX_SERVES times. The next miss then generates a
+fresh response, which replaces the most used variant. Entries expire after
+LLM_CACHE_TTL_SECONDS and the store is bounded to LLM_CACHE_MAX_ENTRIES rows,
+evicting the least recently used first. Storage is a local SQLite file.
+
+Lookups and stores block on SQLite, so async callers run them in a worker
+thread (see chat_completion). Sampling calls (temperature > 0) are only
+cached with LLM_CACHE_SAMPLED=true: a cached variant repeats exactly, which
+takes away the variety those callers sample for.
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import List, Dict, Any, Optional
+
+from utils.metrics import register_stats_provider
+
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./llm_cache.sqlite3")
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+# Distinct responses kept per key, and how often each may be served
+LLM_CACHE_VARIANTS = int(os.getenv("LLM_CACHE_VARIANTS", "3"))
+LLM_CACHE_MAX_SERVES = int(os.getenv("LLM_CACHE_MAX_SERVES", "5"))
+# Also cache calls made with temperature > 0
+LLM_CACHE_SAMPLED = os.getenv("LLM_CACHE_SAMPLED", "false").lower() == "true"
+
+_WHITESPACE = re.compile(r"\s+")
+
+def cache_key(model: str, messages: List[Dict[str, str]], **params) -> str:
+    """
+    Content address of a chat completion request
+    """
+    normalized = {
+        "model": model,
+        "messages": [
+            {"role": m.get("role"), "content": _WHITESPACE.sub(" ", m.get("content") or "").strip()}
+            for m in messages
+        ],
+        "params": params
+    }
+    encoded = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    """
+    SQLite-backed response store with per-key variants, TTL and LRU eviction
+    """
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES, variants: int = LLM_CACHE_VARIANTS,
+                 max_serves: int = LLM_CACHE_MAX_SERVES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.variants = variants
+        self.max_serves = max_serves
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # Row count as of the last store or purge, so stats() never waits on the database
+        self._entries: Optional[int] = None
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.exhausted = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL,
+                    serves INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_responses_key ON llm_responses (key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_responses_last_used ON llm_responses (last_used_at)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a cached response for the key, or None if a fresh one should be generated
+        """
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connection()
+                expired = conn.execute(
+                    "DELETE FROM llm_responses WHERE key = ? AND created_at < ?",
+                    (key, now - self.ttl_seconds)
+                ).rowcount
+                self.expirations += max(expired, 0)
+
+                rows = conn.execute(
+                    "SELECT id, response, serves FROM llm_responses WHERE key = ? ORDER BY serves, created_at",
+                    (key,)
+                ).fetchall()
+                if len(rows) < self.variants:
+                    # Still collecting distinct variants for this key
+                    self.misses += 1
+                    return None
+                row = rows[0]
+                if row[2] >= self.max_serves:
+                    # Every variant has been served its share: time for a fresh one
+                    self.exhausted += 1
+                    self.misses += 1
+                    return None
+
+                conn.execute(
+                    "UPDATE llm_responses SET serves = serves + 1, last_used_at = ? WHERE id = ?",
+                    (now, row[0])
+                )
+                self.hits += 1
+                return json.loads(row[1])
+            except (sqlite3.Error, json.JSONDecodeError) as e:
+                logger.error(f"LLM cache lookup failed: {str(e)}")
+                self.misses += 1
+                return None
+
+    def put(self, key: str, response: Dict[str, Any]):
+        """
+        Add a freshly generated response as a new variant of the key.
+        The variant has just been served once, to the caller that generated it.
+        """
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connection()
+                conn.execute("BEGIN")
+                # Make room among this key's variants by dropping the most used one
+                count = conn.execute("SELECT COUNT(*) FROM llm_responses WHERE key = ?", (key,)).fetchone()[0]
+                if count >= self.variants:
+                    conn.execute(
+                        "DELETE FROM llm_responses WHERE id IN ("
+                        "SELECT id FROM llm_responses WHERE key = ? ORDER BY serves DESC, created_at LIMIT ?)",
+                        (key, count - self.variants + 1)
+                    )
+                conn.execute(
+                    "INSERT INTO llm_responses (key, response, created_at, last_used_at, serves) VALUES (?, ?, ?, ?, 1)",
+                    (key, json.dumps(response), now, now)
+                )
+
+                # Bound the whole store, least recently used first
+                total = conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+                if total > self.max_entries:
+                    evicted = conn.execute(
+                        "DELETE FROM llm_responses WHERE id IN ("
+                        "SELECT id FROM llm_responses ORDER BY last_used_at LIMIT ?)",
+                        (total - self.max_entries,)
+                    ).rowcount
+                    self.evictions += max(evicted, 0)
+                conn.execute("COMMIT")
+                self._entries = min(total, self.max_entries)
+                self.stores += 1
+            except sqlite3.Error as e:
+                logger.error(f"LLM cache store failed: {str(e)}")
+                if self._conn is not None and self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+
+    def purge_expired(self) -> int:
+        """
+        Delete every expired entry; returns how many were removed
+        """
+        with self._lock:
+            try:
+                conn = self._connection()
+                removed = conn.execute(
+                    "DELETE FROM llm_responses WHERE created_at < ?",
+                    (time.time() - self.ttl_seconds,)
+                ).rowcount
+                self._entries = conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+            except sqlite3.Error as e:
+                logger.error(f"LLM cache purge failed: {str(e)}")
+                return 0
+            self.expirations += max(removed, 0)
+            return removed
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": LLM_CACHE_ENABLED,
+            "sampled_calls_cached": LLM_CACHE_SAMPLED,
+            "entries": self._entries,
+            "max_entries": self.max_entries,
+            "variants_per_key": self.variants,
+            "max_serves_per_variant": self.max_serves,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "exhausted_keys": self.exhausted,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+llm_cache = LLMResponseCache()
+
+register_stats_provider("llm_cache", llm_cache.stats)
@@ -0,0 +1,202 @@
+"""
+Thin client for the OpenAI chat completions API on top of the shared HTTP pool.
+"""
+import os
+import json
+import asyncio
+import logging
+from typing import List, Dict, Any, Optional, AsyncIterator
+
+import httpx
+from dotenv import load_dotenv
+
+from utils.circuit_breaker import get_breaker, llm_retry_budget
+from utils.deadline import DeadlineExceeded, remaining, timeout_for
+from utils.http_client import get_http_client
+from utils.llm_cache import LLM_CACHE_ENABLED, LLM_CACHE_SAMPLED, cache_key, llm_cache
+from utils.llm_scheduler import LLM_SCHEDULER_ENABLED, CHARS_PER_TOKEN, LLMRequestPreempted, estimate_tokens, llm_scheduler
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1").rstrip("/")
+CHAT_COMPLETIONS_URL = f"{OPENAI_API_BASE}/chat/completions"
+
+# Used when the caller does not pass its own timeout
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))
+
+async def _acquire_capacity(messages: List[Dict[str, str]], max_tokens: int) -> int:
+    if not LLM_SCHEDULER_ENABLED:
+        return 0
+    acquire = llm_scheduler.acquire(estimate_tokens(messages, max_tokens))
+    left = remaining()
+    if left is None:
+        return await acquire
+    # Do not queue for capacity the request has no time left to use
+    try:
+        return await asyncio.wait_for(acquire, max(left, 0))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Request deadline reached while waiting for LLM capacity")
+
+def _settle_capacity(charged: int, used: Optional[int]):
+    if LLM_SCHEDULER_ENABLED:
+        llm_scheduler.settle(charged, used)
+
+def _headers(api_key: Optional[str] = None) -> Dict[str, str]:
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key or OPENAI_API_KEY}"
+    }
+
+async def chat_completion(
+    model: str,
+    messages: List[Dict[str, str]],
+    max_tokens: int,
+    temperature: float,
+    timeout: Optional[float] = None,
+    api_key: Optional[str] = None,
+    cache: bool = False
+) -> Dict[str, Any]:
+    """
+    Call the chat completions endpoint and return the decoded response body.
+    Raises httpx.HTTPError on transport failures and non-2xx responses,
+    CircuitOpenError without calling out while the model's circuit is open, and
+    DeadlineExceeded when the current request runs out of time for the call.
+    With cache=True the response may come from, and is stored in, the persistent LLM cache;
+    sampling calls (temperature > 0) only use it when LLM_CACHE_SAMPLED is set.
+    """
+    key = None
+    if cache and LLM_CACHE_ENABLED and (temperature == 0 or LLM_CACHE_SAMPLED):
+        key = cache_key(model, messages, max_tokens=max_tokens, temperature=temperature)
+        # SQLite I/O: keep it off the event loop
+        cached = await asyncio.to_thread(llm_cache.get, key)
+        if cached is not None:
+            logger.debug(f"LLM cache hit for {model} request {key[:12]}")
+            return cached
+    
+    payload = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature
+    }
+    
+    # Fail fast while the model's circuit is open, then wait for rate-limit
+    # capacity according to the caller's priority class. Running out of request
+    # time says nothing about the provider, so it is not held against the circuit.
+    with get_breaker(model).guard(ignore=(LLMRequestPreempted, DeadlineExceeded)) as call:
+        charged = await _acquire_capacity(messages, max_tokens)
+        call.start()
+        llm_retry_budget.record_request()
+        used = None
+        try:
+            response = await _post_within_deadline(payload, api_key, timeout or LLM_REQUEST_TIMEOUT)
+            response.raise_for_status()
+            body = response.json()
+            used = (body.get("usage") or {}).get("total_tokens")
+        finally:
+            _settle_capacity(charged, used)
+    
+    # Truncated completions are not worth serving again
+    if key is not None and body.get("choices") and body["choices"][0].get("finish_reason") != "length":
+        await asyncio.to_thread(llm_cache.put, key, body)
+    return body
+
+async def _post_within_deadline(payload: Dict[str, Any], api_key: Optional[str], timeout: float):
+    """
+    POST a chat completion with the timeout cut down to the request's remaining time
+    """
+    capped = timeout_for(timeout)
+    try:
+        return await get_http_client().request(
+            "POST",
+            CHAT_COMPLETIONS_URL,
+            json=payload,
+            headers=_headers(api_key),
+            timeout=capped
+        )
+    except httpx.TimeoutException:
+        if capped < timeout:
+            raise DeadlineExceeded("Request deadline reached while waiting for the LLM")
+        raise
+
+def completion_text(response: Dict[str, Any]) -> str:
+    """
+    Extract the assistant message text from a chat completion response
+    """
+    return response["choices"][0]["message"]["content"]
+
+async def stream_chat_completion(
+    model: str,
+    messages: List[Dict[str, str]],
+    max_tokens: int,
+    temperature: float,
+    timeout: Optional[float] = None,
+    api_key: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Call the chat completions endpoint in streaming mode and yield content deltas as they arrive
+    """
+    payload = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "stream": True
+    }
+    with get_breaker(model).guard(ignore=(LLMRequestPreempted, DeadlineExceeded)) as call:
+        charged = await _acquire_capacity(messages, max_tokens)
+        call.start()
+        llm_retry_budget.record_request()
+        # Streamed responses carry no usage block; estimate it from what was received
+        used = sum(len(m.get("content") or "") for m in messages) // CHARS_PER_TOKEN
+        # Applies to each read; the deadline check between chunks bounds the whole stream
+        default_timeout = timeout or LLM_REQUEST_TIMEOUT
+        capped = timeout_for(default_timeout)
+        try:
+            async with get_http_client().stream(
+                "POST",
+                CHAT_COMPLETIONS_URL,
+                json=payload,
+                headers=_headers(api_key),
+                timeout=capped
+            ) as response:
+                response.raise_for_status()
+                async for delta in _stream_deltas(response):
+                    # The breaker judges a stream by its time to first chunk
+                    call.stop()
+                    used += max(len(delta) // CHARS_PER_TOKEN, 1)
+                    yield delta
+                    timeout_for(default_timeout)
+        except httpx.TimeoutException:
+            if capped < default_timeout:
+                raise DeadlineExceeded("Request deadline reached while streaming from the LLM")
+            raise
+        finally:
+            _settle_capacity(charged, used)
+
+async def _stream_deltas(response) -> AsyncIterator[str]:
+    """
+    Decode the server-sent events of a streamed chat completion into content deltas
+    """
+    async for line in response.aiter_lines():
+        # Server-sent events: "data: {...}" lines, terminated by "data: [DONE]"
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            break
+        try:
+            chunk = json.loads(data)
+        except json.JSONDecodeError:
+            logger.warning(f"Skipping undecodable stream chunk: {data[:100]}")
+            continue
+        choices = chunk.get("choices") or []
+        if not choices:
+            continue
+        delta = choices[0].get("delta", {}).get("content")
+        if delta:
+            yield delta
@@ -0,0 +1,324 @@
+"""
+Central scheduler for outbound LLM traffic.
+
+Every OpenAI call acquires capacity here before it is sent. Capacity is tracked
+with two token buckets matching the provider's rate limits, requests per minute
+and tokens per minute. A request is charged its prompt estimate plus max_tokens
+up front and settled against the reported usage when it completes.
+
+Waiting requests are queued by priority class:
+- interactive: a user is waiting on the response (/recommendations/generate, /explore)
+- onboarding:  background generation of a user's recipe batch
+- prefetch:    speculative work nobody is waiting on yet
+
+A lower class is only dispatched when no higher class is waiting. Within a class
+users are served round robin, so one large batch cannot starve other users.
+When an interactive request has to queue, queued prefetch work is preempted and
+fails with LLMRequestPreempted.
+
+The class and user of a call come from context variables; wrap work in
+llm_request_context(...) to set them. Calls made without it are interactive.
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional
+
+from utils.metrics import register_stats_provider
+
+logger = logging.getLogger(__name__)
+
+# Scheduler configuration
+LLM_SCHEDULER_ENABLED = os.getenv("LLM_SCHEDULER_ENABLED", "true").lower() == "true"
+LLM_RATE_LIMIT_RPM = int(os.getenv("LLM_RATE_LIMIT_RPM", "500"))
+LLM_RATE_LIMIT_TPM = int(os.getenv("LLM_RATE_LIMIT_TPM", "150000"))
+LLM_PREEMPT_PREFETCH = os.getenv("LLM_PREEMPT_PREFETCH", "true").lower() == "true"
+
+# Priority classes, highest first
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_ONBOARDING = "onboarding"
+PRIORITY_PREFETCH = "prefetch"
+PRIORITY_CLASSES = (PRIORITY_INTERACTIVE, PRIORITY_ONBOARDING, PRIORITY_PREFETCH)
+
+# Rough characters per token, for estimating prompt size before the call
+CHARS_PER_TOKEN = 4
+
+# Recent wait samples kept per class for percentile metrics
+WAIT_SAMPLE_SIZE = 500
+
+llm_priority: ContextVar[str] = ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+llm_user: ContextVar[Optional[Any]] = ContextVar("llm_user", default=None)
+
+class LLMRequestPreempted(Exception):
+    """
+    Raised for queued low-priority work dropped in favour of interactive requests
+    """
+    pass
+
+@contextmanager
+def llm_request_context(priority: Optional[str] = None, user_id: Optional[Any] = None):
+    """
+    Set the priority class and user for LLM calls made inside the block,
+    including tasks created from it
+    """
+    tokens = []
+    if priority is not None:
+        tokens.append((llm_priority, llm_priority.set(priority)))
+    if user_id is not None:
+        tokens.append((llm_user, llm_user.set(user_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+    """
+    Tokens a request is charged before its actual usage is known
+    """
+    prompt_chars = sum(len(m.get("content") or "") for m in messages)
+    return prompt_chars // CHARS_PER_TOKEN + max_tokens
+
+class TokenBucket:
+    """
+    Continuously refilling bucket; the level may go negative when usage exceeds estimates
+    """
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self) -> float:
+        self._refill()
+        return self.level
+
+    def time_until(self, amount: float) -> float:
+        """
+        Seconds until the bucket holds the amount (0 if it already does)
+        """
+        deficit = min(amount, self.capacity) - self.available()
+        return max(deficit / self.rate, 0.0)
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+    def give(self, amount: float):
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+class _Waiter:
+    __slots__ = ("future", "cost", "priority", "user", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future, cost: int, priority: str, user: Any):
+        self.future = future
+        self.cost = cost
+        self.priority = priority
+        self.user = user
+        self.enqueued_at = time.monotonic()
+
+class _ClassStats:
+    __slots__ = ("granted", "preempted", "wait_total", "wait_max", "waits")
+
+    def __init__(self):
+        self.granted = 0
+        self.preempted = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.waits: Deque[float] = deque(maxlen=WAIT_SAMPLE_SIZE)
+
+class LLMScheduler:
+    """
+    Token-bucket admission with strict priority classes and per-user round robin
+    """
+    def __init__(self, rpm: int = LLM_RATE_LIMIT_RPM, tpm: int = LLM_RATE_LIMIT_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        # Per class: user -> queued waiters, in round-robin order
+        self._queues: Dict[str, "OrderedDict[Any, Deque[_Waiter]]"] = {
+            priority: OrderedDict() for priority in PRIORITY_CLASSES
+        }
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._stats = {priority: _ClassStats() for priority in PRIORITY_CLASSES}
+        self.tokens_estimated = 0
+        self.tokens_used = 0
+
+    async def acquire(self, cost: int) -> int:
+        """
+        Wait until the request may be sent; returns the tokens charged for it
+        """
+        priority = llm_priority.get()
+        if priority not in self._queues:
+            priority = PRIORITY_INTERACTIVE
+        user = llm_user.get()
+        cost = int(min(cost, self.tokens.capacity))
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(future, cost, priority, user)
+        self._queues[priority].setdefault(user, deque()).append(waiter)
+        self._dispatch()
+
+        if not future.done() and priority == PRIORITY_INTERACTIVE and LLM_PREEMPT_PREFETCH:
+            self._preempt_prefetch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as the caller went away: return the capacity
+                self.release(cost)
+            raise
+        return cost
+
+    def settle(self, charged: int, used: Optional[int]):
+        """
+        Correct the token bucket once the actual usage of a request is known
+        """
+        self.tokens_estimated += charged
+        if used is None:
+            self.tokens_used += charged
+            return
+        self.tokens_used += used
+        if used < charged:
+            self.tokens.give(charged - used)
+            self._dispatch()
+        elif used > charged:
+            self.tokens.take(used - charged)
+
+    def release(self, charged: int):
+        """
+        Return the capacity of a request that was granted but never sent
+        """
+        self.requests.give(1)
+        self.tokens.give(charged)
+        self._dispatch()
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        """
+        Head of the highest non-empty class, from the user whose turn it is
+        """
+        for priority in PRIORITY_CLASSES:
+            queue = self._queues[priority]
+            while queue:
+                user, waiters = next(iter(queue.items()))
+                while waiters and waiters[0].future.done():
+                    # Cancelled while queued
+                    waiters.popleft()
+                if waiters:
+                    return waiters[0]
+                del queue[user]
+        return None
+
+    def _dispatch(self):
+        while True:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+
+            wait = max(self.requests.time_until(1), self.tokens.time_until(waiter.cost))
+            if wait > 0:
+                self._schedule(wait)
+                return
+
+            # Grant, then move the user to the back of its class for fairness
+            queue = self._queues[waiter.priority]
+            waiters = queue[waiter.user]
+            waiters.popleft()
+            queue.move_to_end(waiter.user)
+            if not waiters:
+                del queue[waiter.user]
+
+            self.requests.take(1)
+            self.tokens.take(waiter.cost)
+            self._record_wait(waiter)
+            waiter.future.set_result(None)
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    def _preempt_prefetch(self):
+        queue = self._queues[PRIORITY_PREFETCH]
+        preempted = 0
+        for waiters in queue.values():
+            for waiter in waiters:
+                if not waiter.future.done():
+                    waiter.future.set_exception(LLMRequestPreempted("Preempted by interactive LLM traffic"))
+                    preempted += 1
+        queue.clear()
+        if preempted:
+            self._stats[PRIORITY_PREFETCH].preempted += preempted
+            logger.info(f"Preempted {preempted} queued prefetch LLM requests")
+
+    def _record_wait(self, waiter: _Waiter):
+        waited = time.monotonic() - waiter.enqueued_at
+        stats = self._stats[waiter.priority]
+        stats.granted += 1
+        stats.wait_total += waited
+        stats.wait_max = max(stats.wait_max, waited)
+        stats.waits.append(waited)
+
+    def queue_depth(self, priority: Optional[str] = None) -> int:
+        classes = [priority] if priority else PRIORITY_CLASSES
+        return sum(
+            sum(1 for w in waiters if not w.future.done())
+            for p in classes
+            for waiters in self._queues[p].values()
+        )
+
+    def has_headroom(self, min_available: float) -> bool:
+        """
+        Whether speculative work can start without getting in anyone's way: nothing
+        above the prefetch class is waiting and both buckets hold at least the
+        given share of their capacity
+        """
+        if not LLM_SCHEDULER_ENABLED:
+            return True
+        if self.queue_depth(PRIORITY_INTERACTIVE) or self.queue_depth(PRIORITY_ONBOARDING):
+            return False
+        return (
+            self.requests.available() >= self.requests.capacity * min_available
+            and self.tokens.available() >= self.tokens.capacity * min_available
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        classes = {}
+        for priority, stats in self._stats.items():
+            waits = sorted(stats.waits)
+            classes[priority] = {
+                "queue_depth": self.queue_depth(priority),
+                "queued_users": len(self._queues[priority]),
+                "granted": stats.granted,
+                "preempted": stats.preempted,
+                "wait_avg_ms": (stats.wait_total / stats.granted * 1000) if stats.granted else 0.0,
+                "wait_p95_ms": (waits[int(len(waits) * 0.95) - 1 if len(waits) > 1 else 0] * 1000) if waits else 0.0,
+                "wait_max_ms": stats.wait_max * 1000
+            }
+        return {
+            "enabled": LLM_SCHEDULER_ENABLED,
+            "requests_available": round(self.requests.available(), 2),
+            "tokens_available": round(self.tokens.available(), 2),
+            "tokens_estimated": self.tokens_estimated,
+            "tokens_used": self.tokens_used,
+            "classes": classes
+        }
+
+llm_scheduler = LLMScheduler()
+
+register_stats_provider("llm_scheduler", llm_scheduler.stats)
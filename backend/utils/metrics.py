@@ -0,0 +1,29 @@
+"""
+In-process registry of runtime statistics exposed by the /metrics endpoint.
+Components register a callable returning a JSON-serializable dict.
+"""
+import logging
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+_stats_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+def register_stats_provider(name: str, provider: Callable[[], Dict[str, Any]]):
+    """
+    Register (or replace) the stats provider for a component
+    """
+    _stats_providers[name] = provider
+
+def collect_stats() -> Dict[str, Any]:
+    """
+    Collect a snapshot from every registered provider
+    """
+    snapshot = {}
+    for name, provider in _stats_providers.items():
+        try:
+            snapshot[name] = provider()
+        except Exception as e:
+            logger.error(f"Error collecting stats for {name}: {str(e)}")
+            snapshot[name] = {"error": str(e)}
+    return snapshot
@@ -1,23 +1,61 @@
 import os
+import copy
 import json
-import openai
 from dotenv import load_dotenv
 import logging
-from typing import List, Dict, Any, Optional
-import re
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 import ast  # Add ast module for literal_eval
+import httpx
 import random
 
+from utils.cuisine_index import get_cuisine_index
+from utils.deadline import DeadlineExceeded
+from utils.explore_cache import explore_cache, normalize_query, restrictions_key
+from utils.hedging import explore_hedger
+from utils.json_stream import JSONObjectStream, JSONFieldStream, parse_json_values
+from utils.llm_client import chat_completion, completion_text, stream_chat_completion
+from utils.single_flight import recipe_flight, explore_flight
+
 # Load environment variables
 load_dotenv()
 
-# Configure OpenAI
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# JSON shape requested for every generated recipe
+RECIPE_JSON_FORMAT = """
+    {
+        "title": "Recipe Title",
+        "description": "Brief description of the dish",
+        "ingredients": ["Ingredient 1 with quantity", "Ingredient 2 with quantity", ...],
+        "instructions": ["Step 1", "Step 2", ...],
+        "cuisine_type": "Cuisine type",
+        "meal_type": "Meal type",
+        "prep_time": prep_time_in_minutes,
+        "cook_time": cooking_time_in_minutes,
+        "total_time": total_time_in_minutes,
+        "vegetarian": boolean,
+        "vegan": boolean,
+        "gluten_free": boolean,
+        "dairy_free": boolean,
+        "nut_free": boolean,
+        "spicy_level": spicy_level_1_to_5,
+        "difficulty": "easy/medium/hard",
+        "tags": ["tag1", "tag2", ...]
+    }
+    """
+
+# System prompt for recipe generation
+RECIPE_SYSTEM_PROMPT = "You are a professional chef who specializes in creating personalized recipes based on user preferences. Your responses should be structured as valid JSON objects."
+
+# Time limit for the exploration call before falling back to local recommendations
+EXPLORE_TIMEOUT_SECONDS = 10
+
+# Output token budget per recipe in batch mode, and the model's completion limit
+BATCH_TOKENS_PER_RECIPE = 700
+MAX_COMPLETION_TOKENS = 4096
+
 async def generate_recipe(
     cuisine_preferences: List[str],
     dietary_restrictions: List[str],
@@ -28,10 +66,54 @@ async def generate_recipe(
     ingredients_to_include: Optional[List[str]] = None,
     ingredients_to_avoid: Optional[List[str]] = None,
     allergies: Optional[List[str]] = None,
-    health_goals: Optional[List[str]] = None
+    health_goals: Optional[List[str]] = None,
+    variation: int = 0
+) -> Dict[str, Any]:
+    """
+    Generate a recipe using OpenAI based on user preferences.
+    A non-zero variation asks for a different dish than other calls with the same preferences.
+    Identical concurrent calls share a single OpenAI request.
+    """
+    key = json.dumps([
+        cuisine_preferences, dietary_restrictions, flavor_preferences, meal_type, skill_level,
+        max_cooking_time, ingredients_to_include, ingredients_to_avoid, allergies, health_goals, variation
+    ], sort_keys=True, default=str)
+    try:
+        recipe = await recipe_flight.do(key, lambda: _generate_recipe(
+            cuisine_preferences,
+            dietary_restrictions,
+            flavor_preferences,
+            meal_type,
+            skill_level,
+            max_cooking_time,
+            ingredients_to_include,
+            ingredients_to_avoid,
+            allergies,
+            health_goals,
+            variation
+        ))
+    except DeadlineExceeded:
+        # The shared call runs on without this caller's deadline; answer locally in time
+        logger.warning("Request deadline reached waiting for a shared recipe generation, using fallback")
+        return generate_fallback_recipe(cuisine_preferences, meal_type)
+    # Every caller gets its own copy of the shared result
+    return copy.deepcopy(recipe)
+
+async def _generate_recipe(
+    cuisine_preferences: List[str],
+    dietary_restrictions: List[str],
+    flavor_preferences: Dict[str, int],
+    meal_type: str,
+    skill_level: str,
+    max_cooking_time: int,
+    ingredients_to_include: Optional[List[str]] = None,
+    ingredients_to_avoid: Optional[List[str]] = None,
+    allergies: Optional[List[str]] = None,
+    health_goals: Optional[List[str]] = None,
+    variation: int = 0
 ) -> Dict[str, Any]:
     """
-    Generate a recipe using OpenAI based on user preferences
+    Generate a recipe with a single OpenAI call, falling back to a local recipe on errors
     """
     try:
         logger.info(f"Generating recipe with OpenAI - cuisine={cuisine_preferences}, meal_type={meal_type}, restrictions={dietary_restrictions}, allergies={allergies}, health_goals={health_goals}")
@@ -47,7 +129,8 @@ async def generate_recipe(
             ingredients_to_include,
             ingredients_to_avoid,
             allergies,
-            health_goals
+            health_goals,
+            variation
         )
         
         # Log the full prompt being sent to OpenAI
@@ -55,46 +138,24 @@ async def generate_recipe(
         
         # Call OpenAI API asynchronously
         logger.debug(f"Calling OpenAI API with temperature=0.8, meal_type={meal_type}")
-        response = await openai.ChatCompletion.acreate(
+        response = await chat_completion(
             model="gpt-4-turbo",
             messages=[
-                {"role": "system", "content": "You are a professional chef who specializes in creating personalized recipes based on user preferences. Your responses should be structured as valid JSON objects."},
+                {"role": "system", "content": RECIPE_SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
             max_tokens=1500,
-            temperature=0.8  # Increased from 0.7 to encourage more variety
+            temperature=0.8,  # Increased from 0.7 to encourage more variety
+            cache=True  # Identical prompts; only used when LLM_CACHE_SAMPLED opts sampled calls in
         )
         
         # Process response
-        recipe_json = extract_json_from_response(response.choices[0].message.content)
+        recipe_json = extract_json_from_response(completion_text(response))
         
         logger.debug(f"OpenAI generated recipe: '{recipe_json.get('title', 'Untitled')}'")
         
         # Validate recipe title to ensure it's not a repetition
-        original_title = recipe_json.get("title", "")
-        
-        # Check for common repeated recipes
-        common_repeats = ["mushroom risotto", "margherita pizza", "tomato spaghetti", "chicken curry"]
-        if original_title.lower() in common_repeats or any(repeat in original_title.lower() for repeat in common_repeats):
-            logger.warning(f"Detected common repeated recipe: '{original_title}'")
-            
-            # If we get a common dish again, add a random suffix to introduce some variety
-            import random
-            cuisine_type = cuisine_preferences[0] if cuisine_preferences else "Fusion"
-            variations = [
-                f"{cuisine_type} Inspired Dish", 
-                "Seasonal Special", 
-                "Chef's Creation", 
-                "Flavor Fusion", 
-                "Signature Dish",
-                f"{cuisine_type} Twist",
-                "House Special",
-                "Premium Version",
-                "Gourmet Edition"
-            ]
-            new_title = f"{random.choice(variations)} - {original_title}"
-            recipe_json["title"] = new_title
-            logger.info(f"Modified repetitive recipe title: '{original_title}' → '{new_title}'")
+        _vary_repeated_title(recipe_json, cuisine_preferences)
         
         return recipe_json
         
@@ -104,7 +165,7 @@ async def generate_recipe(
         # Provide a fallback recipe instead of throwing an exception
         return generate_fallback_recipe(cuisine_preferences, meal_type)
 
-def construct_recipe_prompt(
+async def generate_recipe_stream(
     cuisine_preferences: List[str],
     dietary_restrictions: List[str],
     flavor_preferences: Dict[str, int],
@@ -115,6 +176,163 @@ def construct_recipe_prompt(
     ingredients_to_avoid: Optional[List[str]] = None,
     allergies: Optional[List[str]] = None,
     health_goals: Optional[List[str]] = None
+) -> AsyncIterator[Tuple[str, Optional[str], Any]]:
+    """
+    Generate a recipe using OpenAI in streaming mode.
+    
+    Yields ("field", key, value) and ("item", key, value) events from JSONFieldStream
+    while the response is being produced, then a final ("recipe", None, recipe)
+    with the complete recipe. If the call fails before any content was produced
+    the final recipe is the local fallback; failures after that propagate.
+    """
+    logger.info(f"Streaming recipe with OpenAI - cuisine={cuisine_preferences}, meal_type={meal_type}, restrictions={dietary_restrictions}, allergies={allergies}, health_goals={health_goals}")
+    
+    prompt = construct_recipe_prompt(
+        cuisine_preferences,
+        dietary_restrictions,
+        flavor_preferences,
+        meal_type,
+        skill_level,
+        max_cooking_time,
+        ingredients_to_include,
+        ingredients_to_avoid,
+        allergies,
+        health_goals
+    )
+    logger.debug(f"--- OpenAI Recipe Prompt ---\n{prompt}\n--- End Prompt ---")
+    
+    parser = JSONFieldStream()
+    fields: Dict[str, Any] = {}
+    response_text = ""
+    emitted = False
+    
+    try:
+        async for delta in stream_chat_completion(
+            model="gpt-4-turbo",
+            messages=[
+                {"role": "system", "content": RECIPE_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=1500,
+            temperature=0.8
+        ):
+            response_text += delta
+            for kind, key, value in parser.feed(delta):
+                if kind == "field":
+                    fields[key] = value
+                emitted = True
+                yield kind, key, value
+    except Exception as e:
+        if emitted:
+            raise
+        logger.error(f"Error streaming recipe: {str(e)}")
+        logger.warning("Falling back to local recipe generation")
+        yield "recipe", None, generate_fallback_recipe(cuisine_preferences, meal_type)
+        return
+    
+    # Prefer the fields parsed on the fly; use the repairing parser if the
+    # streamed object never closed cleanly
+    if parser.done:
+        recipe_json = fields
+    else:
+        recipe_json = extract_json_from_response(response_text)
+    
+    _vary_repeated_title(recipe_json, cuisine_preferences)
+    yield "recipe", None, recipe_json
+
+def _vary_repeated_title(recipe_json: Dict[str, Any], cuisine_preferences: List[str]):
+    """
+    Prefix titles of dishes the model keeps repeating to introduce some variety
+    """
+    original_title = recipe_json.get("title", "")
+    
+    # Check for common repeated recipes
+    common_repeats = ["mushroom risotto", "margherita pizza", "tomato spaghetti", "chicken curry"]
+    if original_title.lower() in common_repeats or any(repeat in original_title.lower() for repeat in common_repeats):
+        logger.warning(f"Detected common repeated recipe: '{original_title}'")
+        
+        # If we get a common dish again, add a random suffix to introduce some variety
+        cuisine_type = cuisine_preferences[0] if cuisine_preferences else "Fusion"
+        variations = [
+            f"{cuisine_type} Inspired Dish", 
+            "Seasonal Special", 
+            "Chef's Creation", 
+            "Flavor Fusion", 
+            "Signature Dish",
+            f"{cuisine_type} Twist",
+            "House Special",
+            "Premium Version",
+            "Gourmet Edition"
+        ]
+        new_title = f"{random.choice(variations)} - {original_title}"
+        recipe_json["title"] = new_title
+        logger.info(f"Modified repetitive recipe title: '{original_title}' → '{new_title}'")
+
+async def generate_recipes_batch(
+    slots: List[Tuple[Optional[str], str]],
+    dietary_restrictions: List[str],
+    skill_level: str,
+    max_cooking_time: int,
+    allergies: Optional[List[str]] = None,
+    health_goals: Optional[List[str]] = None
+) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Generate one recipe per (cuisine, meal type) slot in a single streamed OpenAI call.
+    
+    Yields (slot index, recipe) pairs as soon as each recipe object is complete in
+    the stream. Slots the model skips or repeats are simply not yielded, so the
+    caller can top them up with single-recipe calls. Errors propagate to the caller.
+    """
+    prompt = construct_batch_recipe_prompt(
+        slots,
+        dietary_restrictions,
+        skill_level,
+        max_cooking_time,
+        allergies,
+        health_goals
+    )
+    logger.info(f"Generating batch of {len(slots)} recipes with OpenAI - restrictions={dietary_restrictions}, allergies={allergies}")
+    logger.debug(f"--- OpenAI Batch Recipe Prompt ---\n{prompt}\n--- End Prompt ---")
+    
+    parser = JSONObjectStream()
+    seen_slots = set()
+    
+    async for delta in stream_chat_completion(
+        model="gpt-4-turbo",
+        messages=[
+            {"role": "system", "content": RECIPE_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        max_tokens=min(BATCH_TOKENS_PER_RECIPE * len(slots), MAX_COMPLETION_TOKENS),
+        temperature=0.8
+    ):
+        for recipe_json in parser.feed(delta):
+            # Fall back to arrival order if the model dropped the slot number
+            slot = recipe_json.pop("slot", None)
+            if not isinstance(slot, int) or not 0 <= slot < len(slots) or slot in seen_slots:
+                slot = next((i for i in range(len(slots)) if i not in seen_slots), None)
+            if slot is None or not recipe_json.get("title"):
+                logger.warning(f"Discarding unusable batch recipe: {recipe_json.get('title', 'Untitled')}")
+                continue
+            
+            seen_slots.add(slot)
+            cuisine = slots[slot][0]
+            _vary_repeated_title(recipe_json, [cuisine] if cuisine else [])
+            logger.debug(f"Batch recipe for slot {slot}: '{recipe_json.get('title')}'")
+            yield slot, recipe_json
+
+def construct_recipe_prompt(
+    cuisine_preferences: List[str],
+    dietary_restrictions: List[str],
+    flavor_preferences: Dict[str, int],
+    meal_type: str,
+    skill_level: str,
+    max_cooking_time: int,
+    ingredients_to_include: Optional[List[str]] = None,
+    ingredients_to_avoid: Optional[List[str]] = None,
+    allergies: Optional[List[str]] = None,
+    health_goals: Optional[List[str]] = None,
+    variation: int = 0
 ) -> str:
     """
     Construct the prompt for recipe generation
@@ -126,20 +344,8 @@ def construct_recipe_prompt(
         prompt += f"CUISINE PREFERENCES (VERY IMPORTANT): {', '.join(cuisine_preferences)}\n"
         prompt += "Please ensure the recipe strongly reflects these cuisines in both ingredients and preparation.\n\n"
     
-    # Add dietary restrictions with emphasis
-    if dietary_restrictions:
-        prompt += f"DIETARY RESTRICTIONS (STRICTLY FOLLOW): {', '.join(dietary_restrictions)}\n"
-        prompt += "These restrictions must be strictly followed - do not include any prohibited ingredients.\n\n"
-    
-    # Add allergies with emphasis
-    if allergies:
-        prompt += f"ALLERGIES (STRICTLY AVOID - CRITICAL): {', '.join(allergies)}\n"
-        prompt += "The user is allergic to these items. Ensure they are completely absent from the recipe.\n\n"
-    
-    # Add health goals
-    if health_goals:
-        prompt += f"HEALTH GOALS (Consider): {', '.join(health_goals)}\n"
-        prompt += "Please try to align the recipe with these health goals (e.g., high protein for muscle gain, low carb for weight loss).\n\n"
+    # Add dietary restrictions, allergies and health goals with emphasis
+    prompt += _constraints_prompt(dietary_restrictions, allergies, health_goals)
     
     # Add flavor preferences
     # if flavor_preferences:
@@ -164,248 +370,95 @@ def construct_recipe_prompt(
     if ingredients_to_avoid:
         prompt += f"Ingredients to avoid: {', '.join(ingredients_to_avoid)}\n"
     
+    # Steer repeated requests for the same slot towards different dishes
+    if variation:
+        prompt += f"\nVARIETY: This is alternative #{variation + 1} for these specifications. Choose a clearly different dish than the most obvious choice.\n"
+    
     # Request JSON format
     prompt += "\nReturn ONLY a valid JSON object with the following format. Do not include any additional text, explanation or markdown:\n"
-    prompt += """
-    {
-        "title": "Recipe Title",
-        "description": "Brief description of the dish",
-        "ingredients": ["Ingredient 1 with quantity", "Ingredient 2 with quantity", ...],
-        "instructions": ["Step 1", "Step 2", ...],
-        "cuisine_type": "Cuisine type",
-        "meal_type": "Meal type",
-        "prep_time": prep_time_in_minutes,
-        "cook_time": cooking_time_in_minutes,
-        "total_time": total_time_in_minutes,
-        "vegetarian": boolean,
-        "vegan": boolean,
-        "gluten_free": boolean,
-        "dairy_free": boolean,
-        "nut_free": boolean,
-        "spicy_level": spicy_level_1_to_5,
-        "difficulty": "easy/medium/hard",
-        "tags": ["tag1", "tag2", ...]
-    }
-    """
+    prompt += RECIPE_JSON_FORMAT
     print(prompt)
     return prompt
 
-def extract_json_from_response(response_text: str) -> Dict[str, Any]:
-    """
-    Extract JSON from OpenAI response text
-    """
-    try:
-        logger.debug(f"Extracting JSON from response of length: {len(response_text)}")
-        
-        # Remove any markdown code block indicators
-        if "```" in response_text:
-            logger.debug("Detected code blocks in response, extracting content")
-            # Extract content between ```json and ``` markers
-            import re
-            pattern = r"```(?:json)?(.*?)```"
-            matches = re.findall(pattern, response_text, re.DOTALL)
-            if matches and len(matches) > 0:
-                # Use the first block found
-                json_str = matches[0].strip()
-                logger.debug(f"Extracted JSON from code block, length: {len(json_str)}")
-            else:
-                # If regex didn't find anything, try simple string manipulation
-                start_marker = "```json" if "```json" in response_text else "```"
-                end_marker = "```"
-                start_idx = response_text.find(start_marker) + len(start_marker)
-                end_idx = response_text.rfind(end_marker)
-                if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                    json_str = response_text[start_idx:end_idx].strip()
-                    logger.debug(f"Extracted JSON with string manipulation, length: {len(json_str)}")
-                else:
-                    # Just use the whole response if we can't find the markers
-                    json_str = response_text
-                    logger.debug("Could not find code blocks, using entire response")
-        else:
-            json_str = response_text
-            logger.debug("No code blocks detected, using entire response")
-            
-        # Basic cleanup of common JSON issues
-        json_str = json_str.strip()
-        
-        # Try to parse the JSON directly first
-        try:
-            result = json.loads(json_str)
-            logger.info("Successfully parsed JSON directly")
-            return result
-        except json.JSONDecodeError as e:
-            logger.warning(f"Initial JSON parsing failed: {str(e)}. Attempting more aggressive fixes...")
-            logger.debug(f"Failed JSON snippet (first 100 chars): {json_str[:100]}...")
-
-            # Clean up any BOM or Unicode control characters
-            import re
-            json_str = re.sub(r'[\x00-\x1F\x7F-\x9F]', '', json_str)
-            
-            # If the opening and closing brackets are missing, add them
-            json_str = json_str.strip()
-            if not json_str.startswith('[') and not json_str.startswith('{'):
-                if "name" in json_str and "description" in json_str:
-                    # Looks like a single object, wrap in array
-                    json_str = f"[{json_str}]"
-                    logger.debug("Added array brackets around object-like content")
-                
-            # Fix common JSON issues
-            json_str = fix_json_formatting(json_str)
-            logger.debug("Applied common JSON formatting fixes")
-            
-            # Try again after cleaning
-            try:
-                result = json.loads(json_str)
-                logger.info("Successfully parsed JSON after cleaning")
-                return result
-            except json.JSONDecodeError as clean_e:
-                logger.warning(f"JSON parsing after cleaning still failed: {str(clean_e)}")
-                logger.debug(f"Cleaned JSON (first 100 chars): {json_str[:100]}...")
-                
-                # Last resort: try to manually extract valid portions
-                if "[" in json_str and "]" in json_str:
-                    # Get everything between the first [ and last ]
-                    start = json_str.find('[')
-                    end = json_str.rfind(']') + 1
-                    if start != -1 and end != 0 and start < end:
-                        json_str = json_str[start:end]
-                        logger.debug(f"Extracted content between brackets: [{start}:{end}]")
-                        try:
-                            result = json.loads(json_str)
-                            logger.info("Successfully parsed JSON using bracket extraction")
-                            return result
-                        except json.JSONDecodeError:
-                            logger.warning("Bracket extraction method failed")
-                            
-                # As a last resort, try to parse it line by line to extract objects
-                logger.debug("Attempting line-by-line object extraction")
-                objects = []
-                in_object = False
-                current_object = ""
-                brace_count = 0
-                
-                for line in json_str.split('\n'):
-                    if '{' in line:
-                        brace_count += line.count('{')
-                        in_object = True
-                    if '}' in line:
-                        brace_count -= line.count('}')
-                    
-                    if in_object:
-                        current_object += line + "\n"
-                    
-                    if in_object and brace_count == 0:
-                        in_object = False
-                        try:
-                            obj = json.loads(current_object.strip())
-                            objects.append(obj)
-                            current_object = ""
-                            logger.debug(f"Extracted valid object of length: {len(current_object)}")
-                        except:
-                            logger.warning(f"Failed to parse extracted object: {current_object[:50]}...")
-                
-                if objects:
-                    logger.info(f"Manually extracted {len(objects)} objects")
-                    return objects
-                
-                # Everything failed, log the raw response for debugging
-                logger.error(f"All JSON parsing attempts failed. Raw response: {response_text[:300]}...")
-        
-        # All parsing failed, return an empty list as fallback
-        logger.error("Returning empty dict/list as fallback after all parsing attempts failed")
-        return {}
-        
-    except Exception as e:
-        logger.error(f"Error extracting JSON from response: {str(e)}")
-        # Don't include full response text as it could be very large
-        logger.error(f"First 200 chars of response: {response_text[:200]}")
-        return {}
-
-def fix_json_formatting(json_str: str) -> str:
+def _constraints_prompt(
+    dietary_restrictions: List[str],
+    allergies: Optional[List[str]] = None,
+    health_goals: Optional[List[str]] = None
+) -> str:
     """
-    Fix common JSON formatting issues
+    Prompt section for the hard constraints shared by single and batched recipe prompts
     """
-    # Fix trailing commas in arrays and objects
-    json_str = re.sub(r',\s*]', ']', json_str)
-    json_str = re.sub(r',\s*}', '}', json_str)
+    prompt = ""
     
-    # Fix missing quotes around string values in arrays
-    # This regex looks for array patterns with missing quotes
-    # For example: ["item1", value2, "item3"] -> ["item1", "value2", "item3"]
-    json_str = re.sub(r'\[([^\]]*)\]', lambda m: fix_array_quotes(m.group(0)), json_str)
+    # Add dietary restrictions with emphasis
+    if dietary_restrictions:
+        prompt += f"DIETARY RESTRICTIONS (STRICTLY FOLLOW): {', '.join(dietary_restrictions)}\n"
+        prompt += "These restrictions must be strictly followed - do not include any prohibited ingredients.\n\n"
+    
+    # Add allergies with emphasis
+    if allergies:
+        prompt += f"ALLERGIES (STRICTLY AVOID - CRITICAL): {', '.join(allergies)}\n"
+        prompt += "The user is allergic to these items. Ensure they are completely absent from the recipe.\n\n"
     
-    # Fix missing commas between array elements
-    json_str = re.sub(r'"\s+("|\[|\{)', '", \1', json_str)
+    # Add health goals
+    if health_goals:
+        prompt += f"HEALTH GOALS (Consider): {', '.join(health_goals)}\n"
+        prompt += "Please try to align the recipe with these health goals (e.g., high protein for muscle gain, low carb for weight loss).\n\n"
     
-    return json_str
+    return prompt
 
-def fix_array_quotes(array_str: str) -> str:
+def construct_batch_recipe_prompt(
+    slots: List[Tuple[Optional[str], str]],
+    dietary_restrictions: List[str],
+    skill_level: str,
+    max_cooking_time: int,
+    allergies: Optional[List[str]] = None,
+    health_goals: Optional[List[str]] = None
+) -> str:
     """
-    Fix missing quotes in array elements
+    Construct one prompt asking for a distinct recipe per (cuisine, meal type) slot
     """
-    # Skip if this doesn't look like an array
-    if not (array_str.startswith('[') and array_str.endswith(']')):
-        return array_str
-    
-    # Get the content inside the brackets
-    content = array_str[1:-1].strip()
-    
-    # If empty array, return as is
-    if not content:
-        return array_str
+    prompt = f"Create {len(slots)} distinct, detailed recipes. All recipes must follow these specifications:\n\n"
     
-    # Split by commas, but be careful with nested structures
-    elements = []
-    current = ""
-    in_quotes = False
-    brace_level = 0
-    bracket_level = 0
+    prompt += _constraints_prompt(dietary_restrictions, allergies, health_goals)
     
-    for char in content:
-        if char == '"' and (content[content.find(char)-1:content.find(char)] != '\\'):
-            in_quotes = not in_quotes
-        elif char == '{' and not in_quotes:
-            brace_level += 1
-        elif char == '}' and not in_quotes:
-            brace_level -= 1
-        elif char == '[' and not in_quotes:
-            bracket_level += 1
-        elif char == ']' and not in_quotes:
-            bracket_level -= 1
-        elif char == ',' and not in_quotes and brace_level == 0 and bracket_level == 0:
-            elements.append(current.strip())
-            current = ""
-            continue
-        
-        current += char
-    
-    if current.strip():
-        elements.append(current.strip())
+    prompt += f"Cooking skill level: {skill_level}\n"
+    prompt += f"Maximum cooking time: {max_cooking_time} minutes\n\n"
     
-    # Fix each element
-    fixed_elements = []
-    for element in elements:
-        element = element.strip()
-        # If element is not already quoted and not a number, boolean or null, add quotes
-        if not (element.startswith('"') and element.endswith('"')) and \
-           not re.match(r'^-?\d+(\.\d+)?$', element) and \
-           element not in ('true', 'false', 'null') and \
-           not (element.startswith('{') and element.endswith('}')) and \
-           not (element.startswith('[') and element.endswith(']')):
-            element = f'"{element}"'
-        fixed_elements.append(element)
+    # One line per slot; the model echoes the slot number back
+    prompt += "Create exactly one recipe for each of these slots, and make every recipe a clearly different dish:\n"
+    for i, (cuisine, meal_type) in enumerate(slots):
+        prompt += f"Slot {i}: cuisine {cuisine or 'any'}, meal type {meal_type}\n"
     
-    return '[' + ', '.join(fixed_elements) + ']'
+    prompt += "\nReturn ONLY a valid JSON array of recipe objects in slot order. Do not include any additional text, explanation or markdown. "
+    prompt += "Each object must have the following format, with \"slot\" set to its slot number:\n"
+    prompt += RECIPE_JSON_FORMAT.replace('{\n        "title"', '{\n        "slot": slot_number,\n        "title"', 1)
+    return prompt
 
-def fix_trailing_commas(json_str: str) -> str:
+def extract_json_from_response(response_text: str) -> Any:
     """
-    Fix trailing commas in JSON
+    Extract JSON from OpenAI response text.
+    Returns the parsed value, a list if the response holds several separate
+    top-level values, or an empty dict if nothing could be parsed.
     """
-    # Fix trailing commas in arrays
-    json_str = re.sub(r',\s*]', ']', json_str)
-    # Fix trailing commas in objects
-    json_str = re.sub(r',\s*}', '}', json_str)
-    return json_str
+    logger.debug(f"Extracting JSON from response of length: {len(response_text)}")
+    
+    # One repairing pass over the text; see TolerantJSONParser for what it fixes
+    values = parse_json_values(response_text)
+    
+    # Drop empty containers picked up from braces in surrounding prose
+    non_empty = [value for value in values if value not in ({}, [])]
+    if non_empty:
+        values = non_empty
+    
+    if not values:
+        logger.error(f"Could not parse any JSON from response. First 200 chars: {response_text[:200]}")
+        return {}
+    
+    if len(values) > 1:
+        logger.info(f"Extracted {len(values)} separate JSON values")
+        return values
+    return values[0]
 
 def generate_fallback_recipe(cuisine_preferences: List[str], meal_type: str) -> Dict[str, Any]:
     """
@@ -782,6 +835,29 @@ async def get_cuisine_recommendations(
     # Add preference parameters
     dietary_restrictions: Optional[List[str]] = None,
     allergies: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Generate cuisine recommendations for a natural language query.
+    Concurrent calls for the same normalized query and restrictions share one request.
+    """
+    key = (normalize_query(query), limit, restrictions_key(dietary_restrictions, allergies))
+    try:
+        recommendations = await explore_flight.do(key, lambda: _get_cuisine_recommendations(
+            query, limit, dietary_restrictions, allergies
+        ))
+    except DeadlineExceeded:
+        # The shared call runs on without this caller's deadline; answer locally in time
+        logger.warning("Request deadline reached waiting for shared cuisine recommendations, using fallback")
+        return generate_fallback_recommendations(query, limit)
+    # Every caller gets its own copy of the shared result
+    return copy.deepcopy(recommendations)
+
+async def _get_cuisine_recommendations(
+    query: str, 
+    limit: int = 5,
+    # Add preference parameters
+    dietary_restrictions: Optional[List[str]] = None,
+    allergies: Optional[List[str]] = None
 ) -> List[Dict[str, Any]]:
     """
     Generate cuisine recommendations based on a natural language query
@@ -794,7 +870,6 @@ async def get_cuisine_recommendations(
     Returns:
         List of cuisine recommendations with details
     """
-    import asyncio
     
     try:
         # Set a reasonable limit range
@@ -802,6 +877,11 @@ async def get_cuisine_recommendations(
             limit = 5
         elif limit > 10:
             limit = 10
+        
+        # Serve semantically equivalent queries from the cache
+        cached = explore_cache.get(query, limit, dietary_restrictions, allergies)
+        if cached is not None:
+            return cached
             
         # Shorter, more direct prompt optimized for speed, now including preferences
         prompt = f'''Give exactly {limit} cuisine recommendations similar to "{query}" as a JSON array.
@@ -819,24 +899,23 @@ Consider the following user preferences:
         
         logger.info(f"Starting cuisine recommendation for query: '{query}', limit: {limit}, restrictions: {dietary_restrictions}, allergies: {allergies}")
         
-        # Create a timeout coroutine for the main API call - 8 second timeout
+        # Time-limited API call; a timeout is reported by the HTTP client, so the
+        # circuit breaker sees it as a failed call. A call slower than usual is
+        # hedged with an identical one, and the first response wins.
         try:
-            # Call OpenAI API asynchronously with timeout
-            response = await asyncio.wait_for(
-                openai.ChatCompletion.acreate(
-                    model="gpt-3.5-turbo",  # Faster than using more complex models
-                    messages=[
-                        {"role": "system", "content": "You are a culinary expert. Respond with a JSON array of cuisine recommendations."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=1500,
-                    temperature=0.8
-                ),
-                timeout=10  # 3 second timeout   
-            )
+            response = await explore_hedger.run(lambda: chat_completion(
+                model="gpt-3.5-turbo",  # Faster than using more complex models
+                messages=[
+                    {"role": "system", "content": "You are a culinary expert. Respond with a JSON array of cuisine recommendations."},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=1500,
+                temperature=0.8,
+                timeout=EXPLORE_TIMEOUT_SECONDS
+            ))
             
             # Log raw response for debugging
-            response_content = response.choices[0].message.content
+            response_content = completion_text(response)
             logger.info(f"Received response in first attempt")
             
             # Extract and parse the JSON response
@@ -901,13 +980,15 @@ Consider the following user preferences:
                 # If we have valid results from the API, return them
                 if validated_results:
                     logger.info(f"Returning {len(validated_results)} validated cuisine recommendations from API")
+                    # Only API results are cached; fallbacks are cheap to rebuild
+                    explore_cache.put(query, limit, validated_results[:limit], dietary_restrictions, allergies)
                     return validated_results[:limit]
                     
             # If we reached here, the API didn't return usable results
             logger.warning("No valid cuisine recommendations from API, using fallback")
                 
-        except asyncio.TimeoutError:
-            logger.warning("API call timed out after 3 seconds")
+        except httpx.TimeoutException:
+            logger.warning(f"API call timed out after {EXPLORE_TIMEOUT_SECONDS} seconds")
             
         # If we get here, either the API call failed, timed out, or returned invalid data
         # Fall back to generating recommendations directly
@@ -924,205 +1005,12 @@ def generate_fallback_recommendations(query: str, limit: int = 3) -> List[Dict[s
     logger.info(f"Generating fallback recommendations for: {query}")
     
     # Extract the actual food item from query like "I want to eat idli"
-    food_terms = query.lower().split()
-    if "eat" in food_terms and food_terms.index("eat") < len(food_terms) - 1:
-        food_item = food_terms[food_terms.index("eat") + 1].strip('.,?!')
-    else:
-        # Take the last word as the food item if "eat" not found
-        food_item = food_terms[-1].strip('.,?!')
+    food_item = normalize_query(query) or query.strip()
     
     logger.info(f"Extracted food item: {food_item}")
     
-    # Database of popular dishes by cuisine for authentic recommendations
-    cuisine_dishes = {
-        "Indian": [
-            {
-                "name": "Dosa",
-                "description": "A thin crispy pancake made from fermented rice and lentil batter, often served with chutneys and sambar.",
-                "key_ingredients": ["Rice flour", "Lentils", "Fenugreek seeds", "Ghee"],
-                "flavor_profile": "Savory with tangy notes from fermentation"
-            },
-            {
-                "name": "Vada",
-                "description": "Crispy savory doughnut-shaped fritters made from lentil or gram flour, often served as a breakfast item or snack.",
-                "key_ingredients": ["Urad dal", "Rice flour", "Ginger", "Green chilies", "Curry leaves"],
-                "flavor_profile": "Savory and spicy with a crispy exterior and soft interior"
-            },
-            {
-                "name": "Uttapam",
-                "description": "A thick pancake made with a fermented rice and lentil batter, topped with vegetables and herbs.",
-                "key_ingredients": ["Rice", "Urad dal", "Onions", "Tomatoes", "Green chilies"],
-                "flavor_profile": "Savory and slightly tangy with fresh vegetable flavors"
-            }
-        ],
-        "Thai": [
-            {
-                "name": "Pad Thai",
-                "description": "Stir-fried rice noodles with a sweet, savory and slightly sour sauce, typically with tofu, bean sprouts, peanuts and egg.",
-                "key_ingredients": ["Rice noodles", "Tamarind paste", "Fish sauce", "Palm sugar", "Bean sprouts", "Peanuts"],
-                "flavor_profile": "Sweet, sour, and savory with umami notes"
-            },
-            {
-                "name": "Tom Kha Gai",
-                "description": "A creamy coconut soup with chicken, galangal, lemongrass and lime, known for its aromatic and spicy flavor.",
-                "key_ingredients": ["Coconut milk", "Galangal", "Lemongrass", "Kaffir lime leaves", "Chicken"],
-                "flavor_profile": "Creamy, aromatic with a balance of sour, spicy and sweet notes"
-            },
-            {
-                "name": "Green Curry",
-                "description": "A rich, aromatic curry made with fresh green chili paste, coconut milk and Thai basil.",
-                "key_ingredients": ["Green curry paste", "Coconut milk", "Thai basil", "Kaffir lime leaves", "Fish sauce"],
-                "flavor_profile": "Spicy, aromatic and herbaceous with a creamy texture"
-            }
-        ],
-        "Mexican": [
-            {
-                "name": "Tacos al Pastor",
-                "description": "Marinated pork tacos cooked on a vertical spit, served on small corn tortillas with pineapple, onion and cilantro.",
-                "key_ingredients": ["Marinated pork", "Corn tortillas", "Pineapple", "Onion", "Cilantro"],
-                "flavor_profile": "Savory and spicy with sweet notes from the pineapple"
-            },
-            {
-                "name": "Chiles Rellenos",
-                "description": "Poblano peppers stuffed with cheese, battered and fried, typically served with a tomato-based sauce.",
-                "key_ingredients": ["Poblano peppers", "Cheese", "Eggs", "Tomato sauce"],
-                "flavor_profile": "Mild spice with rich, cheesy interior and slight smokiness"
-            },
-            {
-                "name": "Mole Poblano",
-                "description": "A rich sauce made with chocolate, chili peppers, and numerous spices, typically served over chicken or turkey.",
-                "key_ingredients": ["Chocolate", "Dried chilies", "Nuts", "Seeds", "Spices"],
-                "flavor_profile": "Complex mix of spicy, sweet, and savory with earthy notes"
-            }
-        ],
-        "Italian": [
-            {
-                "name": "Risotto ai Funghi",
-                "description": "Creamy rice dish cooked slowly with mushrooms, white wine, and Parmesan cheese.",
-                "key_ingredients": ["Arborio rice", "Mushrooms", "White wine", "Parmesan cheese", "Onion"],
-                "flavor_profile": "Rich, creamy with earthy mushroom flavors"
-            },
-            {
-                "name": "Osso Buco",
-                "description": "Veal shanks braised with vegetables, white wine and broth, traditionally served with gremolata.",
-                "key_ingredients": ["Veal shanks", "Mirepoix", "White wine", "Tomatoes", "Gremolata"],
-                "flavor_profile": "Rich, savory with bright citrus notes from the gremolata"
-            },
-            {
-                "name": "Spaghetti alla Carbonara",
-                "description": "Pasta dish with eggs, hard cheese, cured pork, and black pepper.",
-                "key_ingredients": ["Spaghetti", "Eggs", "Pecorino Romano", "Guanciale or pancetta", "Black pepper"],
-                "flavor_profile": "Rich, savory with a silky texture and peppery finish"
-            }
-        ],
-        "Japanese": [
-            {
-                "name": "Ramen",
-                "description": "Wheat noodles served in a meat or fish-based broth, often flavored with soy sauce or miso, and topped with ingredients such as sliced pork, dried seaweed, and green onions.",
-                "key_ingredients": ["Wheat noodles", "Pork or chicken broth", "Soy sauce", "Chashu pork", "Nori"],
-                "flavor_profile": "Rich, savory with complex umami depth"
-            },
-            {
-                "name": "Okonomiyaki",
-                "description": "Savory pancake containing a variety of ingredients like cabbage, meat or seafood, topped with Japanese mayonnaise and okonomiyaki sauce.",
-                "key_ingredients": ["Cabbage", "Flour batter", "Eggs", "Pork belly", "Okonomiyaki sauce"],
-                "flavor_profile": "Savory with sweet and tangy sauce notes"
-            },
-            {
-                "name": "Katsu Curry",
-                "description": "Breaded, deep-fried cutlet of meat served with Japanese curry sauce over rice.",
-                "key_ingredients": ["Pork or chicken cutlet", "Japanese curry roux", "Rice", "Vegetables"],
-                "flavor_profile": "Savory, mildly spiced curry with crispy meat texture"
-            }
-        ]
-    }
-    
-    # Find similar cuisines based on food item
-    # This is a simplistic matching - in a real app you would use a real recommendation system
-    cuisine_similarity = {}
-    found_exact_match = False
-    
-    # Check if we have an exact match for the food item
-    for cuisine, dishes in cuisine_dishes.items():
-        for dish in dishes:
-            if food_item.lower() in dish["name"].lower():
-                # Direct match to a dish, prioritize that cuisine
-                cuisine_similarity[cuisine] = 0.9
-                found_exact_match = True
-            elif food_item.lower() in [ingredient.lower() for ingredient in dish["key_ingredients"]]:
-                # Ingredient match
-                cuisine_similarity[cuisine] = 0.7
-                
-    # If no exact match, assign default similarities
-    if not found_exact_match:
-        if "rice" in food_item or "curry" in food_item or "dosa" in food_item or "idli" in food_item:
-            cuisine_similarity = {"Indian": 0.9, "Thai": 0.7, "Japanese": 0.5}
-        elif "pasta" in food_item or "pizza" in food_item:
-            cuisine_similarity = {"Italian": 0.9, "Mexican": 0.4, "Indian": 0.2}
-        elif "taco" in food_item or "burrito" in food_item:
-            cuisine_similarity = {"Mexican": 0.9, "Indian": 0.4, "Thai": 0.3}
-        elif "sushi" in food_item or "ramen" in food_item:
-            cuisine_similarity = {"Japanese": 0.9, "Thai": 0.5, "Indian": 0.2}
-        else:
-            # Default similarities
-            cuisine_similarity = {"Indian": 0.3, "Thai": 0.3, "Mexican": 0.3, "Italian": 0.3, "Japanese": 0.3}
-    
-    # Sort cuisines by similarity
-    sorted_cuisines = sorted(cuisine_similarity.items(), key=lambda x: x[1], reverse=True)
-    
-    # Generate recommendations
-    recommendations = []
-    used_dishes = set()
-    
-    for cuisine, _ in sorted_cuisines:
-        if len(recommendations) >= limit:
-            break
-            
-        # Get available dishes for this cuisine
-        available_dishes = [dish for dish in cuisine_dishes.get(cuisine, []) 
-                          if dish["name"] not in used_dishes]
-        
-        if not available_dishes:
-            continue
-            
-        # Add dishes from this cuisine
-        for dish in available_dishes:
-            if len(recommendations) >= limit:
-                break
-                
-            # Create a copy to avoid modifying the original
-            recommendation = dish.copy()
-            
-            # Add similarity reason based on query
-            if food_item.lower() in dish["name"].lower():
-                recommendation["similarity_reason"] = f"This is a variation of {food_item} from {cuisine} cuisine."
-            else:
-                recommendation["similarity_reason"] = f"This {cuisine} dish has a similar texture and flavor profile to {food_item}."
-            
-            recommendations.append(recommendation)
-            used_dishes.add(dish["name"])
-    
-    # If we still need more recommendations
-    if len(recommendations) < limit:
-        # Fill with generic recommendations
-        for i in range(len(recommendations), limit):
-            idx = i % len(sorted_cuisines)
-            cuisine = sorted_cuisines[idx][0]
-            
-            # Make a generic recommendation
-            rec = {
-                "name": f"{cuisine} {['Specialty', 'Delicacy', 'Classic', 'Favorite'][i % 4]}",
-                "description": f"A traditional {cuisine} dish with flavors that complement {food_item}.",
-                "key_ingredients": [
-                    f"{['Fresh', 'Aromatic', 'Traditional', 'Local'][i % 4]} ingredients",
-                    f"{cuisine} spices and herbs",
-                    "Regional vegetables",
-                    "Authentic seasonings"
-                ],
-                "flavor_profile": f"{['Rich and aromatic', 'Perfectly balanced', 'Bold and flavorful', 'Delicate and nuanced'][i % 4]}",
-                "similarity_reason": f"Uses cooking techniques and flavor combinations that would appeal to fans of {food_item}."
-            }
-            recommendations.append(rec)
+    # Rank dishes against the precompiled local cuisine knowledge
+    recommendations = get_cuisine_index().recommend(food_item, food_item, limit)
     
     logger.info(f"Created {len(recommendations)} authentic fallback recommendations")
     return recommendations[:limit] 
\ No newline at end of file
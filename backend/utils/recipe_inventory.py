@@ -0,0 +1,396 @@
+"""
+Warm inventory of pre-generated recipes for onboarding.
+
+Recipes are pooled in the recipe_inventory table by preference bucket:
+(cuisine, meal type, dietary signature, skill level). The dietary signature is
+the canonical restrictions|allergies key, so a pooled recipe is only handed to
+users whose hard constraints it was generated for.
+
+Onboarding takes recipes from matching buckets first and only generates the
+slots the inventory could not fill. Every slot taken counts as demand for its
+bucket. Demand decays with a half-life, and each bucket's target depth follows
+its recent demand. A background task tops buckets up to their targets with
+batched LLM calls at prefetch priority, so refills never hold up users who are
+waiting on a response.
+
+Demand is kept in memory, so the refill task runs in the process that records
+it: whichever runs the generation jobs, i.e. each standalone worker, or the
+API when it runs jobs in-process. With several workers each one sizes buckets
+from the share of onboarding traffic it has served.
+"""
+import os
+import json
+import math
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from database.database import SessionLocal, engine
+from models.inventory import InventoryRecipe
+from utils.circuit_breaker import CircuitOpenError
+from utils.explore_cache import restrictions_key
+from utils.llm_scheduler import PRIORITY_PREFETCH, LLMRequestPreempted, llm_request_context
+from utils.metrics import register_stats_provider
+from utils.openai_helper import generate_recipes_batch
+
+logger = logging.getLogger(__name__)
+
+# Inventory configuration
+INVENTORY_ENABLED = os.getenv("INVENTORY_ENABLED", "true").lower() == "true"
+# Bucket demand halves every half-life without new onboarding traffic
+INVENTORY_DEMAND_HALF_LIFE_SECONDS = float(os.getenv("INVENTORY_DEMAND_HALF_LIFE_SECONDS", "3600"))
+# Share of recent demand kept ready in a bucket, and the bounds on its depth
+INVENTORY_DEPTH_PER_DEMAND = float(os.getenv("INVENTORY_DEPTH_PER_DEMAND", "0.5"))
+INVENTORY_MIN_DEPTH = int(os.getenv("INVENTORY_MIN_DEPTH", "2"))
+INVENTORY_MAX_DEPTH = int(os.getenv("INVENTORY_MAX_DEPTH", "12"))
+INVENTORY_MAX_TOTAL = int(os.getenv("INVENTORY_MAX_TOTAL", "2000"))
+INVENTORY_TTL_SECONDS = int(os.getenv("INVENTORY_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+# Refill cadence, and the size and number of concurrent refill batches
+INVENTORY_REFILL_INTERVAL_SECONDS = float(os.getenv("INVENTORY_REFILL_INTERVAL_SECONDS", "30"))
+INVENTORY_REFILL_BATCH = int(os.getenv("INVENTORY_REFILL_BATCH", "4"))
+INVENTORY_REFILL_CONCURRENCY = int(os.getenv("INVENTORY_REFILL_CONCURRENCY", "2"))
+# Cooking time limit for refills of buckets whose users never asked for less
+INVENTORY_DEFAULT_MAX_COOKING_TIME = 60
+
+# Buckets whose decayed demand falls below this are forgotten
+MIN_TRACKED_DEMAND = 0.05
+
+# Scheduler user that refill traffic is queued under
+REFILL_USER = "inventory"
+
+Bucket = Tuple[str, str, str, str]
+
+def bucket_for(
+    cuisine: Optional[str],
+    meal_type: str,
+    dietary_restrictions: Optional[List[str]],
+    allergies: Optional[List[str]],
+    skill_level: Optional[str]
+) -> Bucket:
+    """
+    Inventory bucket for one onboarding slot
+    """
+    return (
+        (cuisine or "").strip().lower(),
+        (meal_type or "dinner").strip().lower(),
+        restrictions_key(dietary_restrictions, allergies),
+        (skill_level or "medium").strip().lower()
+    )
+
+def _split_signature(signature: str) -> Tuple[List[str], List[str]]:
+    restrictions, _, allergens = signature.partition("|")
+    return (
+        [r for r in restrictions.split(",") if r],
+        [a for a in allergens.split(",") if a]
+    )
+
+class _BucketDemand:
+    __slots__ = ("demand", "updated", "max_cooking_time")
+
+    def __init__(self):
+        self.demand = 0.0
+        self.updated = time.monotonic()
+        self.max_cooking_time = None
+
+    def decayed(self, now: float) -> float:
+        if INVENTORY_DEMAND_HALF_LIFE_SECONDS <= 0:
+            return self.demand
+        return self.demand * 0.5 ** ((now - self.updated) / INVENTORY_DEMAND_HALF_LIFE_SECONDS)
+
+    def add(self, amount: float, now: float):
+        self.demand = self.decayed(now) + amount
+        self.updated = now
+
+class RecipeInventory:
+    """
+    Demand-driven pool of ready recipes with a background refill task
+    """
+    def __init__(self):
+        self._demand: Dict[Bucket, _BucketDemand] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._refilling = set()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.refill_rounds = 0
+        self.refilled = 0
+        self.refill_failures = 0
+        self.expired = 0
+
+    def record_demand(self, bucket: Bucket, max_cooking_time: Optional[int] = None, amount: float = 1.0):
+        """
+        Count onboarding demand for a bucket
+        """
+        entry = self._demand.get(bucket)
+        if entry is None:
+            entry = _BucketDemand()
+            self._demand[bucket] = entry
+        entry.add(amount, time.monotonic())
+        if max_cooking_time:
+            # Refill for the strictest time limit seen so every user can take the recipes
+            entry.max_cooking_time = min(entry.max_cooking_time or max_cooking_time, max_cooking_time)
+
+    def target_depth(self, bucket: Bucket) -> int:
+        """
+        How many recipes the bucket should hold, from its recent demand
+        """
+        entry = self._demand.get(bucket)
+        if entry is None:
+            return 0
+        demand = entry.decayed(time.monotonic())
+        if demand < MIN_TRACKED_DEMAND:
+            return 0
+        return max(INVENTORY_MIN_DEPTH, min(INVENTORY_MAX_DEPTH, math.ceil(demand * INVENTORY_DEPTH_PER_DEMAND)))
+
+    def take(
+        self,
+        db: Session,
+        buckets: Iterable[Tuple[int, Bucket]],
+        max_cooking_time: Optional[int] = None,
+        exclude_titles: Iterable[str] = ()
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        Take one pooled recipe per (slot index, bucket) pair, where available.
+        Returns the recipes by slot index; taken recipes leave the inventory.
+        """
+        taken = {}
+        if not INVENTORY_ENABLED:
+            return taken
+
+        titles = set(exclude_titles)
+        for index, bucket in buckets:
+            self.record_demand(bucket, max_cooking_time)
+            cuisine, meal_type, signature, skill_level = bucket
+            try:
+                query = db.query(InventoryRecipe).filter(
+                    InventoryRecipe.cuisine == cuisine,
+                    InventoryRecipe.meal_type == meal_type,
+                    InventoryRecipe.dietary_signature == signature,
+                    InventoryRecipe.skill_level == skill_level
+                )
+                if max_cooking_time:
+                    query = query.filter(InventoryRecipe.total_time <= max_cooking_time)
+                if titles:
+                    query = query.filter(InventoryRecipe.title.notin_(titles))
+                # Concurrent onboardings on Postgres skip each other's rows instead of waiting
+                row = query.order_by(InventoryRecipe.created_at).with_for_update(skip_locked=True).first()
+                if row is None:
+                    self.misses += 1
+                    continue
+                recipe_data = row.recipe_data
+                db.delete(row)
+                db.commit()
+            except SQLAlchemyError as e:
+                logger.error(f"Error taking recipe from inventory: {str(e)}")
+                db.rollback()
+                self.misses += 1
+                continue
+
+            self.hits += 1
+            titles.add(recipe_data.get("title", ""))
+            taken[index] = recipe_data
+
+        # Refill what was just taken (and any new demand) in the background
+        self.wake()
+        return taken
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    def _depths(self, db: Session) -> Dict[Bucket, int]:
+        rows = db.query(
+            InventoryRecipe.cuisine,
+            InventoryRecipe.meal_type,
+            InventoryRecipe.dietary_signature,
+            InventoryRecipe.skill_level,
+            func.count(InventoryRecipe.id)
+        ).group_by(
+            InventoryRecipe.cuisine,
+            InventoryRecipe.meal_type,
+            InventoryRecipe.dietary_signature,
+            InventoryRecipe.skill_level
+        ).all()
+        return {tuple(row[:4]): row[4] for row in rows}
+
+    def _purge_expired(self, db: Session):
+        cutoff = datetime.utcnow() - timedelta(seconds=INVENTORY_TTL_SECONDS)
+        removed = db.query(InventoryRecipe).filter(InventoryRecipe.created_at < cutoff).delete(synchronize_session=False)
+        db.commit()
+        if removed:
+            self.expired += removed
+            logger.info(f"Expired {removed} recipes from the inventory")
+
+    def _forget_idle_buckets(self):
+        now = time.monotonic()
+        for bucket in [b for b, entry in self._demand.items() if entry.decayed(now) < MIN_TRACKED_DEMAND]:
+            del self._demand[bucket]
+
+    async def refill_once(self):
+        """
+        Top every bucket with demand up to its target depth
+        """
+        self.refill_rounds += 1
+        self._forget_idle_buckets()
+        db = SessionLocal()
+        try:
+            self._purge_expired(db)
+            depths = self._depths(db)
+        except SQLAlchemyError as e:
+            logger.error(f"Error reading inventory depths: {str(e)}")
+            db.rollback()
+            return
+        finally:
+            db.close()
+
+        room = INVENTORY_MAX_TOTAL - sum(depths.values())
+        deficits = []
+        for bucket in self._demand:
+            if bucket in self._refilling:
+                continue
+            deficit = self.target_depth(bucket) - depths.get(bucket, 0)
+            if deficit > 0:
+                deficits.append((deficit, bucket))
+        if not deficits or room <= 0:
+            return
+
+        # Emptiest buckets first, within the overall size bound
+        deficits.sort(reverse=True)
+        semaphore = asyncio.Semaphore(INVENTORY_REFILL_CONCURRENCY)
+        jobs = []
+        for deficit, bucket in deficits:
+            size = min(deficit, INVENTORY_REFILL_BATCH, room)
+            if size <= 0:
+                break
+            room -= size
+            jobs.append(self._refill_bucket(bucket, size, semaphore))
+        await asyncio.gather(*jobs)
+
+    async def _refill_bucket(self, bucket: Bucket, size: int, semaphore: asyncio.Semaphore):
+        cuisine, meal_type, signature, skill_level = bucket
+        dietary_restrictions, allergies = _split_signature(signature)
+        entry = self._demand.get(bucket)
+        max_cooking_time = (entry.max_cooking_time if entry else None) or INVENTORY_DEFAULT_MAX_COOKING_TIME
+
+        self._refilling.add(bucket)
+        try:
+            async with semaphore:
+                logger.info(f"Refilling inventory bucket {bucket} with {size} recipes")
+                db = SessionLocal()
+                try:
+                    existing = {
+                        title.lower() for (title,) in db.query(InventoryRecipe.title).filter(
+                            InventoryRecipe.cuisine == cuisine,
+                            InventoryRecipe.meal_type == meal_type,
+                            InventoryRecipe.dietary_signature == signature,
+                            InventoryRecipe.skill_level == skill_level
+                        )
+                    }
+                    with llm_request_context(priority=PRIORITY_PREFETCH, user_id=REFILL_USER):
+                        async for _, recipe_data in generate_recipes_batch(
+                            slots=[(cuisine or None, meal_type)] * size,
+                            dietary_restrictions=dietary_restrictions,
+                            skill_level=skill_level,
+                            max_cooking_time=max_cooking_time,
+                            allergies=allergies
+                        ):
+                            title = recipe_data.get("title", "")
+                            if title.lower() in existing:
+                                continue
+                            existing.add(title.lower())
+                            total_time = recipe_data.get("total_time")
+                            if not isinstance(total_time, int):
+                                prep_time = recipe_data.get("prep_time", 0)
+                                cook_time = recipe_data.get("cook_time", 0)
+                                total_time = (prep_time if isinstance(prep_time, int) else 0) + (cook_time if isinstance(cook_time, int) else 0)
+                            db.add(InventoryRecipe(
+                                cuisine=cuisine,
+                                meal_type=meal_type,
+                                dietary_signature=signature,
+                                skill_level=skill_level,
+                                title=title,
+                                total_time=total_time,
+                                recipe=json.dumps(recipe_data)
+                            ))
+                            db.commit()
+                            self.refilled += 1
+                finally:
+                    db.close()
+        except (LLMRequestPreempted, CircuitOpenError) as e:
+            # Users come first; the next round tries again
+            logger.info(f"Inventory refill for {bucket} deferred: {str(e)}")
+        except Exception as e:
+            self.refill_failures += 1
+            logger.error(f"Inventory refill for {bucket} failed: {str(e)}")
+        finally:
+            self._refilling.discard(bucket)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), INVENTORY_REFILL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.refill_once()
+            except Exception as e:
+                logger.error(f"Inventory refill round failed: {str(e)}")
+
+    def start(self):
+        """
+        Start the background refill task
+        """
+        if not INVENTORY_ENABLED or self._task is not None:
+            return
+        # Deployments created before the inventory existed do not have its table yet
+        InventoryRecipe.__table__.create(bind=engine, checkfirst=True)
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info("Recipe inventory refill task started")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._wake = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        now = time.monotonic()
+        return {
+            "enabled": INVENTORY_ENABLED,
+            "tracked_buckets": len(self._demand),
+            "buckets": {
+                "/".join(bucket): {
+                    "demand": round(entry.decayed(now), 2),
+                    "target_depth": self.target_depth(bucket)
+                }
+                for bucket, entry in list(self._demand.items())[:50]
+            },
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "refill_rounds": self.refill_rounds,
+            "refilled": self.refilled,
+            "refill_failures": self.refill_failures,
+            "refilling": len(self._refilling),
+            "expired": self.expired
+        }
+
+recipe_inventory = RecipeInventory()
+
+register_stats_provider("recipe_inventory", recipe_inventory.stats)
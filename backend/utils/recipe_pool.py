@@ -0,0 +1,284 @@
+"""
+Shared pool of AI-generated recipes, reused across users with the same preferences.
+
+Onboarding recipes are stored once as shared rows tagged with a canonical
+preference signature: cuisine, meal type, dietary signature, skill level and
+cooking time band. Users reach them through user_recipe_assignments, so a
+feed references shared rows instead of private copies. A new user's slot is
+filled from the pool first, with a recipe they have never been assigned, and
+only goes to the LLM when the pool for that signature is dry or exhausted for
+that user.
+
+Feeds are versioned. A regeneration writes its assignments under a new
+generation id while the feed keeps showing the current one. Once enough
+recipes are ready, user_preferences.feed_generation is moved to the new id in
+a single UPDATE. The superseded generation is then retired in the background,
+in chunks: its assignments are deactivated and the user's old private AI
+recipes are deleted.
+
+Feeds are paged in the order recipes were added to them, which is the order
+of their assignment ids. Private AI recipes get an assignment too, so
+recipes added later, by a prefetch for instance, always go to later pages
+and never push the pages a user has already seen.
+"""
+import os
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import exists, func, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from database.database import SessionLocal
+from models.assignment import UserRecipeAssignment
+from models.recipe import Recipe
+from utils.metrics import register_stats_provider
+from utils.recipe_inventory import bucket_for
+
+logger = logging.getLogger(__name__)
+
+# Rows retired per statement when collecting superseded feed generations
+FEED_GC_CHUNK_SIZE = int(os.getenv("FEED_GC_CHUNK_SIZE", "500"))
+
+# Cooking time limits are rounded down to a band so nearby limits share recipes
+COOKING_TIME_BANDS = (15, 20, 30, 45, 60, 90, 120)
+
+# Matches a user's feed: shared rows assigned to them in the visible generation,
+# plus their private AI recipes
+USER_FEED_CONDITION = """
+    (
+        (generated_for_user_id = :user_id AND is_ai_generated = TRUE AND preference_signature IS NULL)
+        OR id IN (
+            SELECT a.recipe_id FROM user_recipe_assignments a
+            JOIN user_preferences p ON p.user_id = a.user_id
+            WHERE a.user_id = :user_id AND a.generation = p.feed_generation AND a.active = TRUE
+        )
+    )
+"""
+
+# Feed order: assignment order, with private recipes from before assignments
+# existed first. Binds :user_id like USER_FEED_CONDITION.
+USER_FEED_ORDER = """
+    COALESCE(
+        (SELECT a.id FROM user_recipe_assignments a WHERE a.user_id = :user_id AND a.recipe_id = recipes.id),
+        0
+    ), id
+"""
+
+def cooking_time_band(max_cooking_time: Optional[int]) -> int:
+    """
+    The band a cooking time limit falls in; recipes for the band fit the limit
+    """
+    max_cooking_time = max_cooking_time or 60
+    fitting = [band for band in COOKING_TIME_BANDS if band <= max_cooking_time]
+    return fitting[-1] if fitting else max_cooking_time
+
+def preference_signature(
+    cuisine: Optional[str],
+    meal_type: str,
+    dietary_restrictions: Optional[List[str]],
+    allergies: Optional[List[str]],
+    skill_level: Optional[str],
+    max_cooking_time: Optional[int]
+) -> str:
+    """
+    Canonical signature of the preferences a shared recipe was generated for
+    """
+    bucket = bucket_for(cuisine, meal_type, dietary_restrictions, allergies, skill_level)
+    return "/".join(bucket) + f"/{cooking_time_band(max_cooking_time)}"
+
+class RecipePool:
+    """
+    Claims shared recipes for users and records the assignments
+    """
+    def __init__(self):
+        # Metrics
+        self.reused = 0
+        self.created = 0
+        self.dry = 0
+        self.swaps = 0
+        self.retired_assignments = 0
+        self.deleted_private = 0
+        self._collectors: Set[asyncio.Task] = set()
+
+    def claim(
+        self,
+        db: Session,
+        user_id: int,
+        signature: str,
+        exclude_titles: Iterable[str] = ()
+    ) -> Optional[Recipe]:
+        """
+        Find a shared recipe for the signature that the user has never been assigned.
+        Returns None when the pool is dry or exhausted for the user.
+        """
+        previously_assigned = exists().where(
+            UserRecipeAssignment.recipe_id == Recipe.id,
+            UserRecipeAssignment.user_id == user_id
+        )
+        query = db.query(Recipe).filter(
+            Recipe.preference_signature == signature,
+            ~previously_assigned
+        )
+        titles = list(exclude_titles)
+        if titles:
+            query = query.filter(Recipe.title.notin_(titles))
+        recipe = query.order_by(Recipe.id).first()
+        if recipe is None:
+            self.dry += 1
+        return recipe
+
+    def assign(self, db: Session, user_id: int, recipe: Recipe, generation: int, created: bool = False):
+        """
+        Put a shared recipe in a feed generation of the user; the caller commits
+        """
+        db.add(UserRecipeAssignment(user_id=user_id, recipe_id=recipe.id, generation=generation, active=True))
+        if created:
+            self.created += 1
+        else:
+            self.reused += 1
+
+    def append_private(self, db: Session, user_id: int, recipe: Recipe):
+        """
+        Place a private AI recipe at the end of the user's feed; the caller commits.
+        The recipe must be flushed so it has an id.
+        """
+        generation = db.execute(
+            text("SELECT feed_generation FROM user_preferences WHERE user_id = :user_id"),
+            {"user_id": user_id}
+        ).scalar() or 0
+        db.add(UserRecipeAssignment(user_id=user_id, recipe_id=recipe.id, generation=generation, active=True))
+
+    def feed_recipes(self, db: Session, user_id: int) -> List[Recipe]:
+        """
+        The AI recipes currently in the user's feed, in feed order
+        """
+        ids = [row[0] for row in db.execute(
+            text(f"SELECT id FROM recipes WHERE {USER_FEED_CONDITION} ORDER BY {USER_FEED_ORDER}"),
+            {"user_id": user_id}
+        )]
+        if not ids:
+            return []
+        recipes = {recipe.id: recipe for recipe in db.query(Recipe).filter(Recipe.id.in_(ids))}
+        return [recipes[recipe_id] for recipe_id in ids if recipe_id in recipes]
+
+    def remove_from_feed(self, db: Session, user_id: int, recipe: Recipe):
+        """
+        Take one recipe out of the user's feed; the caller commits.
+        Shared recipes stay in the pool, private ones are deleted.
+        """
+        if recipe.preference_signature is None:
+            db.delete(recipe)
+            return
+        db.execute(
+            text(
+                "UPDATE user_recipe_assignments SET active = FALSE "
+                "WHERE user_id = :user_id AND recipe_id = :recipe_id"
+            ),
+            {"user_id": user_id, "recipe_id": recipe.id}
+        )
+
+    def next_generation(self, db: Session, user_id: int) -> int:
+        """
+        A new, not yet visible feed generation id for the user
+        """
+        current = db.execute(
+            text("SELECT feed_generation FROM user_preferences WHERE user_id = :user_id"),
+            {"user_id": user_id}
+        ).scalar() or 0
+        # Skip past generations left pending by an interrupted run
+        written = db.query(func.max(UserRecipeAssignment.generation)).filter(
+            UserRecipeAssignment.user_id == user_id
+        ).scalar() or 0
+        return max(current, written) + 1
+
+    def activate_generation(self, db: Session, user_id: int, generation: int, cutoff_recipe_id: int) -> bool:
+        """
+        Make a generation the visible feed in one atomic pointer flip, then retire the
+        older generations and the private AI recipes up to cutoff_recipe_id in the background
+        """
+        # Pointers only move forward, so a slow older run can never hide a newer feed
+        result = db.execute(
+            text(
+                "UPDATE user_preferences SET feed_generation = :generation "
+                "WHERE user_id = :user_id AND feed_generation < :generation"
+            ),
+            {"user_id": user_id, "generation": generation}
+        )
+        db.commit()
+        if not result.rowcount:
+            return False
+
+        self.swaps += 1
+        logger.info(f"Feed of user {user_id} switched to generation {generation}")
+        task = asyncio.get_running_loop().create_task(
+            self.collect_old_generations(user_id, generation, cutoff_recipe_id)
+        )
+        self._collectors.add(task)
+        task.add_done_callback(self._collectors.discard)
+        return True
+
+    async def collect_old_generations(self, user_id: int, generation: int, cutoff_recipe_id: int):
+        """
+        Retire everything the given generation superseded, a chunk at a time
+        """
+        statements = (
+            (
+                "retired_assignments",
+                text(
+                    "UPDATE user_recipe_assignments SET active = FALSE WHERE id IN ("
+                    "SELECT id FROM user_recipe_assignments "
+                    "WHERE user_id = :user_id AND generation < :generation AND active = TRUE LIMIT :chunk)"
+                )
+            ),
+            (
+                "deleted_private",
+                text(
+                    "DELETE FROM recipes WHERE id IN ("
+                    "SELECT id FROM recipes WHERE generated_for_user_id = :user_id AND is_ai_generated = TRUE "
+                    "AND preference_signature IS NULL AND id <= :cutoff LIMIT :chunk)"
+                )
+            )
+        )
+        params = {"user_id": user_id, "generation": generation, "cutoff": cutoff_recipe_id, "chunk": FEED_GC_CHUNK_SIZE}
+        db = SessionLocal()
+        try:
+            for counter, statement in statements:
+                while True:
+                    removed = db.execute(statement, params).rowcount
+                    db.commit()
+                    setattr(self, counter, getattr(self, counter) + max(removed, 0))
+                    if removed < FEED_GC_CHUNK_SIZE:
+                        break
+                    # Let requests in between chunks
+                    await asyncio.sleep(0)
+        except SQLAlchemyError as e:
+            logger.error(f"Error collecting old feed generations for user {user_id}: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+
+    async def wait_for_collections(self, timeout: Optional[float] = None):
+        """
+        Wait for running collections to finish, e.g. before a worker exits
+        """
+        if self._collectors:
+            await asyncio.wait(set(self._collectors), timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        assigned = self.reused + self.created
+        return {
+            "reused": self.reused,
+            "created": self.created,
+            "reuse_rate": (self.reused / assigned) if assigned else 0.0,
+            "dry_lookups": self.dry,
+            "feed_swaps": self.swaps,
+            "retired_assignments": self.retired_assignments,
+            "deleted_private_recipes": self.deleted_private,
+            "collections_running": len(self._collectors)
+        }
+
+recipe_pool = RecipePool()
+
+register_stats_provider("recipe_pool", recipe_pool.stats)
@@ -0,0 +1,57 @@
+"""
+Conversion of generated recipe data into Recipe rows.
+
+Every path that stores an LLM-generated recipe (onboarding batches, the
+/generate endpoints, feed prefetches) builds its row here, so the stored
+fields are normalized the same way whichever path produced the recipe.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+from models.recipe import Recipe
+
+def _as_list(value: Any, separators: str = "\n,") -> List[Any]:
+    """
+    A list from a list, a JSON array string, or a separated string
+    """
+    if not value:
+        return []
+    if not isinstance(value, str):
+        return list(value)
+    try:
+        parsed = json.loads(value)
+        if isinstance(parsed, list):
+            return parsed
+    except json.JSONDecodeError:
+        pass
+    for separator in separators[1:]:
+        value = value.replace(separator, separators[0])
+    return [item.strip() for item in value.split(separators[0]) if item.strip()]
+
+def build_recipe_row(recipe_data: Dict[str, Any], user_id: Optional[int]) -> Recipe:
+    """
+    Convert generated recipe data into a Recipe row for the given user (None for shared rows)
+    """
+    cuisine = recipe_data.get("cuisine", "")
+    if isinstance(cuisine, list):
+        cuisine = ", ".join(cuisine)
+
+    prep_time = recipe_data.get("prep_time", 0) or 0
+    cook_time = recipe_data.get("cook_time", 0) or 0
+
+    return Recipe(
+        title=recipe_data.get("title", ""),
+        description=recipe_data.get("description", ""),
+        ingredients=json.dumps(_as_list(recipe_data.get("ingredients"))),
+        # Instructions are split into steps by line only; steps often contain commas
+        instructions=json.dumps(_as_list(recipe_data.get("instructions"), separators="\n")),
+        cuisine=cuisine,
+        prep_time=prep_time,
+        cooking_time=cook_time,
+        total_time=recipe_data.get("total_time") or prep_time + cook_time,
+        difficulty=recipe_data.get("difficulty", "medium"),
+        dietary_restrictions=json.dumps(_as_list(recipe_data.get("dietary_restrictions"))),
+        tags=json.dumps(_as_list(recipe_data.get("tags"))),
+        is_ai_generated=True,
+        generated_for_user_id=user_id
+    )
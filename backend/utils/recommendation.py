@@ -2,13 +2,139 @@ import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import json
-from typing import List, Dict, Any
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
 import logging
 
+from utils.metrics import register_stats_provider
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Maximum number of users whose compiled preference profile is kept in memory
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "10000"))
+
+class CompiledProfile:
+    """
+    A user's preference query vector and recipe filter mask, compiled against
+    one fitted corpus of the recommender.
+    """
+    __slots__ = ("profile_version", "corpus_fingerprint", "query_vector", "filter_mask")
+
+    def __init__(self, profile_version: int, corpus_fingerprint: str, query_vector, filter_mask: np.ndarray):
+        self.profile_version = profile_version
+        self.corpus_fingerprint = corpus_fingerprint
+        self.query_vector = query_vector
+        self.filter_mask = filter_mask
+
+class PreferenceProfileCache:
+    """
+    Per-user LRU cache of compiled preference profiles.
+
+    Entries are only served when both the stored preference version and the
+    fingerprint of the recommender's fitted corpus match the caller's, so a
+    worker that missed an invalidation still recompiles as soon as it reads the
+    newer preference row, and recommenders fitted on different recipes never
+    share an entry.
+    """
+    def __init__(self, max_entries: int = PROFILE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, CompiledProfile]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, profile_version: int, corpus_fingerprint: str) -> Optional[CompiledProfile]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if (
+                entry is None
+                or entry.profile_version != profile_version
+                or entry.corpus_fingerprint != corpus_fingerprint
+            ):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry
+
+    def put(self, user_id: int, entry: CompiledProfile):
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0
+        }
+
+# Shared cache used by every recommender instance in this process
+profile_cache = PreferenceProfileCache()
+register_stats_provider("preference_profile_cache", profile_cache.stats)
+
+def invalidate_user_profile(user_id: int):
+    """
+    Drop the compiled preference profile for a user after a preference write
+    """
+    profile_cache.invalidate(user_id)
+
+def preference_profile(preference) -> Dict[str, Any]:
+    """
+    The preference dictionary the recommender works from, built from a UserPreference row
+    """
+    profile = {
+        "favorite_cuisines": preference.favorite_cuisines_list,
+        "dietary_restrictions": preference.dietary_restrictions_list,
+        "cooking_skill_level": preference.cooking_skill_level,
+        "cooking_time_max": preference.cooking_time_max
+    }
+    for flag in ("vegetarian", "vegan", "gluten_free", "dairy_free", "nut_free",
+                 "breakfast", "lunch", "dinner", "snacks", "desserts"):
+        profile[flag] = bool(getattr(preference, flag))
+    for flavor in ("spicy", "sweet", "savory", "bitter", "sour"):
+        profile[f"{flavor}_level"] = getattr(preference, f"{flavor}_level") or 3
+    return profile
+
+def recipe_document(recipe) -> Dict[str, Any]:
+    """
+    The recipe dictionary the recommender is fitted on, built from a Recipe row
+    """
+    restrictions = [str(restriction).lower() for restriction in recipe.dietary_restrictions_list]
+    return {
+        "id": recipe.id,
+        "title": recipe.title or "",
+        "description": recipe.description or "",
+        "cuisine_type": recipe.cuisine or "",
+        "ingredients": [str(ingredient) for ingredient in recipe.ingredients_list],
+        "instructions": " ".join(str(step) for step in recipe.instructions_list),
+        "prep_time": recipe.prep_time or 0,
+        "cook_time": recipe.cooking_time or 0,
+        "difficulty": recipe.difficulty,
+        "vegetarian": "vegetarian" in restrictions or "vegan" in restrictions,
+        "vegan": "vegan" in restrictions,
+        "gluten_free": "gluten-free" in restrictions,
+        "dairy_free": "dairy-free" in restrictions or "vegan" in restrictions,
+        "nut_free": "nut-free" in restrictions
+    }
+
 class RecipeRecommender:
     def __init__(self):
         self.vectorizer = TfidfVectorizer(
@@ -18,6 +144,9 @@ class RecipeRecommender:
         )
         self.recipe_matrix = None
         self.recipes = []
+        # Hash of the fitted recipes, every field included; cached profiles compiled
+        # against another vocabulary, recipe list or recipe filter fields are never reused
+        self.corpus_fingerprint = None
     
     def fit(self, recipes: List[Dict[str, Any]]):
         """
@@ -42,6 +171,11 @@ class RecipeRecommender:
         
         # Compute TF-IDF matrix
         self.recipe_matrix = self.vectorizer.fit_transform(documents)
+        # The filter mask reads fields the documents leave out (times, dietary flags,
+        # difficulty), so the fingerprint covers the whole recipe dictionaries
+        self.corpus_fingerprint = hashlib.sha1(
+            json.dumps(recipes, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
         
         logger.info(f"Recommendation engine fitted with {len(recipes)} recipes")
         return self
@@ -56,47 +190,83 @@ class RecipeRecommender:
         # Transform the query into TF-IDF space
         query_vector = self.vectorizer.transform([query])
         
+        # Build the filter mask if filters were provided
+        filter_mask = self._build_filter_mask(filters) if filters else None
+        
+        return self._rank(query_vector, top_n, filter_mask)
+    
+    def _rank(self, query_vector, top_n: int, filter_mask: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Return the top-N recipes for an already vectorized query
+        """
         # Calculate cosine similarity against all recipes
         similarities = cosine_similarity(query_vector, self.recipe_matrix).flatten()
         
-        # Get the indices of top-N similar recipes
-        similar_indices = similarities.argsort()[::-1]
+        # Recipes excluded by the filters can never be selected
+        if filter_mask is not None:
+            similarities = np.where(filter_mask, similarities, -np.inf)
         
-        # Apply filters if provided
-        if filters:
-            filtered_indices = []
-            for idx in similar_indices:
-                recipe = self.recipes[idx]
-                if self._match_filters(recipe, filters):
-                    filtered_indices.append(idx)
-                
-                if len(filtered_indices) >= top_n:
-                    break
-            
-            similar_indices = filtered_indices[:top_n]
-        else:
-            similar_indices = similar_indices[:top_n]
+        # Get the indices of top-N similar recipes
+        similar_indices = similarities.argsort()[::-1][:top_n]
+        if filter_mask is not None:
+            similar_indices = [idx for idx in similar_indices if filter_mask[idx]]
         
         # Return top similar recipes
         similar_recipes = [self.recipes[idx] for idx in similar_indices]
         
         return similar_recipes
     
-    def get_user_recommendations(self, user_preferences: Dict[str, Any], top_n: int = 5) -> List[Dict[str, Any]]:
+    def _build_filter_mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """
+        Evaluate the filters once against every fitted recipe
+        """
+        return np.fromiter(
+            (self._match_filters(recipe, filters) for recipe in self.recipes),
+            dtype=bool,
+            count=len(self.recipes)
+        )
+    
+    def compile_profile(self, user_preferences: Dict[str, Any], profile_version: int = 0) -> CompiledProfile:
         """
-        Generate recommendations based on user preferences
+        Vectorize a user's preference query and evaluate their filters against the fitted recipes
+        """
+        query = self._construct_preference_query(user_preferences)
+        filters = self._create_preference_filters(user_preferences)
+        
+        query_vector = self.vectorizer.transform([query])
+        if filters:
+            filter_mask = self._build_filter_mask(filters)
+        else:
+            filter_mask = np.ones(len(self.recipes), dtype=bool)
+        
+        return CompiledProfile(profile_version, self.corpus_fingerprint, query_vector, filter_mask)
+    
+    def get_user_recommendations(
+        self,
+        user_preferences: Dict[str, Any],
+        top_n: int = 5,
+        user_id: Optional[int] = None,
+        profile_version: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Generate recommendations based on user preferences.
+        
+        When user_id and profile_version are given, the compiled query vector and
+        filter mask are served from the per-user profile cache.
         """
         if self.recipe_matrix is None or self.recipe_matrix.shape[0] == 0:
             raise ValueError("Recommender not fitted. Call fit() first")
         
-        # Construct a query from user preferences
-        query = self._construct_preference_query(user_preferences)
-        
-        # Create filters based on dietary restrictions
-        filters = self._create_preference_filters(user_preferences)
+        if user_id is None or profile_version is None:
+            profile = self.compile_profile(user_preferences)
+        else:
+            profile = profile_cache.get(user_id, profile_version, self.corpus_fingerprint)
+            if profile is None:
+                profile = self.compile_profile(user_preferences, profile_version)
+                profile_cache.put(user_id, profile)
         
         # Get recommendations
-        recommendations = self.get_similar_recipes(query, top_n, filters)
+        recommendations = self._rank(profile.query_vector, top_n, profile.filter_mask)
         
         return recommendations
     
@@ -216,7 +386,8 @@ class RecipeRecommender:
                     'advanced': 'hard'
                 }
                 difficulty = skill_level_map.get(value, value)
-                if recipe.get(key) != difficulty:
+                # Stored difficulties are not consistently capitalized
+                if str(recipe.get(key, "")).lower() != str(difficulty).lower():
                     return False
             elif recipe.get(key) != value:
                 return False
@@ -0,0 +1,121 @@
+"""
+Single-flight coalescing of identical concurrent async calls.
+
+The first caller for a key starts the call; callers arriving while it is in
+flight await the same task instead of issuing their own. Each waiter awaits the
+task through asyncio.shield, so a cancelled waiter (e.g. a disconnected client)
+does not cancel the call for the others. The call is only cancelled once every
+waiter has gone away.
+
+The shared call must not belong to whichever caller happened to start it:
+- It runs without a deadline and without an LLM user. Each waiter applies its
+  own deadline while waiting and gets DeadlineExceeded when it runs out,
+  leaving the call to the waiters that still have time.
+- The LLM priority class is part of the flight key, so a call is only shared
+  between callers of the same class. An interactive request never waits on a
+  prefetch call that a queued interactive call could preempt.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from utils.deadline import DeadlineExceeded, deadline_scope, remaining
+from utils.llm_scheduler import llm_priority, llm_user
+from utils.metrics import register_stats_provider
+
+logger = logging.getLogger(__name__)
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one in-flight task
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, _Flight] = {}
+
+        # Metrics
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.abandoned = 0
+        self.deadline_exceeded = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn() for the key, or join the call already in flight for it.
+        The result is shared by every caller of the flight.
+        """
+        self.calls += 1
+        key = (llm_priority.get(), key)
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(self._run_shared(fn)))
+            self._flights[key] = flight
+            self.executions += 1
+
+            def forget(task: asyncio.Task, key=key, flight=flight):
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                # Mark the outcome as retrieved even if every waiter left
+                if not task.cancelled():
+                    task.exception()
+
+            flight.task.add_done_callback(forget)
+        else:
+            self.coalesced += 1
+            logger.debug(f"Coalesced {self.name} call onto in-flight request")
+
+        flight.waiters += 1
+        try:
+            left = remaining()
+            if left is not None and left <= 0:
+                raise DeadlineExceeded("Request deadline reached")
+            return await asyncio.wait_for(asyncio.shield(flight.task), timeout=left)
+        except asyncio.TimeoutError:
+            if flight.task.done():
+                # The call's own timeout, shared by every waiter
+                raise
+            self.deadline_exceeded += 1
+            raise DeadlineExceeded(f"Request deadline reached waiting on {self.name} call")
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Last one waiting gave up: nobody needs the result any more
+                self.abandoned += 1
+                flight.task.cancel()
+                # New callers must start a fresh call rather than join the cancelled one
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    @staticmethod
+    async def _run_shared(fn: Callable[[], Awaitable[Any]]) -> Any:
+        # The task runs in a copy of the starter's context; these changes stay in the copy
+        llm_user.set(None)
+        with deadline_scope(None):
+            return await fn()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "coalesced_rate": (self.coalesced / self.calls) if self.calls else 0.0,
+            "in_flight": len(self._flights),
+            "abandoned": self.abandoned,
+            "deadline_exceeded": self.deadline_exceeded
+        }
+
+recipe_flight = SingleFlight("generate_recipe")
+explore_flight = SingleFlight("cuisine_recommendations")
+
+register_stats_provider("single_flight", lambda: {
+    recipe_flight.name: recipe_flight.stats(),
+    explore_flight.name: explore_flight.stats()
+})
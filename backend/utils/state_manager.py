@@ -2,6 +2,12 @@
 State manager module to track global application state.
 This module provides shared state objects that can be imported by different parts of the application.
 """
+import os
+import asyncio
 
 # Dictionary to track active recipe generation tasks by user_id
-active_generation_tasks = {} 
\ No newline at end of file
+active_generation_tasks = {}
+
+# Upper bound on LLM recipe generations running at once across all users
+GENERATION_CONCURRENCY_GLOBAL = int(os.getenv("GENERATION_CONCURRENCY_GLOBAL", "16"))
+global_generation_semaphore = asyncio.Semaphore(GENERATION_CONCURRENCY_GLOBAL)
@@ -0,0 +1,83 @@
+"""
+Standalone recipe generation worker.
+
+Runs queued generation jobs from the generation_jobs table outside the API
+process, so LLM-heavy generation does not compete with request handling and
+workers can be scaled separately from the API:
+
+    GENERATION_WORKER_IN_PROCESS=false uvicorn app.main:app
+    python -m worker --concurrency 8
+
+Any number of workers can run against the same database; jobs are claimed
+with leases, so each one runs once. On SIGTERM or SIGINT a worker stops
+claiming jobs and gives running ones --drain-seconds to finish. Jobs still
+running after that are left for another worker once their lease expires.
+
+Workers also own the warm recipe inventory: onboarding jobs record each
+bucket's demand as they take recipes, so every worker runs a refill task
+topping buckets up from the demand it has seen. The API process only runs
+refills when it runs jobs itself (GENERATION_WORKER_IN_PROCESS=true).
+"""
+import os
+import signal
+import asyncio
+import logging
+import argparse
+from typing import Optional
+
+from utils.http_client import start_http_client, close_http_client
+from utils.job_queue import JobWorker
+from utils.llm_cache import llm_cache
+from utils.recipe_inventory import recipe_inventory
+from utils.recipe_pool import recipe_pool
+from routes.preferences import run_generation_job
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def run_worker(concurrency: int, drain_seconds: float, worker_id: Optional[str] = None):
+    """
+    Run jobs until the process is asked to stop, then drain
+    """
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    await start_http_client()
+    worker = JobWorker(run_generation_job, concurrency=concurrency, worker_id=worker_id)
+    recipe_inventory.start()
+    worker.start()
+    try:
+        await stop.wait()
+        logger.info(f"Shutdown requested, draining for up to {drain_seconds}s")
+    finally:
+        # A negative drain time waits for running jobs however long they take
+        drain_timeout = None if drain_seconds < 0 else drain_seconds
+        await worker.stop(drain_timeout=drain_timeout)
+        await recipe_inventory.stop()
+        # Let superseded feeds finish being retired before the loop goes away
+        await recipe_pool.wait_for_collections(timeout=drain_timeout)
+        llm_cache.close()
+        await close_http_client()
+
+def main():
+    parser = argparse.ArgumentParser(description="Recipe generation worker")
+    parser.add_argument(
+        "--concurrency", type=int,
+        default=int(os.getenv("GENERATION_WORKER_CONCURRENCY", "4")),
+        help="jobs run at the same time"
+    )
+    parser.add_argument(
+        "--drain-seconds", type=float,
+        default=float(os.getenv("GENERATION_WORKER_DRAIN_SECONDS", "20")),
+        help="time running jobs get to finish on shutdown (negative = no limit)"
+    )
+    parser.add_argument("--worker-id", default=os.getenv("GENERATION_WORKER_ID"), help="name used in job leases")
+    args = parser.parse_args()
+
+    logger.info(f"Starting generation worker with concurrency {args.concurrency}")
+    asyncio.run(run_worker(args.concurrency, args.drain_seconds, args.worker_id))
+
+if __name__ == "__main__":
+    main()